@@ -0,0 +1,95 @@
+"""
+Overlay cost per frame: the original PIL full-frame round-trip vs LabelRenderer,
+with fixed labels and with probabilities that change every frame.
+
+    python benchmarks/bench_overlay.py --faces 1 4 8 --resolution 1920x1080
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from overlay import FONT_CANDIDATES, LabelRenderer, draw_boxes
+
+
+def draw_boxes_reference(frame, boxes, probs=None, names=None):
+    """
+    The original implementation (font reload and BGR->RGB->PIL->BGR every frame).
+    """
+    from PIL import Image, ImageDraw
+    img_pil = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    draw = ImageDraw.Draw(img_pil)
+    font = _reload_font()
+    for i, box in enumerate(boxes):
+        x1, y1, x2, y2 = [int(b) for b in box]
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        label = ""
+        if names is not None and i < len(names):
+            label += f"{names[i]} "
+        if probs is not None:
+            label += f"({probs[i]:.2f})"
+        if label:
+            draw.text((x1, y1 - 25), label, font=font, fill=(0, 255, 0))
+    return cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGB2BGR)
+
+
+def _reload_font():
+    from PIL import ImageFont
+    for path in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(path, 20)
+        except IOError:
+            continue
+    return ImageFont.load_default()
+
+
+def time_per_frame(fn, frame, boxes, probs, names, repeat):
+    """
+    :param probs: one array for every frame, or a list with one array per frame.
+    """
+    per_frame = probs if isinstance(probs, list) else [probs] * repeat
+    fn(frame.copy(), boxes, per_frame[0], names)  # warm up
+    frames = [frame.copy() for _ in range(repeat)]
+    start = time.perf_counter()
+    for f, p in zip(frames, per_frame):
+        fn(f, boxes, p, names)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--resolution", default="1920x1080")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    w, h = [int(v) for v in args.resolution.split("x")]
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    renderer = LabelRenderer()
+
+    def fast(f, boxes, probs, names):
+        return draw_boxes(f, boxes, probs, names, renderer=renderer)
+
+    print(f"{'faces':>5}  {'before ms/frame':>15}  {'after ms/frame':>14}  {'speedup':>7}  {'changing labels ms/frame':>24}")
+    for n in args.faces:
+        x = rng.integers(0, w - 200, n)
+        y = rng.integers(40, h - 200, n)
+        boxes = np.stack([x, y, x + 150, y + 150], axis=1).astype(np.float32)
+        probs = np.full(n, 0.99, dtype=np.float32)
+        names = [f"홍길동{i}" for i in range(n)]
+        before = time_per_frame(draw_boxes_reference, frame, boxes, probs, names, args.repeat)
+        after = time_per_frame(fast, frame, boxes, probs, names, args.repeat)
+        # A fresh probability per face and frame, so no two frames share a label
+        changing = [rng.uniform(0.5, 1.0, n).astype(np.float32) for _ in range(args.repeat)]
+        after_changing = time_per_frame(fast, frame, boxes, changing, names, args.repeat)
+        print(f"{n:>5}  {before:>15.2f}  {after:>14.2f}  {before / after:>6.1f}x  {after_changing:>24.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Micro-benchmark: per-face preprocessing cost of the original loop vs FaceBatchBuffer.
+
+    python benchmarks/bench_preprocess.py --faces 1 4 16 --resolution 1280x720
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from preprocess import FaceBatchBuffer, crop_faces_reference
+
+
+def random_boxes(rng, n, w, h):
+    sizes = rng.integers(80, min(w, h) // 2, n)
+    x1 = rng.integers(0, w - sizes)
+    y1 = rng.integers(0, h - sizes)
+    return np.stack([x1, y1, x1 + sizes, y1 + sizes], axis=1).astype(np.float32)
+
+
+def time_per_face(fn, frame, boxes, repeat):
+    fn(frame, boxes)  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(frame, boxes)
+    return (time.perf_counter() - start) / (repeat * len(boxes)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--resolution", default="1280x720")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    w, h = [int(v) for v in args.resolution.split("x")]
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    buffer = FaceBatchBuffer()
+
+    print(f"{'faces':>5}  {'before us/face':>15}  {'after us/face':>14}  {'speedup':>7}")
+    for n in args.faces:
+        boxes = random_boxes(rng, n, w, h)
+        before = time_per_face(crop_faces_reference, frame, boxes, args.repeat)
+        after = time_per_face(buffer.crop_faces, frame, boxes, args.repeat)
+        print(f"{n:>5}  {before:>15.1f}  {after:>14.1f}  {before / after:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
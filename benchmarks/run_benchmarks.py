@@ -0,0 +1,258 @@
+"""
+Benchmark suite: no camera, no network, synthetic frames and galleries.
+
+    python benchmarks/run_benchmarks.py --out results.json
+    python benchmarks/run_benchmarks.py --only gallery camera --gallery-sizes 1000 100000
+    python benchmarks/run_benchmarks.py --out new.json --compare results.json
+
+Every case is reported as {"name", "params", "mean_ms", "p50_ms", "p95_ms", "runs"}.
+With --compare, cases whose p50 got slower than --tolerance are listed and the
+exit status is 1, so the script can gate CI.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+RESOLUTIONS = {"480p": (640, 480), "720p": (1280, 720), "1080p": (1920, 1080)}
+
+
+def measure(fn, repeat, warmup=2):
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    durations = np.array(durations)
+    return {
+        "mean_ms": float(durations.mean()),
+        "p50_ms": float(np.percentile(durations, 50)),
+        "p95_ms": float(np.percentile(durations, 95)),
+        "runs": repeat,
+    }
+
+
+def synthetic_frame(rng, w, h):
+    """
+    Smooth random background, so detectors and JPEG see something image-like rather than pure noise.
+    """
+    small = rng.integers(0, 256, (h // 16 + 1, w // 16 + 1, 3), dtype=np.uint8)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+
+
+def random_boxes(rng, n, w, h):
+    sizes = rng.integers(80, min(w, h) // 2, n)
+    x1 = rng.integers(0, w - sizes)
+    y1 = rng.integers(0, h - sizes)
+    return np.stack([x1, y1, x1 + sizes, y1 + sizes], axis=1).astype(np.float32)
+
+
+def bench_detector(args, rng):
+    from detector import FaceDetector
+
+    import torch
+    # Random ResNet weights cost the same as the pretrained ones and need no download
+    detector = FaceDetector(device=torch.device('cpu'), pretrained=None, backend=args.backend)
+    results = []
+    for res in args.resolutions:
+        w, h = RESOLUTIONS[res]
+        frame = synthetic_frame(rng, w, h)
+        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        results.append({"name": "detect", "params": {"resolution": res},
+                        **measure(lambda: detector.detect(frame, frame_rgb=frame_rgb), args.repeat)})
+        for n in args.faces:
+            boxes = random_boxes(rng, n, w, h)
+            results.append({"name": "get_embeddings", "params": {"resolution": res, "faces": n},
+                            **measure(lambda: detector.get_embeddings(frame, boxes, frame_rgb=frame_rgb),
+                                      args.repeat)})
+    return results
+
+
+def bench_overlay(args, rng):
+    from overlay import LabelRenderer, draw_boxes
+
+    renderer = LabelRenderer()
+    results = []
+    for res in args.resolutions:
+        w, h = RESOLUTIONS[res]
+        frame = synthetic_frame(rng, w, h)
+        for n in args.faces:
+            boxes = random_boxes(rng, n, w, h)
+            probs = rng.uniform(0.9, 1.0, n)
+            names = [f"홍길동{i}" for i in range(n)]
+            results.append({"name": "draw_boxes", "params": {"resolution": res, "faces": n},
+                            **measure(lambda: draw_boxes(frame, boxes, probs, names, renderer=renderer),
+                                      args.repeat)})
+            # Probabilities drawn afresh on every call, as in a live stream
+            results.append({"name": "draw_boxes_changing", "params": {"resolution": res, "faces": n},
+                            **measure(lambda: draw_boxes(frame, boxes, rng.uniform(0.5, 1.0, n), names,
+                                                         renderer=renderer), args.repeat)})
+    return results
+
+
+def bench_gallery(args, rng):
+    from ann_index import synthetic_gallery
+    from embedding_store import EmbeddingStore
+    from face_manager import FaceManager
+
+    results = []
+    for size in args.gallery_sizes:
+        vectors, labels = synthetic_gallery(size, seed=size)
+        names = [f"person{label}" for label in labels]
+        queries = vectors[rng.choice(len(vectors), 64)] + 0.03 * rng.standard_normal((64, vectors.shape[1])).astype(np.float32)
+
+        workdir = tempfile.mkdtemp(prefix="face_bench_")
+        try:
+            store_dir = os.path.join(workdir, "face_store")
+            EmbeddingStore(store_dir).append_many(list(zip(names, vectors)))
+            pickle_path = os.path.join(workdir, "faces.pkl")    # never created
+
+            results.append({"name": "load", "params": {"gallery": size},
+                            **measure(lambda: FaceManager(storage_file=pickle_path, store_dir=store_dir),
+                                      max(3, args.repeat // 10), warmup=1)})
+
+            manager = FaceManager(storage_file=pickle_path, store_dir=store_dir)
+            it = iter(range(10 ** 9))
+            results.append({"name": "match_face", "params": {"gallery": size},
+                            **measure(lambda: manager.match_face(queries[next(it) % len(queries)]), args.repeat)})
+            for n in args.faces:
+                results.append({"name": "match_faces", "params": {"gallery": size, "faces": n},
+                                **measure(lambda: manager.match_faces(queries[:n]), args.repeat)})
+            results.append({"name": "add_face", "params": {"gallery": size},
+                            **measure(lambda: manager.add_face(f"new{next(it)}", queries[0]), args.repeat)})
+            del manager
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def bench_camera(args, rng):
+    from camera import Camera
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="face_bench_")
+    try:
+        for res in args.resolutions:
+            w, h = RESOLUTIONS[res]
+            # A short synthetic clip stands in for the webcam
+            path = os.path.join(workdir, f"{res}.avi")
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (w, h))
+            for _ in range(60):
+                writer.write(synthetic_frame(rng, w, h))
+            writer.release()
+
+            camera = Camera(source=path)
+            camera.start()
+            try:
+                lease = camera.wait_for_frame(0, timeout=5.0)
+                if lease is None:
+                    raise RuntimeError(f"no frames decoded from {path}")
+                lease.release()
+                results.append({"name": "camera_get_frame", "params": {"resolution": res},
+                                **measure(camera.get_frame, args.repeat)})
+
+                def latest():
+                    lease = camera.get_latest()
+                    if lease is not None:
+                        lease.release()
+                results.append({"name": "camera_get_latest", "params": {"resolution": res},
+                                **measure(latest, args.repeat)})
+            finally:
+                camera.stop()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+SUITES = {
+    "detector": bench_detector,
+    "overlay": bench_overlay,
+    "gallery": bench_gallery,
+    "camera": bench_camera,
+}
+
+
+def case_key(case):
+    return case["name"], json.dumps(case["params"], sort_keys=True)
+
+
+def compare(current, baseline, tolerance):
+    """
+    :return: list of (name, params, old p50, new p50) that regressed by more than `tolerance`.
+    """
+    old = {case_key(c): c for c in baseline["results"]}
+    regressions = []
+    for case in current["results"]:
+        before = old.get(case_key(case))
+        if before and case["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+            regressions.append((case["name"], case["params"], before["p50_ms"], case["p50_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=sorted(SUITES), default=sorted(SUITES))
+    parser.add_argument("--resolutions", nargs="+", choices=sorted(RESOLUTIONS), default=["480p", "720p", "1080p"])
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--gallery-sizes", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--backend", default="eager", choices=["eager", "torchscript", "int8", "onnx"],
+                        help="embedding runtime for the detector suite")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed p50 slowdown (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    cv2.setRNGSeed(args.seed)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "cpus": os.cpu_count(), "opencv": cv2.__version__, "numpy": np.__version__},
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "results": [],
+        "skipped": {},
+    }
+    for name in args.only:
+        rng = np.random.default_rng(args.seed)
+        print(f"== {name}")
+        try:
+            cases = SUITES[name](args, rng)
+        except ImportError as e:
+            # e.g. torch/facenet_pytorch not installed: record it and keep going
+            print(f"   skipped: {e}")
+            report["skipped"][name] = str(e)
+            continue
+        for case in cases:
+            params = " ".join(f"{k}={v}" for k, v in case["params"].items())
+            print(f"   {case['name']:<18} {params:<28} p50 {case['p50_ms']:9.3f} ms   p95 {case['p95_ms']:9.3f} ms")
+        report["results"].extend(cases)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Saved {len(report['results'])} results to {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for name, params, before, after in regressions:
+            print(f"REGRESSION {name} {params}: p50 {before:.3f} -> {after:.3f} ms")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
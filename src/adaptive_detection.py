@@ -0,0 +1,158 @@
+import cv2
+import numpy as np
+
+from utils import resize_frame
+
+
+class AdaptiveDetection:
+    """
+    Policy for cheaper MTCNN passes. It keeps per-stream state (scan counter,
+    tuned settings), so every caller sharing a FaceDetector owns one and passes
+    it to detect(); the detector's own policy is only the default.
+
+    - Full-frame scans run on a copy downsized to `detect_width`; boxes are
+      scaled back to full resolution, so embeddings still use full-res crops.
+    - When the caller knows where faces are (tracks), only the regions around
+      them are scanned, with a full-frame scan every `full_scan_every` calls
+      so new faces are still found.
+    - MTCNN's min_face_size and pyramid factor are nudged after every full
+      scan to keep its latency near `target_ms`: bigger minimum faces first,
+      then a coarser pyramid, and back again when there is headroom.
+    """
+
+    def __init__(self, detect_width=640, target_ms=40.0, full_scan_every=5, roi_margin=0.6,
+                 min_face_range=(20, 80), factor_range=(0.6, 0.709), alpha=0.2):
+        """
+        :param detect_width: width full-frame scans are downsized to.
+        :param roi_margin: padding around each tracked box, as a fraction of its size.
+        :param min_face_range: (smallest, largest) min_face_size in detection-image pixels.
+        :param factor_range: (coarsest, finest) pyramid scale factor.
+        """
+        self.detect_width = detect_width
+        self.target_ms = target_ms
+        self.full_scan_every = full_scan_every
+        self.roi_margin = roi_margin
+        self.min_face_range = min_face_range
+        self.factor_range = factor_range
+        self.alpha = alpha
+
+        self.min_face_size = float(min_face_range[0])
+        self.factor = factor_range[1]
+        self.avg_ms = None
+        self._since_full_scan = 0
+
+        self.full_scans = 0
+        self.roi_scans = 0
+
+    def apply(self, mtcnn):
+        mtcnn.min_face_size = int(round(self.min_face_size))
+        mtcnn.factor = self.factor
+
+    def downscale(self, image):
+        """
+        :return: (image at most detect_width wide, factor mapping its coordinates back).
+        """
+        w = image.shape[1]
+        if w <= self.detect_width:
+            return image, 1.0
+        small = resize_frame(image, width=self.detect_width)
+        return small, w / small.shape[1]
+
+    def regions(self, frame_shape, boxes):
+        """
+        :param boxes: (N, 4) boxes of faces being tracked, or None.
+        :return: list of ((x1, y1, x2, y2), scale) regions to scan,
+                 or None when a full-frame scan is due.
+        """
+        self._since_full_scan += 1
+        if boxes is None or len(boxes) == 0 or self._since_full_scan >= self.full_scan_every:
+            self._since_full_scan = 0
+            self.full_scans += 1
+            return None
+        self.roi_scans += 1
+
+        h, w = frame_shape[:2]
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        sizes = np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+        pad = sizes * self.roi_margin
+        rects = np.stack([boxes[:, 0] - pad, boxes[:, 1] - pad, boxes[:, 2] + pad, boxes[:, 3] + pad], axis=1)
+        rects = np.clip(rects, 0, [w, h, w, h])
+
+        # Merge overlapping regions so no face is scanned twice
+        merged = []
+        for rect, size in sorted(zip(rects.tolist(), sizes.tolist())):
+            for i, (other, other_size) in enumerate(merged):
+                if rect[0] < other[2] and other[0] < rect[2] and rect[1] < other[3] and other[1] < rect[3]:
+                    merged[i] = ([min(rect[0], other[0]), min(rect[1], other[1]),
+                                  max(rect[2], other[2]), max(rect[3], other[3])], min(size, other_size))
+                    break
+            else:
+                merged.append((rect, size))
+
+        regions = []
+        for (x1, y1, x2, y2), size in merged:
+            # A face of `size` pixels only needs to stay comfortably above min_face_size
+            scale = min(1.0, 3.0 * self.min_face_size / max(size, 1.0))
+            regions.append(((int(x1), int(y1), int(np.ceil(x2)), int(np.ceil(y2))), scale))
+        return regions
+
+    def scan_region(self, mtcnn, frame_rgb, region):
+        """
+        Runs MTCNN on one region and maps its boxes back to frame coordinates.
+        """
+        (x1, y1, x2, y2), scale = region
+        crop = frame_rgb[y1:y2, x1:x2]
+        if crop.shape[0] < 12 or crop.shape[1] < 12:
+            return None, None
+        if scale < 1.0:
+            crop = cv2.resize(crop, (max(12, int(crop.shape[1] * scale)), max(12, int(crop.shape[0] * scale))),
+                              interpolation=cv2.INTER_AREA)
+        boxes, probs = mtcnn.detect(crop)
+        if boxes is None:
+            return None, None
+        sx = (x2 - x1) / crop.shape[1]
+        sy = (y2 - y1) / crop.shape[0]
+        boxes = boxes * np.array([sx, sy, sx, sy]) + np.array([x1, y1, x1, y1])
+        return boxes, probs
+
+    def record(self, seconds, full_scan=True):
+        """
+        Feeds back detection latency. Only full scans tune the settings,
+        since they are the worst case the target has to cover.
+        """
+        if not full_scan:
+            return
+        ms = seconds * 1000
+        self.avg_ms = ms if self.avg_ms is None else (1 - self.alpha) * self.avg_ms + self.alpha * ms
+
+        smallest, largest = self.min_face_range
+        coarsest, finest = self.factor_range
+        if self.avg_ms > 1.1 * self.target_ms:
+            if self.min_face_size < largest:
+                self.min_face_size = min(largest, self.min_face_size * 1.25)
+            else:
+                self.factor = max(coarsest, self.factor - 0.03)
+        elif self.avg_ms < 0.6 * self.target_ms:
+            if self.factor < finest:
+                self.factor = min(finest, self.factor + 0.03)
+            else:
+                self.min_face_size = max(smallest, self.min_face_size / 1.25)
+
+    # What detection updates; a worker process detecting on a copy hands these back
+    _STATE = ("min_face_size", "factor", "avg_ms", "_since_full_scan", "full_scans", "roi_scans")
+
+    def state(self):
+        return {name: getattr(self, name) for name in self._STATE}
+
+    def load_state(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def stats(self):
+        return {
+            "avg_full_scan_ms": self.avg_ms,
+            "min_face_size": int(round(self.min_face_size)),
+            "factor": round(self.factor, 3),
+            "full_scans": self.full_scans,
+            "roi_scans": self.roi_scans,
+        }
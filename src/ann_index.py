@@ -0,0 +1,268 @@
+import time
+import numpy as np
+
+
+def _sq_dists(queries, vectors, sq_norms):
+    # ||q - v||^2 = ||q||^2 - 2 q.v + ||v||^2
+    q_sq = np.einsum('ij,ij->i', queries, queries)
+    return q_sq[:, None] - 2.0 * (queries @ vectors.T) + sq_norms[None, :]
+
+
+def exact_search(queries, vectors, labels):
+    """
+    Brute-force nearest neighbour, used as ground truth for the ANN index.
+    :return: (labels, distances) arrays, one entry per query.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    sq_norms = np.einsum('ij,ij->i', vectors, vectors)
+    d2 = _sq_dists(queries, vectors, sq_norms)
+    best = np.argmin(d2, axis=1)
+    dists = np.sqrt(np.maximum(d2[np.arange(len(queries)), best], 0.0))
+    return labels[best], dists
+
+
+class IVFIndex:
+    """
+    Inverted-file index with k-means coarse quantization.
+
+    Vectors are bucketed by nearest centroid; a query only scans the
+    `nprobe` closest buckets, so lookup cost is roughly
+    nlist + nprobe * N / nlist instead of N.
+
+    Buckets are immutable (vectors, sq_norms, labels) tuples replaced wholesale
+    on insert/delete, and a retrain swaps the whole state in one assignment.
+    An owner that mutates the index concurrently takes snapshot() under its
+    lock and searches that outside it.
+
+    Centroids trained on a small gallery fit a growing one poorly, so the index
+    retrains itself (with nlist = sqrt(N) unless fixed) whenever inserts have
+    grown it to `retrain_growth` times the size it was last trained on.
+    """
+
+    def __init__(self, nlist=None, nprobe=8, min_train_size=1024, kmeans_iters=10, seed=0, retrain_growth=2.0):
+        """
+        :param retrain_growth: retrain once the index holds this many times its
+                               last training size (None never retrains).
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.kmeans_iters = kmeans_iters
+        self.retrain_growth = retrain_growth
+        self.rng = np.random.default_rng(seed)
+
+        self._state = None       # (centroids, centroid_sq_norms, buckets)
+        self._label_lists = {}   # label -> set of bucket ids holding that label
+        self._pending = []       # (vector, label) inserted before training
+        self.size = 0
+        self.trained_size = 0
+        self.retrains = 0
+
+    @property
+    def is_trained(self):
+        return self._state is not None
+
+    def _kmeans(self, vectors, k):
+        sample = vectors
+        if len(vectors) > k * 64:
+            sample = vectors[self.rng.choice(len(vectors), k * 64, replace=False)]
+        centroids = sample[self.rng.choice(len(sample), k, replace=False)].copy()
+        for _ in range(self.kmeans_iters):
+            sq = np.einsum('ij,ij->i', centroids, centroids)
+            assign = np.argmin(_sq_dists(sample, centroids, sq), axis=1)
+            for c in range(k):
+                members = sample[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+                else:
+                    # Re-seed empty clusters so every bucket stays useful
+                    centroids[c] = sample[self.rng.integers(len(sample))]
+        return centroids
+
+    def build(self, vectors, labels):
+        """
+        (Re)trains the coarse quantizer on all vectors and fills the buckets.
+        Small galleries are kept pending (exact scan) until min_train_size is reached.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        labels = np.asarray(labels, dtype=np.int32)
+        self.size = len(vectors)
+
+        if len(vectors) < self.min_train_size:
+            self._state = None
+            self._label_lists = {}
+            self._pending = list(zip(vectors, labels))
+            return
+
+        k = min(self.nlist or max(1, int(np.sqrt(len(vectors)))), len(vectors))
+        centroids = self._kmeans(vectors, k)
+        centroid_sq = np.einsum('ij,ij->i', centroids, centroids)
+        assign = np.argmin(_sq_dists(vectors, centroids, centroid_sq), axis=1)
+
+        buckets = []
+        label_lists = {}
+        for c in range(k):
+            idx = np.flatnonzero(assign == c)
+            vecs = vectors[idx]
+            buckets.append((vecs, np.einsum('ij,ij->i', vecs, vecs), labels[idx]))
+            for label in np.unique(labels[idx]):
+                label_lists.setdefault(int(label), set()).add(c)
+
+        self._label_lists = label_lists
+        self._state = (centroids, centroid_sq, buckets)
+        self._pending = []
+        self.trained_size = len(vectors)
+
+    def _retrain(self):
+        buckets = self._state[2]
+        vectors = np.concatenate([vecs for vecs, _, _ in buckets])
+        labels = np.concatenate([labels for _, _, labels in buckets])
+        self.build(vectors, labels)
+        self.retrains += 1
+
+    def add(self, vector, label):
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        label = int(label)
+        self.size += 1
+
+        if self._state is None:
+            self._pending.append((vector, label))
+            if len(self._pending) >= self.min_train_size:
+                vecs, labels = zip(*self._pending)
+                self.build(np.stack(vecs), np.asarray(labels))
+            return
+
+        centroids, centroid_sq, buckets = self._state
+        c = int(np.argmin(_sq_dists(vector[None, :], centroids, centroid_sq)[0]))
+        vecs, sq, labels = buckets[c]
+        buckets[c] = (np.vstack([vecs, vector[None, :]]),
+                      np.append(sq, vector @ vector).astype(np.float32),
+                      np.append(labels, label).astype(np.int32))
+        self._label_lists.setdefault(label, set()).add(c)
+
+        if self.retrain_growth and self.size >= self.retrain_growth * self.trained_size:
+            self._retrain()
+
+    def remove(self, label):
+        label = int(label)
+        if self._state is None:
+            before = len(self._pending)
+            self._pending = [(v, l) for v, l in self._pending if l != label]
+            self.size -= before - len(self._pending)
+            return
+
+        buckets = self._state[2]
+        for c in self._label_lists.pop(label, ()):
+            vecs, sq, labels = buckets[c]
+            keep = labels != label
+            self.size -= int((~keep).sum())
+            buckets[c] = (vecs[keep], sq[keep], labels[keep])
+
+    def snapshot(self):
+        """
+        :return: a frozen view for search(), unaffected by later add/remove/retrain.
+        """
+        state = self._state
+        if state is None:
+            return None, list(self._pending)
+        centroids, centroid_sq, buckets = state
+        return (centroids, centroid_sq, list(buckets)), None
+
+    def search(self, queries, nprobe=None, snapshot=None):
+        """
+        :param queries: (N, D) float32 array.
+        :param snapshot: from snapshot(); default: the current state.
+        :return: (labels, distances); label -1 when the index is empty.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        n = len(queries)
+        out_labels = np.full(n, -1, dtype=np.int32)
+        out_dists = np.full(n, np.inf, dtype=np.float32)
+
+        state, pending = snapshot if snapshot is not None else self.snapshot()
+        if state is None:
+            if pending:
+                vecs, labels = zip(*pending)
+                return exact_search(queries, np.stack(vecs), np.asarray(labels, dtype=np.int32))
+            return out_labels, out_dists
+
+        centroids, centroid_sq, buckets = state
+        nprobe = min(nprobe or self.nprobe, len(buckets))
+        coarse = _sq_dists(queries, centroids, centroid_sq)
+        probes = np.argpartition(coarse, nprobe - 1, axis=1)[:, :nprobe]
+
+        # Group queries by bucket so each probed bucket costs one matrix product
+        q_sq = np.einsum('ij,ij->i', queries, queries)
+        best_d2 = np.full(n, np.inf, dtype=np.float32)
+        for c in np.unique(probes):
+            vecs, sq, labels = buckets[c]
+            if len(labels) == 0:
+                continue
+            rows = np.flatnonzero((probes == c).any(axis=1))
+            d2 = q_sq[rows, None] - 2.0 * (queries[rows] @ vecs.T) + sq[None, :]
+            idx = np.argmin(d2, axis=1)
+            cand = d2[np.arange(len(rows)), idx]
+            better = cand < best_d2[rows]
+            best_d2[rows[better]] = cand[better]
+            out_labels[rows[better]] = labels[idx[better]]
+
+        found = out_labels >= 0
+        out_dists[found] = np.sqrt(np.maximum(best_d2[found], 0.0))
+        return out_labels, out_dists
+
+
+def recall_report(vectors, labels, queries, nprobes=(1, 2, 4, 8, 16, 32), nlist=None):
+    """
+    Compares IVF recall@1 and per-query latency against the exact scan.
+    :return: list of dicts, the exact baseline first, then one per nprobe.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    labels = np.asarray(labels, dtype=np.int32)
+    queries = np.asarray(queries, dtype=np.float32)
+
+    start = time.perf_counter()
+    truth, _ = exact_search(queries, vectors, labels)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    rows = [{"mode": "exact", "nprobe": None, "recall": 1.0, "ms_per_query": exact_ms}]
+
+    index = IVFIndex(nlist=nlist, min_train_size=1)
+    index.build(vectors, labels)
+    for nprobe in nprobes:
+        start = time.perf_counter()
+        found, _ = index.search(queries, nprobe=nprobe)
+        ms = (time.perf_counter() - start) * 1000 / len(queries)
+        rows.append({"mode": "ivf", "nprobe": nprobe,
+                     "recall": float(np.mean(found == truth)), "ms_per_query": ms})
+    return rows
+
+
+def synthetic_gallery(n, dim=512, per_id=5, noise=0.03, seed=0):
+    """
+    Clustered synthetic embeddings: several samples around each identity centre.
+    :return: (vectors, labels)
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((max(1, n // per_id), dim)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    labels = np.repeat(np.arange(len(centres), dtype=np.int32), per_id)
+    vectors = centres[labels] + noise * rng.standard_normal((len(labels), dim)).astype(np.float32)
+    return vectors, labels
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="IVF recall vs latency on a synthetic gallery")
+    parser.add_argument("--gallery", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=512)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    vectors, labels = synthetic_gallery(args.gallery, args.dim)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.03 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    for row in recall_report(vectors, labels, queries):
+        nprobe = "-" if row["nprobe"] is None else row["nprobe"]
+        print(f"{row['mode']:>5}  nprobe={nprobe:>3}  recall@1={row['recall']:.3f}  {row['ms_per_query']:.3f} ms/query")
@@ -0,0 +1,141 @@
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from tracker import iou
+
+
+class AsyncRecognizer:
+    """
+    Runs recognition on a worker thread at its own pace, so the caller's
+    video loop never waits for the models.
+
+    submit() only stores the frame in a one-slot buffer (a newer frame
+    replaces one the worker has not picked up yet), and latest() returns the
+    most recent finished result. With `extrapolate`, boxes are moved along
+    their velocity between the last two results for the time that has passed
+    since the analysed frame was captured, capped at `max_extrapolation` seconds.
+    """
+
+    def __init__(self, infer, extrapolate=True, max_extrapolation=0.3, min_iou=0.3):
+        """
+        :param infer: callable(frame) -> (boxes, probs, embeddings, matches).
+        """
+        self.infer = infer
+        self.extrapolate = extrapolate
+        self.max_extrapolation = max_extrapolation
+        self.min_iou = min_iou
+
+        self.cond = threading.Condition()
+        self._frame = None
+        self._frame_time = 0.0
+        self._result = (None, None, None, [])
+        self._result_time = None
+        self._velocity = None
+
+        self.submitted = 0
+        self.processed = 0
+        self.replaced = 0
+        self.running = False
+        self.closed = False
+        self.thread = None
+
+    def start(self):
+        with self.cond:
+            if self.running or self.closed:
+                return
+            self.running = True
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """
+        Stops the worker for good: a caller still holding this recognizer can't restart it with submit().
+        """
+        with self.cond:
+            self.running = False
+            self.closed = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def submit(self, frame):
+        """
+        Never blocks. The frame must not be modified afterwards (pass a copy if it will be drawn on).
+        """
+        self.start()
+        with self.cond:
+            if self._frame is not None:
+                self.replaced += 1
+            self._frame = frame
+            self._frame_time = time.perf_counter()
+            self.submitted += 1
+            self.cond.notify()
+
+    def _take(self):
+        with self.cond:
+            while self.running and self._frame is None:
+                self.cond.wait(0.5)
+            frame, captured = self._frame, self._frame_time
+            self._frame = None
+            return frame, captured
+
+    def _run(self):
+        while self.running:
+            frame, captured = self._take()
+            if frame is None:
+                continue
+            try:
+                with metrics.timer("async.infer"):
+                    result = self.infer(frame)
+            except Exception as e:
+                print(f"Error during async recognition: {e}")
+                continue
+            self._publish(result, captured)
+
+    def _publish(self, result, captured):
+        boxes = result[0]
+        velocity = None
+        with self.cond:
+            previous, previous_time = self._result[0], self._result_time
+        if boxes is not None and len(boxes) and previous is not None and len(previous) and captured > previous_time:
+            boxes = np.asarray(boxes, dtype=np.float32)
+            previous = np.asarray(previous, dtype=np.float32)
+            velocity = np.zeros_like(boxes)
+            for i, box in enumerate(boxes):
+                overlaps = iou(box, previous)
+                j = int(np.argmax(overlaps))
+                if overlaps[j] >= self.min_iou:
+                    velocity[i] = (box - previous[j]) / (captured - previous_time)
+        with self.cond:
+            self._result = result
+            self._result_time = captured
+            self._velocity = velocity
+            self.processed += 1
+
+    def latest(self):
+        """
+        :return: (boxes, probs, embeddings, matches) of the newest finished frame,
+                 boxes extrapolated to now when enabled.
+        """
+        with self.cond:
+            result, result_time, velocity = self._result, self._result_time, self._velocity
+        if result_time is not None:
+            metrics.observe("async.result_age", time.perf_counter() - result_time)
+        if not self.extrapolate or velocity is None:
+            return result
+        dt = min(time.perf_counter() - result_time, self.max_extrapolation)
+        boxes = np.asarray(result[0], dtype=np.float32) + velocity * dt
+        return (boxes,) + tuple(result[1:])
+
+    def stats(self):
+        with self.cond:
+            return {
+                "submitted": self.submitted,
+                "processed": self.processed,
+                "replaced": self.replaced,
+                "result_age_s": time.perf_counter() - self._result_time if self._result_time else None,
+            }
@@ -0,0 +1,208 @@
+"""
+Headless batch processing of a video file or an image directory.
+
+    python src/batch_process.py footage.mp4 --out detections.jsonl --batch-size 8 --stride 2
+    python src/batch_process.py snapshots/ --out detections.csv
+"""
+import argparse
+import csv
+import json
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from pipeline import StageStats
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def iter_frames(path, stride=1):
+    """
+    Yields (frame_index, timestamp_sec or None, source_name, frame) from a video or image directory.
+    """
+    if os.path.isdir(path):
+        names = sorted(n for n in os.listdir(path) if n.lower().endswith(IMAGE_EXTENSIONS))
+        for index, name in enumerate(names[::stride]):
+            frame = cv2.imread(os.path.join(path, name))
+            if frame is not None:
+                yield index * stride, None, name, frame
+        return
+
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0
+    index = 0
+    try:
+        while True:
+            if index % stride:
+                # grab() skips decoding frames we are not going to look at
+                if not cap.grab():
+                    break
+            else:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield index, (index / fps if fps else None), os.path.basename(path), frame
+            index += 1
+    finally:
+        cap.release()
+
+
+class ResultWriter:
+    FIELDS = ["frame", "timestamp", "source", "face", "x1", "y1", "x2", "y2", "prob", "name", "dist"]
+
+    def __init__(self, path):
+        self.path = path
+        self.format = "csv" if path.lower().endswith(".csv") else "jsonl"
+        self.file = open(path, "w", encoding="utf-8", newline="")
+        if self.format == "csv":
+            self.csv = csv.DictWriter(self.file, fieldnames=self.FIELDS)
+            self.csv.writeheader()
+
+    def write(self, frame_index, timestamp, source, boxes, probs, matches):
+        faces = []
+        if boxes is not None:
+            for i, box in enumerate(boxes):
+                name, dist = matches[i] if i < len(matches) else ("Unknown", float('inf'))
+                faces.append({
+                    "x1": float(box[0]), "y1": float(box[1]), "x2": float(box[2]), "y2": float(box[3]),
+                    "prob": float(probs[i]), "name": name,
+                    "dist": None if not np.isfinite(dist) else round(float(dist), 4),
+                })
+
+        if self.format == "jsonl":
+            record = {"frame": frame_index, "timestamp": timestamp, "source": source, "faces": faces}
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            for i, face in enumerate(faces):
+                self.csv.writerow({"frame": frame_index, "timestamp": timestamp, "source": source,
+                                   "face": i, **face})
+
+    def close(self):
+        self.file.close()
+
+
+def decode_ahead(path, stride, batch_size, stats, prefetch=4):
+    """
+    Decodes on a background thread, up to `prefetch` batches ahead of inference.
+    Yields lists of (frame_index, timestamp, source, frame).
+    """
+    batches = queue.Queue(maxsize=prefetch)
+
+    def run():
+        batch = []
+        start = time.perf_counter()
+        for item in iter_frames(path, stride):
+            stats.record(time.perf_counter() - start)
+            batch.append(item)
+            if len(batch) == batch_size:
+                batches.put(batch)
+                batch = []
+            start = time.perf_counter()
+        if batch:
+            batches.put(batch)
+        batches.put(None)
+
+    threading.Thread(target=run, daemon=True).start()
+    while True:
+        batch = batches.get()
+        if batch is None:
+            return
+        yield batch
+
+
+def process(path, out_path, detector, face_manager, batch_size=8, stride=1,
+            confidence_threshold=0.9, recognition_threshold=0.8, progress_every=100):
+    stats = {name: StageStats(window=100000) for name in ("decode", "infer", "match", "write")}
+    writer = ResultWriter(out_path)
+    frames = 0
+    faces = 0
+    start = time.perf_counter()
+
+    try:
+        for batch in decode_ahead(path, stride, batch_size, stats["decode"]):
+            t0 = time.perf_counter()
+            results = detector.detect_and_embed_batch([item[3] for item in batch],
+                                                      [confidence_threshold] * len(batch))
+            stats["infer"].record((time.perf_counter() - t0) / len(batch))
+
+            # One gallery scan for every face in the batch
+            t0 = time.perf_counter()
+            all_embeddings = [r[2] for r in results if r[2] is not None]
+            all_matches = []
+            if all_embeddings:
+                all_matches = face_manager.match_faces(np.concatenate(all_embeddings),
+                                                       threshold=recognition_threshold)
+            stats["match"].record((time.perf_counter() - t0) / len(batch))
+
+            t0 = time.perf_counter()
+            offset = 0
+            for (frame_index, timestamp, source, _), (boxes, probs, embeddings) in zip(batch, results):
+                count = 0 if embeddings is None else len(embeddings)
+                matches = all_matches[offset:offset + count]
+                offset += count
+                writer.write(frame_index, timestamp, source, boxes, probs, matches)
+                faces += 0 if boxes is None else len(boxes)
+            stats["write"].record((time.perf_counter() - t0) / len(batch))
+
+            frames += len(batch)
+            if progress_every and frames // progress_every != (frames - len(batch)) // progress_every:
+                elapsed = time.perf_counter() - start
+                print(f"{frames} frames, {faces} faces, {frames / elapsed:.1f} frames/sec")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "frames": frames,
+        "faces": faces,
+        "seconds": elapsed,
+        "frames_per_sec": frames / elapsed if elapsed else 0.0,
+        "faces_per_sec": faces / elapsed if elapsed else 0.0,
+        "stages": {name: s.snapshot() for name, s in stats.items()},
+    }
+
+
+def print_report(report):
+    print(f"\nProcessed {report['frames']} frames / {report['faces']} faces in {report['seconds']:.1f}s")
+    print(f"  {report['frames_per_sec']:.2f} frames/sec, {report['faces_per_sec']:.2f} faces/sec")
+    print(f"  {'stage':<8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}   (per frame)")
+    for name, s in report["stages"].items():
+        print(f"  {name:<8} {s['mean_ms']:>9.2f} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless face detection/recognition over a video or image directory")
+    parser.add_argument("input", help="video file or directory of images")
+    parser.add_argument("--out", default="detections.jsonl", help="output .jsonl or .csv")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--stride", type=int, default=1, help="process every Nth frame")
+    parser.add_argument("--confidence", type=float, default=0.9, help="detection confidence threshold")
+    parser.add_argument("--threshold", type=float, default=0.8, help="recognition distance threshold")
+    parser.add_argument("--faces", default="data/faces.pkl", help="face database (legacy pickle path)")
+    parser.add_argument("--backend", default="eager", choices=["eager", "torchscript", "int8", "onnx"],
+                        help="embedding runtime")
+    parser.add_argument("--gallery-precision", default="float32", choices=["float32", "float16", "int8"],
+                        help="in-memory gallery format (compact ones re-rank with exact float32)")
+    parser.add_argument("--report", help="also write the throughput report as JSON here")
+    args = parser.parse_args()
+
+    from detector import FaceDetector
+    from face_manager import FaceManager
+
+    detector = FaceDetector(backend=args.backend)
+    face_manager = FaceManager(storage_file=args.faces, precision=args.gallery_precision)
+    report = process(args.input, args.out, detector, face_manager, batch_size=args.batch_size,
+                     stride=args.stride, confidence_threshold=args.confidence,
+                     recognition_threshold=args.threshold)
+    print_report(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
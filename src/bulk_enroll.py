@@ -0,0 +1,248 @@
+"""
+Bulk enrollment of many identities from photos.
+
+Input is either a directory with one sub-directory of photos per person
+(roster/홍길동/1.jpg, roster/홍길동/2.jpg, ...), or a CSV/JSONL manifest with
+"name" and "path" columns (paths relative to the manifest).
+
+    python src/bulk_enroll.py roster/ --batch-size 16 --workers 8
+    python src/bulk_enroll.py roster.csv --rejects rejected.csv --dry-run
+
+Photos are decoded in parallel and letterboxed onto a few standard canvas
+shapes, so detection batches photos of any size together; embedding runs in
+batches too, and only photos with exactly one face are kept. Everything accepted is written
+to the store with a single append at the end.
+
+It is safe to run while a dashboard uses the same store: the append holds
+the store's inter-process writer lock, and running dashboards pick up the
+new identities within a few seconds (FaceManager.refresh).
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from batch_process import IMAGE_EXTENSIONS
+from pipeline import StageStats
+from utils import resize_frame
+
+
+def iter_roster(path):
+    """
+    Yields (name, image_path) from a roster directory or a CSV/JSONL manifest.
+    """
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            person_dir = os.path.join(path, name)
+            if not os.path.isdir(person_dir):
+                continue
+            for filename in sorted(os.listdir(person_dir)):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield name, os.path.join(person_dir, filename)
+        return
+
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            yield row["name"], os.path.join(base, row["path"])
+
+
+def load_image(path, max_side=1280):
+    """
+    :return: BGR image with its longer side at most `max_side`, or None if unreadable.
+    """
+    image = cv2.imread(path)
+    if image is None or not max_side:
+        return image
+    h, w = image.shape[:2]
+    if max(h, w) > max_side:
+        image = resize_frame(image, width=max_side) if w >= h else resize_frame(image, height=max_side)
+    return image
+
+
+def standard_shapes(max_side):
+    """
+    Canvas (h, w) shapes photos are letterboxed onto: square, landscape and
+    portrait, at full and half size, smallest first.
+    """
+    shapes = []
+    for side in (max_side // 2, max_side):
+        short = side * 3 // 4
+        shapes.extend([(side, side), (short, side), (side, short)])
+    return shapes
+
+
+def letterbox(image, shapes):
+    """
+    Pads `image` (downscaling it first if needed) into the smallest canvas of the
+    closest aspect ratio that holds it, anchored top-left so detected boxes need no offset.
+    """
+    h, w = image.shape[:2]
+    # Canvases whose aspect ratio is closest to the photo's, then the smallest that fits it
+    closest = min(abs(np.log(cw / ch * h / w)) for ch, cw in shapes)
+    orientation = [(ch, cw) for ch, cw in shapes if abs(np.log(cw / ch * h / w)) <= closest + 1e-6]
+    canvas_h, canvas_w = next(((ch, cw) for ch, cw in orientation if ch >= h and cw >= w), orientation[-1])
+    scale = min(canvas_h / h, canvas_w / w, 1.0)
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    canvas = np.zeros((canvas_h, canvas_w, 3), dtype=np.uint8)
+    canvas[:image.shape[0], :image.shape[1]] = image
+    return canvas
+
+
+def decode_parallel(entries, workers, batch_size, stats, max_side=1280, prefetch=4, shapes=None):
+    """
+    Decodes on `workers` threads (cv2 releases the GIL), keeping at most
+    `prefetch` batches in flight. Yields lists of (name, path, image or None).
+    :param shapes: letterbox every image onto one of these (h, w) canvases.
+    """
+    def decode(entry):
+        start = time.perf_counter()
+        image = load_image(entry[1], max_side)
+        if image is not None and shapes:
+            image = letterbox(image, shapes)
+        stats.record(time.perf_counter() - start)
+        return entry[0], entry[1], image
+
+    entries = iter(entries)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        while True:
+            while len(pending) < prefetch:
+                chunk = [entry for _, entry in zip(range(batch_size), entries)]
+                if not chunk:
+                    break
+                pending.append([pool.submit(decode, entry) for entry in chunk])
+            if not pending:
+                return
+            yield [future.result() for future in pending.popleft()]
+
+
+def enroll(path, detector, face_manager, batch_size=16, workers=4, confidence_threshold=0.9,
+           max_side=1280, letterbox_photos=True, dry_run=False, progress_every=100):
+    """
+    :param letterbox_photos: pad photos onto standard_shapes(max_side), since the
+                             detector only batches equally sized images together.
+    :return: report dict with counts, rejections, images/sec, detection batches and stage timings.
+    """
+    stats = {name: StageStats(window=100000) for name in ("decode", "infer", "commit")}
+    accepted = []
+    rejected = []
+    images = 0
+    detect_batches = 0
+    shapes = standard_shapes(max_side) if letterbox_photos and max_side else None
+    start = time.perf_counter()
+
+    for batch in decode_parallel(iter_roster(path), workers, batch_size, stats["decode"], max_side, shapes=shapes):
+        readable = [(name, image_path, image) for name, image_path, image in batch if image is not None]
+        rejected.extend((name, image_path, "unreadable") for name, image_path, image in batch if image is None)
+
+        if readable:
+            # The detector runs MTCNN once per distinct image shape
+            detect_batches += len({image.shape for _, _, image in readable})
+            t0 = time.perf_counter()
+            results = detector.detect_and_embed_batch([image for _, _, image in readable],
+                                                      [confidence_threshold] * len(readable))
+            stats["infer"].record((time.perf_counter() - t0) / len(readable))
+            for (name, image_path, _), (boxes, _, embeddings) in zip(readable, results):
+                # Counted on embedded faces, which line up with the returned boxes
+                faces = 0 if embeddings is None else len(embeddings)
+                if faces == 0:
+                    rejected.append((name, image_path, "no_face"))
+                elif faces > 1:
+                    rejected.append((name, image_path, "multiple_faces"))
+                else:
+                    accepted.append((name, embeddings[0]))
+
+        images += len(batch)
+        if progress_every and images // progress_every != (images - len(batch)) // progress_every:
+            elapsed = time.perf_counter() - start
+            print(f"{images} images, {len(accepted)} accepted, {len(rejected)} rejected, "
+                  f"{images / elapsed:.1f} images/sec")
+
+    # One store append for the whole roster
+    t0 = time.perf_counter()
+    if not dry_run:
+        face_manager.add_faces(accepted)
+    stats["commit"].record(time.perf_counter() - t0)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "images": images,
+        "accepted": len(accepted),
+        "identities": len({name for name, _ in accepted}),
+        "rejected": len(rejected),
+        "rejected_by_reason": dict(Counter(reason for _, _, reason in rejected)),
+        "rejections": rejected,
+        "committed": not dry_run,
+        "seconds": elapsed,
+        "images_per_sec": images / elapsed if elapsed else 0.0,
+        "detect_batches": detect_batches,
+        "stages": {name: s.snapshot() for name, s in stats.items()},
+    }
+
+
+def print_report(report):
+    action = "Enrolled" if report["committed"] else "Would enroll (dry run)"
+    print(f"\n{action} {report['accepted']} photos of {report['identities']} identities "
+          f"from {report['images']} images in {report['seconds']:.1f}s ({report['images_per_sec']:.2f} images/sec)")
+    readable = report["images"] - report["rejected_by_reason"].get("unreadable", 0)
+    if report["detect_batches"]:
+        print(f"  {report['detect_batches']} detection batches "
+              f"({readable / report['detect_batches']:.1f} images per batch)")
+    for reason, count in sorted(report["rejected_by_reason"].items()):
+        print(f"  rejected {reason}: {count}")
+    print(f"  {'stage':<8} {'mean ms':>9} {'p95 ms':>9}")
+    for name, s in report["stages"].items():
+        print(f"  {name:<8} {s['mean_ms']:>9.2f} {s['p95_ms']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enroll many identities from a photo roster")
+    parser.add_argument("input", help="directory with one folder per person, or a CSV/JSONL manifest (name, path)")
+    parser.add_argument("--faces", default="data/faces.pkl", help="face database (legacy pickle path)")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4, help="decode threads")
+    parser.add_argument("--confidence", type=float, default=0.9, help="detection confidence threshold")
+    parser.add_argument("--max-side", type=int, default=1280, help="downscale larger photos before detection")
+    parser.add_argument("--no-letterbox", action="store_true",
+                        help="keep each photo's own size (detection then batches only equally sized photos)")
+    parser.add_argument("--backend", default="eager", choices=["eager", "torchscript", "int8", "onnx"],
+                        help="embedding runtime")
+    parser.add_argument("--dry-run", action="store_true", help="report only, do not write to the store")
+    parser.add_argument("--rejects", help="write rejected photos (name, path, reason) as CSV here")
+    parser.add_argument("--report", help="also write the report as JSON here")
+    args = parser.parse_args()
+
+    from detector import FaceDetector
+    from face_manager import FaceManager
+
+    detector = FaceDetector(backend=args.backend)
+    face_manager = FaceManager(storage_file=args.faces)
+    report = enroll(args.input, detector, face_manager, batch_size=args.batch_size, workers=args.workers,
+                    confidence_threshold=args.confidence, max_side=args.max_side,
+                    letterbox_photos=not args.no_letterbox, dry_run=args.dry_run)
+    print_report(report)
+
+    if args.rejects:
+        with open(args.rejects, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["name", "path", "reason"])
+            writer.writerows(report["rejections"])
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({k: v for k, v in report.items() if k != "rejections"}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,78 @@
 import cv2
+import os
 import threading
 import time
 
+import metrics
+
+class FrameLease:
+    """
+    A borrowed, read-only view of one ring-buffer slot.
+    The slot is not overwritten until release() (or the end of a with block).
+    """
+    def __init__(self, camera, slot, image, seq, timestamp):
+        self.camera = camera
+        self.slot = slot
+        self.image = image
+        self.seq = seq
+        self.timestamp = timestamp
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.camera._release(self.slot)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
 class Camera:
-    def __init__(self, source=0):
+    """
+    Captures frames on a background thread into a preallocated ring buffer.
+
+    mode="latest": the writer always overwrites the oldest free slot, so
+                   consumers see the newest frame (frames may be dropped).
+    mode="no-drop": the writer waits while every slot holds a frame that
+                    read() has not consumed yet, so nothing is skipped.
+
+    Video files are paced to their own FPS and loop from the first frame, so
+    a file can stand in for a live camera.
+    """
+    def __init__(self, source=0, buffer_size=4, mode="latest", realtime=None, loop=True):
+        """
+        :param realtime: pace decoding to the source's FPS (default: only for video files).
+        :param loop: restart a video file from frame 0 at its end.
+        """
+        if mode not in ("latest", "no-drop"):
+            raise ValueError(f"Unknown camera mode: {mode}")
         self.source = source
+        self.mode = mode
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+        self.realtime = self.is_file if realtime is None else realtime
+        self.loop = loop
         self.cap = None
         self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
         self.running = False
+        self.thread = None
         self.frame = None
         self.last_access = time.time()
 
+        # Ring buffer state, all guarded by self.lock
+        self.buffer_size = max(2, buffer_size)
+        self._slots = [None] * self.buffer_size
+        self._slot_seq = [0] * self.buffer_size      # 0 = empty or being written
+        self._slot_time = [0.0] * self.buffer_size
+        self._leases = [0] * self.buffer_size
+        self._latest_slot = None
+        self._write_pos = -1
+        self._read_seq = 0
+        self.seq = 0          # sequence number of the newest frame, 0 before the first
+        self.dropped = 0
+
     def start(self):
         if self.running:
             return
@@ -18,37 +80,191 @@ class Camera:
         self.thread = threading.Thread(target=self._update, daemon=True)
         self.thread.start()
 
+    def _acquire_slot(self):
+        """
+        Picks a slot the writer may overwrite: not the newest frame, not leased,
+        and (in no-drop mode) already consumed. Returns None in latest mode if
+        every slot is busy.
+        """
+        with self.cond:
+            while self.running:
+                for offset in range(1, self.buffer_size + 1):
+                    i = (self._write_pos + offset) % self.buffer_size
+                    if i == self._latest_slot or self._leases[i]:
+                        continue
+                    if self.mode == "no-drop" and self._slot_seq[i] > self._read_seq:
+                        continue
+                    self._write_pos = i
+                    self._slot_seq[i] = 0
+                    return i
+                if self.mode == "latest":
+                    return None
+                self.cond.wait(0.1)
+        return None
+
+    def _frame_interval(self):
+        fps = self.cap.get(cv2.CAP_PROP_FPS) if self.realtime else 0
+        return 1.0 / fps if fps and fps > 0 else 0.0
+
+    def _pace(self, interval, next_due):
+        """
+        Sleeps until the next frame of a paced source is due.
+        :return: due time of the frame after it.
+        """
+        now = time.perf_counter()
+        if next_due > now:
+            time.sleep(next_due - now)
+        # Anchored to the schedule so sleeps don't drift, but never more than one frame behind
+        return max(next_due, now - interval) + interval
+
     def _update(self):
         self.cap = cv2.VideoCapture(self.source)
-        
+        scratch = None
+        interval = self._frame_interval() if self.cap.isOpened() else 0.0
+        next_due = time.perf_counter()
+        rewound = False
+
         while self.running:
             if self.cap is None or not self.cap.isOpened():
                 self.cap = cv2.VideoCapture(self.source)
+                interval = self._frame_interval() if self.cap.isOpened() else 0.0
                 time.sleep(1)
                 continue
 
-            ret, frame = self.cap.read()
+            if interval:
+                next_due = self._pace(interval, next_due)
+
+            slot = self._acquire_slot()
+            if slot is None and not self.running:
+                break
+
+            # Decode straight into the slot's preallocated array
+            target = scratch if slot is None else self._slots[slot]
+            with metrics.timer("camera.read"):
+                if target is not None:
+                    ret, frame = self.cap.read(image=target)
+                else:
+                    ret, frame = self.cap.read()
+
             if ret:
-                with self.lock:
+                rewound = False
+                if slot is None:
+                    # Every slot is in use; keep the capture flowing and drop this frame
+                    scratch = frame
+                    with self.lock:
+                        self.dropped += 1
+                    metrics.inc("camera.dropped")
+                    continue
+                with self.cond:
+                    # A new array is returned on the first read or if the resolution changes
+                    self._slots[slot] = frame
+                    self.seq += 1
+                    self._slot_seq[slot] = self.seq
+                    self._slot_time[slot] = time.time()
+                    self._latest_slot = slot
                     self.frame = frame
-                    self.last_access = time.time()
+                    self.last_access = self._slot_time[slot]
+                    self.cond.notify_all()
+                metrics.inc("camera.frames")
+            elif self.is_file and self.loop and not rewound:
+                # End of the file: start over instead of reopening it
+                rewound = self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                if not rewound:
+                    self.cap.release()
+                    self.cap = None
             else:
                 # Connection lost, try to reconnect
+                rewound = False
                 self.cap.release()
                 self.cap = None
                 time.sleep(0.5)
-        
+
         # Cleanup
         if self.cap:
             self.cap.release()
 
+    def _lease(self, slot):
+        # Caller holds self.lock
+        self._leases[slot] += 1
+        image = self._slots[slot].view()
+        image.flags.writeable = False
+        return FrameLease(self, slot, image, self._slot_seq[slot], self._slot_time[slot])
+
+    def _release(self, slot):
+        with self.cond:
+            self._leases[slot] -= 1
+            self.cond.notify_all()
+
     def get_frame(self):
+        """
+        Returns a private copy of the newest frame (kept for existing callers).
+        """
         with self.lock:
-            if self.frame is not None:
-                return self.frame.copy()
+            if self._latest_slot is not None:
+                return self._slots[self._latest_slot].copy()
             return None
 
+    def get_latest(self):
+        """
+        Borrows the newest frame without copying.
+        :return: FrameLease (release it when done) or None before the first frame.
+        """
+        with self.lock:
+            if self._latest_slot is None:
+                return None
+            return self._lease(self._latest_slot)
+
+    def wait_for_frame(self, after_seq=0, timeout=None):
+        """
+        Blocks on the camera's condition variable until a frame newer than
+        `after_seq` exists, so each consumer wakes exactly once per new frame.
+        :param after_seq: sequence number of the last frame this consumer handled.
+        :return: FrameLease of the newest frame, or None on timeout / stop.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cond:
+            while self.seq <= after_seq or self._latest_slot is None:
+                if not self.running:
+                    return None
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+            return self._lease(self._latest_slot)
+
+    def read(self, timeout=None):
+        """
+        Borrows the next unread frame: the very next one in no-drop mode,
+        the newest one in latest mode.
+        :return: FrameLease or None on timeout.
+        """
+        if self.mode == "latest":
+            lease = self.wait_for_frame(self._read_seq, timeout)
+            if lease is not None:
+                self._read_seq = lease.seq
+            return lease
+
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cond:
+            while self.running or self.seq > self._read_seq:
+                wanted = self._read_seq + 1
+                for i, seq in enumerate(self._slot_seq):
+                    if seq == wanted:
+                        self._read_seq = wanted
+                        self.cond.notify_all()
+                        return self._lease(i)
+
+                if not self.running:
+                    return None
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+        return None
+
     def stop(self):
         self.running = False
-        if self.thread.is_alive():
+        with self.cond:
+            self.cond.notify_all()
+        if self.thread is not None and self.thread.is_alive():
             self.thread.join()
@@ -1,10 +1,29 @@
-from facenet_pytorch import MTCNN, InceptionResnetV1
+from facenet_pytorch import MTCNN
 import torch
 import numpy as np
 import cv2
+import threading
+import time
+
+import metrics
+from adaptive_detection import AdaptiveDetection
+from inference_backends import create_backend, load_inception_resnet
+from overlay import LabelRenderer, draw_boxes
+from preprocess import FaceBatchBuffer, croppable
 
 class FaceDetector:
-    def __init__(self, device=None):
+    def __init__(self, device=None, pretrained='vggface2', adaptive=None, backend="eager", model_cache_dir=None):
+        """
+        :param pretrained: InceptionResnetV1 weights, or None for random weights
+                           (no download; only useful for timing).
+        :param adaptive: default AdaptiveDetection policy (or True for the defaults) to detect on
+                         downsized frames / tracked regions under a latency target. Callers
+                         sharing the detector pass their own policy to detect() instead.
+        :param backend: embedding runtime: "eager", "torchscript", "int8" or "onnx"
+                        (see inference_backends; exported once into model_cache_dir).
+        :param model_cache_dir: local weights/exports (default: data/model_cache or FACE_MODEL_CACHE),
+                                so no network is needed after the first run.
+        """
         if device is None:
             self.device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
         else:
@@ -12,121 +31,245 @@ class FaceDetector:
         
         print(f"Loading Face Detector on {self.device}...")
         self.mtcnn = MTCNN(keep_all=True, device=self.device)
-        self.resnet = InceptionResnetV1(pretrained='vggface2', classify=False, device=self.device).eval()
-        print("Face Detector and Recognizer loaded.")
+        self._mtcnn_defaults = (self.mtcnn.min_face_size, self.mtcnn.factor)
+        # MTCNN takes min_face_size/factor from attributes, so each caller's settings are applied under this lock
+        self._mtcnn_lock = threading.Lock()
+        self.adaptive = None
+        self.set_adaptive(adaptive)
+        self.resnet = load_inception_resnet(pretrained, self.device, cache_dir=model_cache_dir)
+        self.backend = backend
+        self.embedder = create_backend(backend, self.resnet, self.device, weights=pretrained,
+                                       cache_dir=model_cache_dir)
+        self.face_buffer = FaceBatchBuffer()
+        self.label_renderer = LabelRenderer()
+        print(f"Face Detector and Recognizer loaded ({backend} backend).")
+
+    def set_adaptive(self, adaptive):
+        """
+        Sets the default policy: adaptive detection on (AdaptiveDetection or True) or off (None).
+        """
+        if adaptive is True:
+            adaptive = AdaptiveDetection()
+        self.adaptive = adaptive
+
+    def _apply_settings(self, adaptive):
+        # Caller holds self._mtcnn_lock
+        if adaptive is not None:
+            adaptive.apply(self.mtcnn)
+        else:
+            self.mtcnn.min_face_size, self.mtcnn.factor = self._mtcnn_defaults
 
-    def detect(self, frame):
+    def detect(self, frame, frame_rgb=None, rois=None, adaptive=None):
         """
         Detects faces in a given frame.
         :param frame: numpy array (B, G, R) from OpenCV
+        :param frame_rgb: RGB version of frame, if the caller already has one.
+        :param rois: boxes of faces already being tracked. With adaptive detection
+                     only the regions around them are scanned, apart from periodic full scans.
+        :param adaptive: the caller's AdaptiveDetection policy (default: the detector's own).
         :return: boxes (list of bounding boxes), probabilities (list of probabilities)
         """
+        if adaptive is None:
+            adaptive = self.adaptive
         try:
             # MTCNN expects RGB
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            boxes, probs = self.mtcnn.detect(frame_rgb)
+            if frame_rgb is None:
+                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            if adaptive is not None:
+                return self._detect_adaptive(frame_rgb, rois, adaptive)
+            with metrics.timer("detector.mtcnn"), self._mtcnn_lock:
+                self._apply_settings(None)
+                boxes, probs = self.mtcnn.detect(frame_rgb)
+            metrics.inc("detector.frames")
             return boxes, probs
         except Exception as e:
             print(f"Error during detection: {e}")
             return None, None
 
+    def _detect_adaptive(self, frame_rgb, rois, adaptive):
+        regions = adaptive.regions(frame_rgb.shape, rois)
+        with self._mtcnn_lock:
+            self._apply_settings(adaptive)
+            # Timed inside the lock, so waiting for other callers doesn't skew the tuning
+            start = time.perf_counter()
+            if regions is None:
+                small, scale = adaptive.downscale(frame_rgb)
+                boxes, probs = self.mtcnn.detect(small)
+                if boxes is not None:
+                    boxes = boxes * scale
+            else:
+                found = [adaptive.scan_region(self.mtcnn, frame_rgb, region) for region in regions]
+                found = [(b, p) for b, p in found if b is not None]
+                boxes = np.concatenate([b for b, _ in found]) if found else None
+                probs = np.concatenate([p for _, p in found]) if found else None
+        elapsed = time.perf_counter() - start
+        adaptive.record(elapsed, full_scan=regions is None)
+        metrics.observe("detector.mtcnn" if regions is None else "detector.mtcnn_roi", elapsed)
+        metrics.inc("detector.frames")
+        return boxes, probs
+
     def draw_boxes(self, frame, boxes, probs=None, names=None):
-        if boxes is None:
-            return frame
-        
-        # Convert to PIL Image for drawing text
-        from PIL import Image, ImageDraw, ImageFont
-        img_pil = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        draw = ImageDraw.Draw(img_pil)
+        # Labels are blended straight into the BGR frame from cached glyph masks
+        with metrics.timer("overlay.draw_boxes"):
+            return draw_boxes(frame, boxes, probs, names, renderer=self.label_renderer)
         
+    def _embed(self, faces):
+        """
+        :param faces: contiguous (N, 3, 160, 160) float32 array, handed to the backend without a copy.
+        """
         try:
-            # Use Malgun Gothic for Korean support on Windows
-            font_path = "malgun.ttf"
-            font = ImageFont.truetype(font_path, 20)
-        except IOError:
-            try:
-                 # Try absolute path for Windows
-                font_path = "C:/Windows/Fonts/malgun.ttf"
-                font = ImageFont.truetype(font_path, 20)
-            except IOError:
-                # Fallback to default if font not found
-                print("Warning: Malgun Gothic font not found. Falling back to default.")
-                font = ImageFont.load_default()
-        
-        for i, box in enumerate(boxes):
-            x1, y1, x2, y2 = [int(b) for b in box]
-            
-            # Draw rectangle using OpenCV (faster/easier for simple shapes) -> moved below to keep logic simple
-            # Actually, doing everything in PIL or mixing? 
-            # Let's mix: Draw rect on CV2 frame, then draw text on PIL, then convert back.
-            # Efficient implementation: Draw all rectangles on 'frame' first.
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            
-            label = ""
-            if names is not None and i < len(names):
-                label += f"{names[i]} "
-            if probs is not None:
-                label += f"({probs[i]:.2f})"
-                
-            if label:
-                # Draw text using PIL
-                # Coordinate adjustment for text background if needed, but keeping it simple
-                draw.text((x1, y1 - 25), label, font=font, fill=(0, 255, 0))
-
-        # Convert back to BGR numpy array
-        frame = cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGB2BGR)
-        
-        return frame
-        
-    def get_embeddings(self, frame, boxes):
+            with metrics.timer("detector.resnet"):
+                embeddings = self.embedder(faces)
+            metrics.inc("detector.faces_embedded", len(faces))
+            return embeddings
+        except Exception as e:
+            print(f"Embedding extraction error: {e}")
+            return None
+
+    def get_embeddings(self, frame, boxes, frame_rgb=None):
+        """
+        :param frame_rgb: RGB version of frame, if the caller already has one from detection.
+        """
         if boxes is None or len(boxes) == 0:
             return None
         
-        faces = []
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        h, w, _ = frame_rgb.shape
-
-        for box in boxes:
-            x1, y1, x2, y2 = [int(b) for b in box]
-            
-            x1 = max(0, x1)
-            y1 = max(0, y1)
-            x2 = min(w, x2)
-            y2 = min(h, y2)
+        if frame_rgb is None:
+            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        with metrics.timer("detector.preprocess"):
+            faces = self.face_buffer.crop_faces(frame_rgb, boxes)
             
-            face = frame_rgb[y1:y2, x1:x2]
+        if faces is None:
+            return None
             
-            if face.size == 0:
-                continue
+        return self._embed(faces)
+
+    def get_embeddings_batch(self, frames, boxes_list):
+        """
+        Embeds the faces of several frames in a single ResNet pass.
+        :param boxes_list: boxes per frame (None or empty for frames without faces)
+        :return: list of embeddings (or None), one per frame
+        """
+        results = [None] * len(frames)
+        owners = [i for i, boxes in enumerate(boxes_list) if boxes is not None and len(boxes)]
+        if not owners:
+            return results
+
+        frames_rgb = [cv2.cvtColor(frames[i], cv2.COLOR_BGR2RGB) for i in owners]
+        with metrics.timer("detector.preprocess"):
+            faces, counts = self.face_buffer.crop_faces_batch(frames_rgb, [boxes_list[i] for i in owners])
+        if faces is None:
+            return results
+        embeddings = self._embed(faces)
+        if embeddings is None:
+            return results
+
+        offset = 0
+        for i, count in zip(owners, counts):
+            if count:
+                results[i] = embeddings[offset:offset + count]
+            offset += count
+        return results
+
+    def _detect_batch_rgb(self, frames, adaptive=None):
+        results = [(None, None)] * len(frames)
+        frames_rgb = [None] * len(frames)
+        groups = {}
+        for i, frame in enumerate(frames):
+            groups.setdefault(frame.shape, []).append(i)
+
+        if adaptive is None:
+            adaptive = self.adaptive
 
+        for indices in groups.values():
+            batch = np.stack([cv2.cvtColor(frames[i], cv2.COLOR_BGR2RGB) for i in indices])
+            for j, i in enumerate(indices):
+                frames_rgb[i] = batch[j]
+            # Adaptive mode detects on downsized copies; crops still come from the full-res batch
+            scale = 1.0
+            detect_input = batch
+            if adaptive is not None:
+                smalls = [adaptive.downscale(image) for image in batch]
+                scale = smalls[0][1]
+                if scale != 1.0:
+                    detect_input = np.stack([small for small, _ in smalls])
             try:
-                face = cv2.resize(face, (160, 160))
+                start = time.perf_counter()
+                with self._mtcnn_lock:
+                    self._apply_settings(adaptive)
+                    boxes, probs = self.mtcnn.detect(detect_input)
+                elapsed = time.perf_counter() - start
+                metrics.observe("detector.mtcnn_batch", elapsed)
+                metrics.inc("detector.frames", len(indices))
+                if adaptive is not None:
+                    adaptive.record(elapsed / len(indices))
             except Exception as e:
+                print(f"Error during batch detection: {e}")
                 continue
-            
-            # Standardize
-            face = np.float32(face)
-            mean, std = face.mean(), face.std()
-            if std == 0: std = 1
-            face = (face - mean) / std
-            
-            face = face.transpose(2, 0, 1)
-            faces.append(face)
-            
-        if not faces:
-            return None
-            
-        faces_array = np.array(faces)
-        faces_tensor = torch.tensor(faces_array).to(self.device)
-        
-        try:
-            with torch.no_grad():
-                embeddings = self.resnet(faces_tensor)
-            return embeddings.cpu().numpy()
-        except Exception as e:
-            print(f"Embedding extraction error: {e}")
-            return None
+            for j, i in enumerate(indices):
+                if boxes[j] is not None:
+                    results[i] = (np.asarray(boxes[j]) * scale, np.asarray(probs[j], dtype=np.float32))
+        return results, frames_rgb
+
+    def detect_batch(self, frames, adaptive=None):
+        """
+        Detects faces in several frames, running MTCNN once per group of equally sized frames.
+        :param frames: list of numpy arrays (B, G, R)
+        :param adaptive: the caller's AdaptiveDetection policy (default: the detector's own).
+        :return: list of (boxes, probs), one per frame
+        """
+        return self._detect_batch_rgb(frames, adaptive)[0]
+
+    def detect_and_embed_batch(self, frames, min_probs=None, adaptive=None):
+        """
+        Detection, confidence filtering and a single ResNet pass over the faces of all frames.
+        :param min_probs: per-frame detection confidence thresholds
+        :param adaptive: the caller's AdaptiveDetection policy (default: the detector's own).
+        :return: list of (boxes, probs, embeddings), one per frame; embeddings, when
+                 present, line up with boxes (boxes that can't be cropped are dropped).
+        """
+        if min_probs is None:
+            min_probs = [0.0] * len(frames)
+
+        results, frames_rgb = self._detect_batch_rgb(frames, adaptive)
+
+        detections = []
+        all_boxes = []
+        owners = []
+        for i, ((boxes, probs), min_prob) in enumerate(zip(results, min_probs)):
+            if boxes is not None:
+                # Boxes that would yield no crop are dropped too, so boxes[j] always owns embeddings[j]
+                keep = (probs >= min_prob) & croppable(boxes, frames[i].shape)
+                boxes, probs = boxes[keep], probs[keep]
+                if len(boxes) == 0:
+                    boxes, probs = None, None
+            detections.append((boxes, probs))
+            if boxes is not None:
+                all_boxes.append(boxes)
+                owners.append(i)
+
+        # Crop every face of every frame into one buffer, reusing the RGB frames from detection
+        counts = [0] * len(frames)
+        embeddings = None
+        if all_boxes:
+            with metrics.timer("detector.preprocess"):
+                faces, owner_counts = self.face_buffer.crop_faces_batch([frames_rgb[i] for i in owners], all_boxes)
+            for i, count in zip(owners, owner_counts):
+                counts[i] = count
+            if faces is not None:
+                embeddings = self._embed(faces)
+
+        results = []
+        offset = 0
+        for (boxes, probs), count in zip(detections, counts):
+            frame_embeddings = None
+            if embeddings is not None and count:
+                frame_embeddings = embeddings[offset:offset + count]
+            offset += count
+            results.append((boxes, probs, frame_embeddings))
+        return results
+
+    def detect_and_embed(self, frame, min_prob=0.0, adaptive=None):
+        return self.detect_and_embed_batch([frame], [min_prob], adaptive)[0]
 
     def compute_distance(self, emb1, emb2):
         return np.linalg.norm(emb1 - emb2)
@@ -0,0 +1,148 @@
+import time
+from collections import Counter, OrderedDict, deque
+
+import cv2
+import numpy as np
+
+
+class _Entry:
+    def __init__(self, vote_window):
+        self.embedding = None       # rolling average, L2-normalized
+        self.thumbnail = None       # 16x16 grayscale crop at the last embedding
+        self.frames_since_embed = 0
+        self.history = deque(maxlen=vote_window)  # recent unthresholded (name, dist)
+        self.last_seen = 0.0
+
+
+class TrackEmbeddingCache:
+    """
+    Track-keyed cache that sits between FaceDetector.get_embeddings and
+    FaceManager.match_faces.
+
+    A track is re-embedded only when it is new, every `refresh_every` frames,
+    or when its crop changes noticeably; embeddings are blended into a rolling
+    average, and the displayed identity is a majority vote over the last
+    `vote_window` matches so labels don't flicker around the threshold.
+    Entries expire after `ttl` seconds unseen, and at most `max_entries` are
+    kept (least recently seen evicted first).
+    """
+
+    def __init__(self, detector, face_manager, refresh_every=15, appearance_threshold=0.12,
+                 alpha=0.3, vote_window=7, ttl=2.0, max_entries=128):
+        self.detector = detector
+        self.face_manager = face_manager
+        self.refresh_every = refresh_every
+        self.appearance_threshold = appearance_threshold
+        self.alpha = alpha
+        self.vote_window = vote_window
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.entries = OrderedDict()
+        self._gallery_version = None
+
+        self.lookups = 0
+        self.embeddings = 0
+
+    @staticmethod
+    def _thumbnail(frame_rgb, box):
+        h, w = frame_rgb.shape[:2]
+        x1, y1 = max(0, int(box[0])), max(0, int(box[1]))
+        x2, y2 = min(w, int(box[2])), min(h, int(box[3]))
+        if x2 <= x1 or y2 <= y1:
+            return None
+        crop = cv2.cvtColor(frame_rgb[y1:y2, x1:x2], cv2.COLOR_RGB2GRAY)
+        return cv2.resize(crop, (16, 16), interpolation=cv2.INTER_AREA).astype(np.float32) / 255.0
+
+    def _needs_embedding(self, entry, thumbnail):
+        if entry.embedding is None:
+            return True
+        if entry.frames_since_embed >= self.refresh_every:
+            return True
+        if thumbnail is not None and entry.thumbnail is not None:
+            return float(np.abs(thumbnail - entry.thumbnail).mean()) > self.appearance_threshold
+        return False
+
+    def refresh(self, frame, frame_rgb, tracks, now=None):
+        """
+        Brings the cached embedding and identity of every track up to date,
+        running one ResNet batch for the tracks that need it.
+        """
+        now = time.time() if now is None else now
+        stale, thumbnails = [], []
+
+        for track in tracks:
+            self.lookups += 1
+            entry = self.entries.get(track.id)
+            if entry is None:
+                entry = _Entry(self.vote_window)
+                self.entries[track.id] = entry
+            self.entries.move_to_end(track.id)
+            entry.last_seen = now
+            entry.frames_since_embed += 1
+
+            thumbnail = self._thumbnail(frame_rgb, track.box)
+            if thumbnail is not None and self._needs_embedding(entry, thumbnail):
+                stale.append(track)
+                thumbnails.append(thumbnail)
+
+        rematch = []
+        if stale:
+            embeddings = self.detector.get_embeddings(
+                frame, np.stack([t.box for t in stale]), frame_rgb=frame_rgb)
+            if embeddings is not None:
+                self.embeddings += len(embeddings)
+                for track, thumbnail, emb in zip(stale, thumbnails, embeddings):
+                    entry = self.entries[track.id]
+                    emb = emb / max(np.linalg.norm(emb), 1e-6)
+                    if entry.embedding is None:
+                        entry.embedding = emb
+                    else:
+                        blended = (1 - self.alpha) * entry.embedding + self.alpha * emb
+                        entry.embedding = blended / max(np.linalg.norm(blended), 1e-6)
+                    entry.thumbnail = thumbnail
+                    entry.frames_since_embed = 0
+                    rematch.append(track.id)
+
+        if self._gallery_version != self.face_manager.version:
+            # Gallery changed: every vote history is stale
+            self._gallery_version = self.face_manager.version
+            for track in tracks:
+                entry = self.entries[track.id]
+                entry.history.clear()
+                if entry.embedding is not None and track.id not in rematch:
+                    rematch.append(track.id)
+
+        if rematch:
+            matches = self.face_manager.match_faces(
+                np.stack([self.entries[i].embedding for i in rematch]), threshold=float('inf'))
+            for track_id, match in zip(rematch, matches):
+                self.entries[track_id].history.append(match)
+
+        self.evict(now)
+
+    def evict(self, now=None):
+        now = time.time() if now is None else now
+        while self.entries:
+            track_id, entry = next(iter(self.entries.items()))
+            if len(self.entries) > self.max_entries or now - entry.last_seen > self.ttl:
+                del self.entries[track_id]
+            else:
+                break
+
+    def embedding(self, track_id):
+        entry = self.entries.get(track_id)
+        return None if entry is None else entry.embedding
+
+    def label(self, track_id, threshold):
+        """
+        :return: (name, dist) by majority vote over the track's recent matches.
+        """
+        entry = self.entries.get(track_id)
+        if entry is None or not entry.history:
+            return "Unknown", float('inf')
+        votes = Counter(name if dist < threshold else "Unknown" for name, dist in entry.history)
+        name = votes.most_common(1)[0][0]
+        if name == "Unknown":
+            return name, entry.history[-1][1]
+        return name, float(np.mean([dist for n, dist in entry.history if n == name]))
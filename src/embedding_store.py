@@ -0,0 +1,327 @@
+import json
+import os
+import pickle
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class _FileLock:
+    """
+    Exclusive advisory lock on a file, held by one writer (thread or process) at a time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a+b')
+        if os.name == 'nt':
+            import msvcrt
+            self._file.seek(0)
+            while True:
+                try:
+                    # LK_LOCK gives up after ~10 seconds; keep waiting like flock does
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        else:
+            import fcntl
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if os.name == 'nt':
+            import msvcrt
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk embedding store.
+
+    Layout inside `directory`:
+      meta.json           dim, current generation, migration marker
+      embeddings.<gen>.f32  fixed-width float32 rows, memory-mapped for reads
+      log.<gen>.jsonl     one line per add ({"op": "add", "row", "name"})
+                          or tombstoned delete ({"op": "del", "name"})
+
+    Adds and deletes cost O(1) I/O. Compaction rewrites only the live rows into
+    the next generation and switches meta.json over atomically, so readers of
+    the old memmap are never invalidated.
+
+    Several processes may write the same store (e.g. bulk_enroll.py while a
+    dashboard runs): every append, delete and compaction holds an exclusive
+    lock on `store.lock` and first replays what other writers logged, so row
+    numbers always come from the data file itself. refresh() picks up other
+    writers' changes without writing anything.
+    """
+
+    def __init__(self, directory, dim=512, compact_ratio=0.5, compact_min_dead=1024):
+        self.directory = directory
+        self.compact_ratio = compact_ratio
+        self.compact_min_dead = compact_min_dead
+        self.lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self.rows = 0        # rows physically present in the embedding file
+        self.dead_rows = 0   # rows masked by tombstones
+        self.live = {}       # name -> [row, ...]
+        self._log_offset = 0           # bytes of the log applied to `live` so far
+        self.external_changes = 0      # bumped whenever another writer's changes are picked up
+
+        with self.lock, _FileLock(self._lock_path):
+            self.meta = self._read_meta()
+            if self.meta is None:
+                self.meta = {"version": 1, "dim": dim, "generation": 0}
+                self._write_meta()
+            self.dim = self.meta["dim"]
+            self._replay_log()
+
+    # ---------- paths / metadata ----------
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.directory, "meta.json")
+
+    @property
+    def _lock_path(self):
+        return os.path.join(self.directory, "store.lock")
+
+    def _data_path(self, generation=None):
+        gen = self.meta["generation"] if generation is None else generation
+        return os.path.join(self.directory, f"embeddings.{gen}.f32")
+
+    def _log_path(self, generation=None):
+        gen = self.meta["generation"] if generation is None else generation
+        return os.path.join(self.directory, f"log.{gen}.jsonl")
+
+    def _read_meta(self):
+        if not os.path.exists(self._meta_path):
+            return None
+        with open(self._meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_meta(self):
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        os.replace(tmp, self._meta_path)
+
+    # ---------- loading ----------
+
+    def _replay_log(self):
+        self.live = {}
+        self.dead_rows = 0
+        self._log_offset = 0
+        self._read_log()
+
+    def _read_log(self):
+        """
+        Applies the log lines written since the last read, by this or another process.
+        :return: True if any were applied.
+        """
+        data_path = self._data_path()
+        # Rows written without a matching log line (crash mid-append) are ignored,
+        # and a torn partial row is cut off by the next append.
+        self.rows = os.path.getsize(data_path) // (self.dim * 4) if os.path.exists(data_path) else 0
+        if not os.path.exists(self._log_path()):
+            return False
+        with open(self._log_path(), 'rb') as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        # Only complete lines; a torn last line is retried on the next read
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Torn line left by a crash, already followed by newer entries
+                continue
+            if entry["op"] == "add" and entry["row"] < self.rows:
+                self.live.setdefault(entry["name"], []).append(entry["row"])
+            elif entry["op"] == "del":
+                self.dead_rows += len(self.live.pop(entry["name"], ()))
+        self._log_offset += end
+        return end > 0
+
+    def _sync(self):
+        # Caller holds the store lock
+        meta = self._read_meta() or self.meta
+        if meta["generation"] != self.meta["generation"]:
+            # Another writer compacted the store: start over from its new generation
+            self.meta = meta
+            self._replay_log()
+            self.external_changes += 1
+        else:
+            self.meta = meta
+            if self._read_log():
+                self.external_changes += 1
+
+    @contextmanager
+    def _exclusive(self):
+        """
+        Serializes writers across threads and processes, after catching up on what other writers logged.
+        """
+        with self.lock, _FileLock(self._lock_path):
+            self._sync()
+            yield
+
+    def refresh(self):
+        """
+        Picks up appends, deletes and compactions made by other processes.
+        :return: True if anything changed.
+        """
+        before = self.external_changes
+        with self._exclusive():
+            pass
+        return self.external_changes != before
+
+    def matrix(self):
+        """
+        :return: Read-only (rows, dim) float32 memmap of the embedding file.
+        """
+        if self.rows == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.memmap(self._data_path(), dtype=np.float32, mode='r', shape=(self.rows, self.dim))
+
+    def live_rows(self):
+        """
+        :return: (rows, names) of every live embedding, in file order.
+        """
+        rows, names = [], []
+        for name, name_rows in self.live.items():
+            rows.extend(name_rows)
+            names.extend([name] * len(name_rows))
+        rows = np.asarray(rows, dtype=np.int64)
+        order = np.argsort(rows, kind='stable')
+        return rows[order], [names[i] for i in order]
+
+    def load(self):
+        """
+        :return: (vectors, names) where vectors[i] belongs to names[i].
+                 When there are no tombstones in the way, vectors is the memmap itself.
+        """
+        mm = self.matrix()
+        rows, names = self.live_rows()
+        if len(rows) == self.rows:
+            return mm, names
+        return np.asarray(mm[rows]), names
+
+    # ---------- mutation ----------
+
+    def append(self, name, embedding):
+        self.append_many([(name, embedding)])
+
+    def append_many(self, items):
+        """
+        Appends (name, embedding) pairs with one write to each file.
+        :return: Row number of the first appended embedding.
+        """
+        if not items:
+            return self.rows
+        block = np.stack([np.asarray(e, dtype=np.float32).ravel() for _, e in items])
+        if block.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d embeddings, got {block.shape[1]}")
+
+        with self._exclusive():
+            return self._append_locked(items, block)
+
+    def _append_locked(self, items, block):
+        # Caller holds the store lock and has just synced, so self.rows is the data file's real row count
+        first = self.rows
+        with open(self._data_path(), 'ab') as f:
+            f.truncate(first * self.dim * 4)
+            f.write(block.tobytes())
+        lines = []
+        for i, (name, _) in enumerate(items):
+            lines.append(json.dumps({"op": "add", "row": first + i, "name": name}, ensure_ascii=False))
+            self.live.setdefault(name, []).append(first + i)
+        self._write_log("\n".join(lines) + "\n")
+        self.rows += len(items)
+        return first
+
+    def _write_log(self, text):
+        # Caller holds the store lock; our own lines count as already applied
+        with open(self._log_path(), 'ab') as f:
+            if f.tell() > self._log_offset:
+                # Finish a torn line left by a crashed writer so ours starts on a fresh line
+                f.write(b"\n")
+            f.write(text.encode('utf-8'))
+            self._log_offset = f.tell()
+
+    def delete(self, name):
+        with self._exclusive():
+            if name not in self.live:
+                return False
+            self._write_log(json.dumps({"op": "del", "name": name}, ensure_ascii=False) + "\n")
+            self.dead_rows += len(self.live.pop(name))
+        self.maybe_compact()
+        return True
+
+    def maybe_compact(self):
+        if self.dead_rows >= self.compact_min_dead and self.dead_rows > self.compact_ratio * self.rows:
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrites live rows into the next generation and drops tombstones.
+        """
+        with self._exclusive():
+            vectors, names = self.load()
+            old_gen = self.meta["generation"]
+            new_gen = old_gen + 1
+
+            with open(self._data_path(new_gen), 'wb') as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            live = {}
+            with open(self._log_path(new_gen), 'wb') as f:
+                for row, name in enumerate(names):
+                    f.write((json.dumps({"op": "add", "row": row, "name": name}, ensure_ascii=False) + "\n").encode('utf-8'))
+                    live.setdefault(name, []).append(row)
+                log_size = f.tell()
+
+            self.meta["generation"] = new_gen
+            self._write_meta()
+            self.live = live
+            self.rows = len(names)
+            self.dead_rows = 0
+            self._log_offset = log_size
+
+        for path in (self._data_path(old_gen), self._log_path(old_gen)):
+            try:
+                os.remove(path)
+            except OSError:
+                # Still mapped by a reader (Windows); the next compaction can retry.
+                pass
+
+    # ---------- migration ----------
+
+    def migrate_from_pickle(self, pickle_path):
+        """
+        One-time import of the legacy faces.pkl (name -> [embedding, ...]).
+        :return: Number of embeddings imported.
+        """
+        if self.meta.get("migrated_from") or self.rows or not os.path.exists(pickle_path):
+            return 0
+        with self._exclusive():
+            # Another process may have migrated (or written) in the meantime
+            if self.meta.get("migrated_from") or self.rows:
+                return 0
+            with open(pickle_path, 'rb') as f:
+                faces = pickle.load(f)
+            items = [(name, emb) for name, embs in faces.items() for emb in embs]
+            if items:
+                self._append_locked(items, np.stack([np.asarray(e, dtype=np.float32).ravel() for _, e in items]))
+            self.meta["migrated_from"] = os.path.abspath(pickle_path)
+            self._write_meta()
+            return len(items)
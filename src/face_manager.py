@@ -1,54 +1,382 @@
 import os
-import pickle
 import numpy as np
 
 import threading
+import time
+from collections.abc import Mapping
+
+import metrics
+from ann_index import IVFIndex
+from embedding_store import EmbeddingStore
+from quantized_gallery import PRECISIONS, QuantizedGallery
+
+class _StoreFaces(Mapping):
+    """
+    Read-only name -> [embedding, ...] view of a compact gallery, reading the
+    float32 embeddings from the store on access instead of keeping them in memory.
+    """
+
+    def __init__(self, manager):
+        self._manager = manager
+
+    def __getitem__(self, name):
+        rows, exact = self._manager._rows[name], self._manager._exact
+        return [np.asarray(exact[row], dtype=np.float32) for row in rows]
+
+    def __contains__(self, name):
+        return name in self._manager._rows
+
+    def __iter__(self):
+        return iter(list(self._manager._rows))
+
+    def __len__(self):
+        return len(self._manager._rows)
+
 
 class FaceManager:
-    def __init__(self, storage_file="data/faces.pkl"):
+    def __init__(self, storage_file="data/faces.pkl", store_dir=None, index="exact", nlist=None, nprobe=8,
+                 precision="float32", rerank=16):
+        """
+        :param storage_file: Legacy pickle database, imported once into the store.
+        :param store_dir: Append-only embedding store (default: data/face_store).
+        :param index: "exact" for a brute-force scan, "ivf" for an approximate
+                      inverted-file index suited to very large galleries.
+        :param nlist: Number of IVF buckets (default: sqrt of gallery size).
+        :param nprobe: Number of IVF buckets scanned per query.
+        :param precision: "float16" or "int8" keeps a compact normalized gallery in memory
+                          and re-ranks its `rerank` best candidates per query with the
+                          exact float32 embeddings from the store.
+        """
         self.storage_file = storage_file
-        self.faces = {} # Name -> [Embedding1, Embedding2, ...]
+        # Name -> [Embedding1, Embedding2, ...]; a read-only view over the store with a compact precision
+        self.faces = {}
+        # Name -> [store row, ...], only with a compact precision
+        self._rows = {}
         self.lock = threading.Lock()
-        self._load_faces()
+        # Bumped on every add/delete so callers caching match results know to refresh
+        self.version = 0
+        self._last_refresh = 0.0
 
-    def _load_faces(self):
-        if os.path.exists(self.storage_file):
-            try:
-                with open(self.storage_file, 'rb') as f:
-                    self.faces = pickle.load(f)
-                print(f"Loaded {len(self.faces)} identities.")
-            except Exception as e:
-                print(f"Error loading faces: {e}")
-                self.faces = {}
+        # Contiguous gallery used for exact matching (the IVF index keeps its own buckets instead).
+        # Row i of _gallery belongs to identity _names[_labels[i]].
+        # _names is append-only so label ids stay valid for readers holding an old snapshot.
+        self._names = []
+        self._name_to_label = {}
+        self._gallery = np.empty((0, 0), dtype=np.float32)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._labels = np.empty(0, dtype=np.int32)
+        self._size = 0
+
+        if index == "exact":
+            self._index = None
+        elif index == "ivf":
+            self._index = IVFIndex(nlist=nlist, nprobe=nprobe)
         else:
+            raise ValueError(f"Unknown index type: {index}")
+
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown gallery precision: {precision}")
+        if precision != "float32" and self._index is not None:
+            raise ValueError("Compact gallery precisions are only supported with index='exact'")
+        self.precision = precision
+        self.rerank = rerank
+        self._quantized = None
+        self._exact = None      # float32 store memmap the compact gallery re-ranks against
+
+        if store_dir is None:
+            store_dir = os.path.join(os.path.dirname(storage_file) or ".", "face_store")
+        self.store = EmbeddingStore(store_dir)
+
+        with metrics.timer("face_manager.load"):
+            self._load_faces()
+        metrics.set_gauge("face_manager.gallery_size", self._size)
+
+    def _load_faces(self):
+        try:
+            migrated = self.store.migrate_from_pickle(self.storage_file)
+            if migrated:
+                print(f"Migrated {migrated} embeddings from {self.storage_file}.")
+        except Exception as e:
+            print(f"Error migrating faces: {e}")
+
+        self._reload()
+        if not self.faces:
             print("No existing face database found.")
-            # Create directory if needed
-            os.makedirs(os.path.dirname(self.storage_file), exist_ok=True)
+        elif self.precision != "float32":
+            print(f"Loaded {len(self.faces)} identities ({self.precision} gallery).")
+        else:
+            print(f"Loaded {len(self.faces)} identities.")
+
+    def _reload(self):
+        """
+        Rebuilds everything in memory from the store. Caller holds self.lock (or is __init__).
+        """
+        self._store_changes = self.store.external_changes
+        if self.precision != "float32":
+            self._rebuild_quantized()
+            return
+        vectors, names = self.store.load()
+        self.faces = {}
+        for name, emb in zip(names, vectors):
+            self.faces.setdefault(name, []).append(emb)
+        self._rebuild_gallery(vectors, names)
+
+    def _store_changed(self):
+        # Caller holds self.lock. True when the store has picked up another process's writes
+        return self.store.external_changes != self._store_changes
+
+    def refresh(self, min_interval=0.0):
+        """
+        Picks up identities added or deleted by other processes sharing the store,
+        such as bulk_enroll.py running next to the dashboard.
+        :param min_interval: do nothing if the last refresh was less than this many seconds ago.
+        :return: True if the gallery changed.
+        """
+        now = time.monotonic()
+        if now - self._last_refresh < min_interval:
+            return False
+        self._last_refresh = now
+        with self.lock:
+            self.store.refresh()
+            if not self._store_changed():
+                return False
+            self._reload()
+            self.version += 1
+        metrics.set_gauge("face_manager.gallery_size", self._size)
+        return True
 
     def save_faces(self):
+        """
+        Adds and deletes are already durable; this compacts the store.
+        """
         try:
-            os.makedirs(os.path.dirname(self.storage_file), exist_ok=True)
-            with open(self.storage_file, 'wb') as f:
-                pickle.dump(self.faces, f)
+            with self.lock, metrics.timer("face_manager.save"):
+                self.store.compact()
+                if self._quantized is not None or self._store_changed():
+                    # Compaction renumbers the store rows the compact gallery points at
+                    self._reload()
+                    self.version += 1
             print("Faces saved successfully.")
         except Exception as e:
             print(f"Error saving faces: {e}")
 
+    def _label_for(self, name):
+        label = self._name_to_label.get(name)
+        if label is None:
+            label = len(self._names)
+            self._names.append(name)
+            self._name_to_label[name] = label
+        return label
+
+    def _rebuild_gallery(self, vectors, names):
+        """
+        Uses the store's (usually memory-mapped) matrix directly as the gallery.
+        The first add grows it into a private in-memory copy.
+        With an IVF index, the index is built from it instead.
+        """
+        labels = np.asarray([self._label_for(name) for name in names], dtype=np.int32)
+        self._size = len(names)
+        if self._index is not None:
+            # The index's buckets hold the only in-memory copy of the gallery
+            self._index.build(vectors, labels)
+            return
+        self._gallery = vectors
+        self._labels = labels
+        self._sq_norms = np.einsum('ij,ij->i', vectors, vectors).astype(np.float32)
+
+    def _rebuild_quantized(self):
+        """
+        Quantizes every live store row, reading the memmap in chunks.
+        """
+        rows, names = self.store.live_rows()
+        self._rows = {}
+        for name, row in zip(names, rows):
+            self._rows.setdefault(name, []).append(int(row))
+        self.faces = _StoreFaces(self)
+        gallery = QuantizedGallery(self.store.dim, precision=self.precision, rerank=self.rerank)
+        exact = self.store.matrix()
+        gallery.build(exact, rows, [self._label_for(name) for name in names])
+        self._quantized, self._exact = gallery, exact
+        self._size = len(gallery)
+
+    def _append_quantized(self, items, first_row):
+        # Caller holds self.lock and has just appended `items` to the store at `first_row`
+        rows = list(range(first_row, first_row + len(items)))
+        for (name, _), row in zip(items, rows):
+            self._rows.setdefault(name, []).append(row)
+        self._quantized.add_many(np.stack([np.asarray(e, dtype=np.float32).ravel() for _, e in items]),
+                                 [self._label_for(name) for name, _ in items], rows)
+        # A fresh memmap so the new rows are visible to re-ranking
+        self._exact = self.store.matrix()
+        self._size = len(self._quantized)
+
+    def _append_to_gallery(self, name, embedding):
+        emb = np.asarray(embedding, dtype=np.float32).ravel()
+        label = self._label_for(name)
+        if self._index is not None:
+            self._index.add(emb, label)
+            self._size = self._index.size
+            return
+
+        if self._size == 0:
+            self._gallery = np.empty((16, emb.shape[0]), dtype=np.float32)
+            self._sq_norms = np.empty(16, dtype=np.float32)
+            self._labels = np.empty(16, dtype=np.int32)
+
+        capacity = self._gallery.shape[0]
+        if self._size == capacity:
+            # Grow into fresh arrays so snapshots taken by match_faces stay untouched.
+            new_capacity = max(16, capacity * 2)
+            gallery = np.empty((new_capacity, self._gallery.shape[1]), dtype=np.float32)
+            gallery[:self._size] = self._gallery[:self._size]
+            sq_norms = np.empty(new_capacity, dtype=np.float32)
+            sq_norms[:self._size] = self._sq_norms[:self._size]
+            labels = np.empty(new_capacity, dtype=np.int32)
+            labels[:self._size] = self._labels[:self._size]
+            self._gallery, self._sq_norms, self._labels = gallery, sq_norms, labels
+
+        # Writing past the current size never touches rows visible to an existing snapshot.
+        self._gallery[self._size] = emb
+        self._sq_norms[self._size] = emb @ emb
+        self._labels[self._size] = label
+        self._size += 1
+
+    def _remove_from_gallery(self, name):
+        label = self._name_to_label.get(name)
+        if label is None:
+            return
+        if self._index is not None:
+            self._index.remove(label)
+            self._size = self._index.size
+            return
+        keep = self._labels[:self._size] != label
+        # Boolean indexing allocates new arrays, again leaving old snapshots valid.
+        self._gallery = self._gallery[:self._size][keep]
+        self._sq_norms = self._sq_norms[:self._size][keep]
+        self._labels = self._labels[:self._size][keep]
+        self._size = len(self._labels)
+
+    def _snapshot(self):
+        with self.lock:
+            n = self._size
+            return self._gallery[:n], self._sq_norms[:n], self._labels[:n], self._names
+
     def add_face(self, name, embedding):
+        self.add_faces([(name, embedding)])
+
+    def add_faces(self, items):
+        """
+        Adds many (name, embedding) pairs with a single store append.
+        :return: Number of embeddings added.
+        """
+        if not items:
+            return 0
+        with self.lock, metrics.timer("face_manager.add_many"):
+            # Persist first, so a rejected batch leaves the in-memory gallery untouched
+            first_row = self.store.append_many(items)
+            if self._store_changed():
+                # Another process wrote to the store too; the reload includes this batch
+                self._reload()
+            elif self._quantized is not None:
+                self._append_quantized(items, first_row)
+            else:
+                for name, embedding in items:
+                    self.faces.setdefault(name, []).append(embedding)
+                    self._append_to_gallery(name, embedding)
+            self.version += 1
+        metrics.set_gauge("face_manager.gallery_size", self._size)
+        return len(items)
+
+    def identities(self):
+        """
+        :return: {name: number of enrolled embeddings}.
+        """
         with self.lock:
-            if name not in self.faces:
-                self.faces[name] = []
-            self.faces[name].append(embedding)
-            self.save_faces()
+            source = self._rows if self._quantized is not None else self.faces
+            return {name: len(entries) for name, entries in source.items()}
 
     def delete_face(self, name):
         with self.lock:
             if name in self.faces:
-                del self.faces[name]
-                self.save_faces()
+                if self._quantized is not None:
+                    del self._rows[name]
+                    generation = self.store.meta["generation"]
+                    self.store.delete(name)
+                    if self.store.meta["generation"] != generation:
+                        # The delete triggered a compaction, which renumbers store rows
+                        self._rebuild_quantized()
+                    else:
+                        self._quantized.remove(self._name_to_label[name])
+                        self._size = len(self._quantized)
+                else:
+                    del self.faces[name]
+                    self._remove_from_gallery(name)
+                    self.store.delete(name)
+                if self._store_changed():
+                    # Another process wrote to the store too
+                    self._reload()
+                self.version += 1
+                metrics.set_gauge("face_manager.gallery_size", self._size)
                 return True
         return False
 
+    def match_faces(self, embeddings, threshold=0.8):
+        """
+        Matches every face of a frame against the whole gallery at once.
+        :param embeddings: (N, D) array of embeddings.
+        :param threshold: Distance threshold (smaller is closer).
+        :return: List of (name or "Unknown", best_dist), one per embedding.
+        """
+        queries = np.asarray(embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        if len(queries) == 0:
+            return []
+
+        with metrics.timer("face_manager.match"):
+            return self._match(queries, threshold)
+
+    def _match(self, queries, threshold):
+        if self._quantized is not None:
+            with self.lock:
+                gallery, exact, names = self._quantized, self._exact, self._names
+                snapshot = gallery.snapshot()
+            if len(snapshot[2]) == 0:
+                return [("Unknown", float('inf')) for _ in range(len(queries))]
+            # Coarse pass over the compact codes, exact float32 re-rank of the best candidates
+            best_labels, best_dists = gallery.search(queries, exact, snapshot)
+            return self._results(best_labels, best_dists, names, threshold)
+
+        if self._index is not None:
+            # Frozen under the lock, so an add_faces that retrains the index can't change it mid-search
+            with self.lock:
+                snapshot, names = self._index.snapshot(), self._names
+            best_labels, best_dists = self._index.search(queries, snapshot=snapshot)
+            return self._results(best_labels, best_dists, names, threshold)
+
+        gallery, sq_norms, labels, names = self._snapshot()
+        if len(gallery) == 0:
+            return [("Unknown", float('inf')) for _ in range(len(queries))]
+
+        # ||q - g||^2 = ||q||^2 - 2 q.g + ||g||^2
+        q_sq = np.einsum('ij,ij->i', queries, queries)
+        d2 = q_sq[:, None] - 2.0 * (queries @ gallery.T) + sq_norms[None, :]
+        best = np.argmin(d2, axis=1)
+        best_labels = labels[best]
+        best_dists = np.sqrt(np.maximum(d2[np.arange(len(queries)), best], 0.0))
+        return self._results(best_labels, best_dists, names, threshold)
+
+    @staticmethod
+    def _results(best_labels, best_dists, names, threshold):
+        results = []
+        for label, dist in zip(best_labels, best_dists):
+            dist = float(dist)
+            if label >= 0 and dist < threshold:
+                results.append((names[label], dist))
+            else:
+                results.append(("Unknown", dist))
+        return results
+
     def match_face(self, embedding, threshold=0.8):
         """
         Finds the closest matching face.
@@ -56,21 +384,4 @@ class FaceManager:
         :param threshold: Distance threshold (smaller is closer).
         :return: Name of the match or "Unknown", best_dist.
         """
-        best_name = "Unknown"
-        best_dist = float('inf')
-
-        # Use a copy of keys to avoid RuntimeError if changed during iteration
-        with self.lock:
-            items = list(self.faces.items())
-
-        for name, embeddings in items:
-            for known_emb in embeddings:
-                dist = np.linalg.norm(embedding - known_emb)
-                if dist < best_dist:
-                    best_dist = dist
-                    best_name = name
-        
-        if best_dist < threshold:
-            return best_name, best_dist
-        else:
-            return "Unknown", best_dist
+        return self.match_faces(embedding, threshold=threshold)[0]
@@ -0,0 +1,235 @@
+"""
+Interchangeable runtimes for the InceptionResnetV1 embedding model.
+
+    eager        plain PyTorch (reference)
+    torchscript  traced and frozen TorchScript
+    int8         dynamically INT8-quantized Linear layers, traced
+    onnx         ONNX export run by ONNX Runtime (pip install onnxruntime)
+
+Exported models are written to the model cache directory on first use and
+loaded from there afterwards. Every backend takes a contiguous
+(N, 3, 160, 160) float32 array and returns (N, 512) float32 embeddings.
+
+Face detection (MTCNN) stays on eager PyTorch. Its three networks are tiny;
+most of its time goes to the image pyramid, NMS and box refinement in
+facenet_pytorch's Python code, which an exported runtime would not speed up.
+Detection cost is handled by adaptive_detection instead.
+
+    python src/inference_backends.py --backends eager torchscript int8 onnx --batch-sizes 1 8
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+BACKENDS = ("eager", "torchscript", "int8", "onnx")
+DEFAULT_CACHE_DIR = os.path.join("data", "model_cache")
+INPUT_SHAPE = (3, 160, 160)
+
+
+def model_cache_dir(cache_dir=None):
+    cache_dir = cache_dir or os.environ.get("FACE_MODEL_CACHE", DEFAULT_CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def load_inception_resnet(weights, device, cache_dir=None):
+    """
+    InceptionResnetV1 with its weights read from the model cache. The
+    pretrained download only happens once, when the cache has no copy yet.
+    """
+    from facenet_pytorch import InceptionResnetV1
+
+    if weights is None:
+        return InceptionResnetV1(pretrained=None, classify=False, device=device).eval()
+
+    path = os.path.join(model_cache_dir(cache_dir), f"inception_resnet_v1_{weights}.pt")
+    if os.path.exists(path):
+        model = InceptionResnetV1(pretrained=None, classify=False)
+        model.load_state_dict(torch.load(path, map_location="cpu"))
+        return model.to(device).eval()
+
+    model = InceptionResnetV1(pretrained=weights, classify=False, device=device).eval()
+    # The classifier head is unused for embeddings and absent without `pretrained`
+    state = {k: v for k, v in model.state_dict().items() if not k.startswith("logits.")}
+    tmp_path = path + ".tmp"
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, path)
+    print(f"Cached {weights} weights in {path}")
+    return model
+
+
+def _example_input():
+    return torch.zeros((1,) + INPUT_SHAPE, dtype=torch.float32)
+
+
+class EagerBackend:
+    name = "eager"
+
+    def __init__(self, model, device):
+        self.model = model
+        self.device = device
+
+    def __call__(self, faces):
+        with torch.no_grad():
+            return self.model(torch.from_numpy(faces).to(self.device)).cpu().numpy()
+
+
+class TorchScriptBackend(EagerBackend):
+    name = "torchscript"
+
+    def __init__(self, model, device, path):
+        if not os.path.exists(path):
+            with torch.no_grad():
+                traced = torch.jit.trace(model, _example_input().to(device))
+                traced = torch.jit.freeze(traced)
+            torch.jit.save(traced, path)
+            print(f"Exported TorchScript embedding model to {path}")
+        super().__init__(torch.jit.load(path, map_location=device), device)
+
+
+class Int8Backend(EagerBackend):
+    """
+    Dynamic quantization covers nn.Linear only; the convolutions stay float32.
+    """
+    name = "int8"
+
+    def __init__(self, model, device, path):
+        if device.type != "cpu":
+            raise ValueError("The int8 backend runs on CPU only")
+        if not os.path.exists(path):
+            quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            with torch.no_grad():
+                traced = torch.jit.trace(quantized, _example_input())
+            torch.jit.save(traced, path)
+            print(f"Exported INT8 embedding model to {path}")
+        super().__init__(torch.jit.load(path, map_location=device), device)
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, model, device, path, threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The onnx backend needs onnxruntime (pip install onnxruntime)") from e
+        if device.type != "cpu":
+            raise ValueError("The onnx backend is configured for CPU only")
+
+        if not os.path.exists(path):
+            torch.onnx.export(model, _example_input(), path, input_names=["faces"],
+                              output_names=["embeddings"], opset_version=17,
+                              dynamic_axes={"faces": {0: "batch"}, "embeddings": {0: "batch"}})
+            print(f"Exported ONNX embedding model to {path}")
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, faces):
+        return self.session.run(None, {"faces": faces})[0]
+
+
+def create_backend(name, model, device, weights="vggface2", cache_dir=None):
+    """
+    :param model: the eager InceptionResnetV1 in eval mode.
+    :param weights: tag of the loaded weights, part of the cache file name.
+                    None (random weights) exports to a throwaway directory instead.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {name} (expected one of {', '.join(BACKENDS)})")
+    if name == "eager":
+        return EagerBackend(model, device)
+
+    if weights is None:
+        directory = tempfile.mkdtemp(prefix="face_models_")
+        stem = "inception_resnet_v1_random"
+    else:
+        directory = model_cache_dir(cache_dir)
+        stem = f"inception_resnet_v1_{weights}_torch{torch.__version__.split('+')[0]}"
+    if name == "torchscript":
+        return TorchScriptBackend(model, device, os.path.join(directory, f"{stem}_{device.type}.ts.pt"))
+    if name == "int8":
+        return Int8Backend(model, device, os.path.join(directory, f"{stem}_int8.ts.pt"))
+    return OnnxBackend(model, device, os.path.join(directory, f"{stem}.onnx"))
+
+
+def cosine_parity(reference, candidate, faces):
+    """
+    :return: {"min_cosine", "mean_cosine"} between the two backends' embeddings of `faces`.
+    """
+    a = reference(faces)
+    b = candidate(faces)
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    cos = np.sum(a * b, axis=1)
+    return {"min_cosine": float(cos.min()), "mean_cosine": float(cos.mean())}
+
+
+def per_face_latency(backend, faces, repeat=20):
+    """
+    :return: median milliseconds per face for a batch of `faces`.
+    """
+    backend(faces)  # warm up
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        backend(faces)
+        durations.append(time.perf_counter() - start)
+    return float(np.median(durations)) * 1000 / len(faces)
+
+
+def synthetic_faces(n, seed=0):
+    """
+    Face-sized inputs in the [-1, 1] range produced by fixed_image_standardization.
+    """
+    rng = np.random.default_rng(seed)
+    return np.ascontiguousarray(rng.uniform(-1, 1, (n,) + INPUT_SHAPE).astype(np.float32))
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Embedding backend parity and per-face latency (CPU)")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--random-weights", action="store_true", help="skip the pretrained download")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="parity threshold")
+    parser.add_argument("--out", help="write the results as JSON here")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = torch.device("cpu")
+    weights = None if args.random_weights else "vggface2"
+    model = load_inception_resnet(weights, device)
+    reference = EagerBackend(model, device)
+    parity_faces = synthetic_faces(32, seed=1)
+
+    rows = []
+    for name in args.backends:
+        try:
+            backend = create_backend(name, model, device, weights=weights)
+        except (ImportError, ValueError, RuntimeError) as e:
+            print(f"{name:<12} unavailable: {e}")
+            rows.append({"backend": name, "error": str(e)})
+            continue
+        row = {"backend": name, **cosine_parity(reference, backend, parity_faces)}
+        for batch in args.batch_sizes:
+            row[f"ms_per_face_b{batch}"] = per_face_latency(backend, synthetic_faces(batch), args.repeat)
+        row["ok"] = row["min_cosine"] >= args.min_cosine
+        rows.append(row)
+        timings = "  ".join(f"b{b}={row[f'ms_per_face_b{b}']:.2f}ms/face" for b in args.batch_sizes)
+        print(f"{name:<12} cos min={row['min_cosine']:.4f} mean={row['mean_cosine']:.4f}  {timings}"
+              f"{'' if row['ok'] else '  (below parity threshold)'}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
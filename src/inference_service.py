@@ -0,0 +1,381 @@
+import itertools
+import threading
+import time
+
+from pipeline import StageStats
+
+
+class _Request:
+    def __init__(self, op, frame, min_prob=0.0, rois=None, boxes=None, adaptive=None):
+        self.op = op                # "detect_and_embed", "detect" or "embed"
+        self.frame = frame
+        self.min_prob = min_prob
+        self.rois = rois
+        self.boxes = boxes
+        self.adaptive = adaptive
+        self.submitted = time.perf_counter()
+        self.result = None
+        self.done = threading.Event()
+
+
+# What a request yields when its model call raises, matching FaceDetector's own error results
+_FAILED = {"detect_and_embed": (None, None, None), "detect": (None, None), "embed": None}
+
+
+class Session:
+    """
+    One viewer's handle on the service. Holds at most one pending frame:
+    a newer frame replaces (sheds) an older one that has not been picked up yet.
+
+    A session that was expired for being idle is re-admitted by its next
+    submit() when there is room; one closed with close() stays closed.
+    """
+    def __init__(self, service, session_id):
+        self.service = service
+        self.id = session_id
+        self.pending = None
+        self.last_active = time.time()
+        self.expired = False
+        self.closed = False
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.latency = StageStats()
+
+    def submit(self, frame, min_prob=0.0, timeout=None, adaptive=None):
+        return self.service.submit(self, frame, min_prob=min_prob, timeout=timeout, adaptive=adaptive)
+
+    def detect(self, frame, rois=None, adaptive=None, timeout=None):
+        return self.service.detect(self, frame, rois=rois, adaptive=adaptive, timeout=timeout)
+
+    def get_embeddings(self, frame, boxes, timeout=None):
+        return self.service.get_embeddings(self, frame, boxes, timeout=timeout)
+
+    def heartbeat(self):
+        """
+        Keeps the session from expiring while the caller is alive but not submitting.
+        """
+        self.last_active = time.time()
+
+    def close(self):
+        self.service.close_session(self)
+
+
+class InferenceService:
+    """
+    In-process inference front end shared by every browser session.
+
+    - Admission: at most `max_sessions` sessions; open_session() returns None beyond that.
+      Sessions idle for `idle_timeout` give up their place until they submit again.
+    - Per-session queues of depth one, so a slow server never builds a backlog.
+    - Fair scheduling: workers take one request per session in round-robin
+      order, up to `max_batch` per model call. With `window_ms`, a worker
+      that finds one request waits that long for other sessions' requests
+      so they share the model call (micro-batching). Whole frames, tracker
+      detections and tracker embeddings are batched separately, and requests
+      carrying an adaptive detection policy only with the same policy.
+    - Load shedding: frames replaced by a newer one, or older than
+      `max_wait_ms` when a worker reaches them, are dropped and their
+      callers get None straight away.
+
+    With more viewers each one gets fewer processed frames per second,
+    while latency stays bounded.
+    """
+
+    def __init__(self, run_batch, max_sessions=8, max_batch=8, max_wait_ms=250, workers=1, idle_timeout=15.0,
+                 window_ms=0, run_detect=None, run_embed=None, on_close=None):
+        """
+        :param run_batch: callable(frames, min_probs, adaptive, streams) -> list of (boxes, probs, embeddings).
+                          `streams` are the requesting session ids.
+        :param run_detect: callable(frames, rois, adaptive, streams) -> list of (boxes, probs), for SessionDetector.
+        :param run_embed: callable(frames, boxes, streams) -> list of embeddings, for SessionDetector.
+        :param workers: threads calling run_batch concurrently.
+        :param idle_timeout: sessions that submit nothing for this long are closed.
+        :param on_close: callable(session_id), called when a session is closed or expires.
+        """
+        self.run_batch = run_batch
+        self.run_detect = run_detect
+        self.run_embed = run_embed
+        self.on_close = on_close
+        self.max_sessions = max_sessions
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.window = window_ms / 1000.0
+        self.idle_timeout = idle_timeout
+        self.num_workers = workers
+
+        self.cond = threading.Condition()
+        self.sessions = []
+        self._ids = itertools.count(1)
+        self._cursor = 0
+        self.rejected = 0
+        self.batch_stats = StageStats()
+        self.running = False
+        self.threads = []
+
+    @classmethod
+    def from_detector(cls, detector, **kwargs):
+        """
+        Serves sessions from an in-process FaceDetector, batching requests across sessions.
+        """
+        def run_batch(frames, min_probs, adaptive, streams):
+            return detector.detect_and_embed_batch(frames, min_probs, adaptive=adaptive)
+
+        def run_detect(frames, rois, adaptive, streams):
+            if adaptive is None and detector.adaptive is None:
+                # ROIs only matter to adaptive detection; equally sized frames share one MTCNN call
+                return detector.detect_batch(frames)
+            return [detector.detect(frame, rois=r, adaptive=adaptive) for frame, r in zip(frames, rois)]
+
+        def run_embed(frames, boxes, streams):
+            return detector.get_embeddings_batch(frames, boxes)
+
+        return cls(run_batch, run_detect=run_detect, run_embed=run_embed, **kwargs)
+
+    @classmethod
+    def from_process_pool(cls, pool, **kwargs):
+        """
+        Serves sessions from a ProcessPoolDetector, one request per call and one thread per worker process.
+        Each session stays on one worker process until it is closed or expires.
+        """
+        def run_batch(frames, min_probs, adaptive, streams):
+            return [pool.submit(frame, min_prob=min_prob, adaptive=adaptive, stream_id=stream)
+                    for frame, min_prob, stream in zip(frames, min_probs, streams)]
+
+        def run_detect(frames, rois, adaptive, streams):
+            return [pool.detect(frame, rois=r, adaptive=adaptive, stream_id=stream)
+                    for frame, r, stream in zip(frames, rois, streams)]
+
+        def run_embed(frames, boxes, streams):
+            return [pool.get_embeddings(frame, b, stream_id=stream) for frame, b, stream in zip(frames, boxes, streams)]
+
+        kwargs.setdefault("workers", pool.num_workers)
+        kwargs["max_batch"] = 1
+        kwargs["window_ms"] = 0
+        return cls(run_batch, run_detect=run_detect, run_embed=run_embed, on_close=pool.release_stream, **kwargs)
+
+    def start(self):
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+            self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(self.num_workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    # ---------- sessions ----------
+
+    def _expire_idle(self):
+        # Caller holds self.cond
+        now = time.time()
+        for session in [s for s in self.sessions if now - s.last_active > self.idle_timeout]:
+            self._close(session, expired=True)
+
+    def open_session(self):
+        """
+        :return: a new Session, or None when the service is at max_sessions.
+        """
+        with self.cond:
+            self._expire_idle()
+            if len(self.sessions) >= self.max_sessions:
+                self.rejected += 1
+                return None
+            session = Session(self, next(self._ids))
+            self.sessions.append(session)
+        self.start()
+        return session
+
+    def _close(self, session, expired=False):
+        session.expired = expired
+        session.closed = not expired
+        if session in self.sessions:
+            self.sessions.remove(session)
+        if session.pending is not None:
+            session.pending.done.set()
+            session.pending = None
+        if self.on_close is not None:
+            self.on_close(session.id)
+
+    def close_session(self, session):
+        with self.cond:
+            self._close(session)
+
+    # ---------- requests ----------
+
+    def submit(self, session, frame, min_prob=0.0, timeout=None, adaptive=None):
+        """
+        Blocks until the frame is processed.
+        :return: (boxes, probs, embeddings), or None if the frame was shed,
+                 the session is closed, the service is full, or the timeout expired.
+        """
+        return self._enqueue(session, _Request("detect_and_embed", frame, min_prob=min_prob, adaptive=adaptive),
+                             timeout)
+
+    def detect(self, session, frame, rois=None, adaptive=None, timeout=None):
+        """
+        :return: (boxes, probs), or None under the same conditions as submit().
+        """
+        return self._enqueue(session, _Request("detect", frame, rois=rois, adaptive=adaptive), timeout)
+
+    def get_embeddings(self, session, frame, boxes, timeout=None):
+        """
+        :return: embeddings of `boxes`, or None under the same conditions as submit().
+        """
+        return self._enqueue(session, _Request("embed", frame, boxes=boxes), timeout)
+
+    def _enqueue(self, session, request, timeout):
+        with self.cond:
+            if session not in self.sessions:
+                # Re-admit a session that only expired for being idle, if there is room
+                if session.closed or len(self.sessions) >= self.max_sessions:
+                    return None
+                session.expired = False
+                self.sessions.append(session)
+            session.last_active = time.time()
+            session.submitted += 1
+            if session.pending is not None:
+                # Newest request wins; the waiting caller gets None right away
+                session.pending.done.set()
+                session.dropped += 1
+            session.pending = request
+            self.cond.notify()
+        request.done.wait(timeout)
+        return request.result
+
+    def _next_batch(self):
+        """
+        Takes up to max_batch fresh requests, one per session, continuing the round-robin.
+        :return: list of (session, request)
+        """
+        with self.cond:
+            while self.running:
+                self._wait_for_batch()
+                now = time.perf_counter()
+                batch = []
+                n = len(self.sessions)
+                for step in range(n):
+                    session = self.sessions[(self._cursor + step) % n]
+                    request = session.pending
+                    if request is None:
+                        continue
+                    session.pending = None
+                    if now - request.submitted > self.max_wait:
+                        session.dropped += 1
+                        request.done.set()
+                        continue
+                    batch.append((session, request))
+                    if len(batch) >= self.max_batch:
+                        self._cursor = (self._cursor + step + 1) % n
+                        break
+                else:
+                    self._cursor = (self._cursor + 1) % n if n else 0
+                if batch:
+                    return batch
+                self.cond.wait(0.5)
+                self._expire_idle()
+            return []
+
+    def _wait_for_batch(self):
+        # Caller holds self.cond. Once one request is pending, give the other
+        # sessions up to `window` seconds to add theirs to the same batch.
+        if not self.window or len(self.sessions) < 2 or self.max_batch < 2:
+            return
+        if not any(s.pending is not None for s in self.sessions):
+            return
+        wanted = min(self.max_batch, len(self.sessions))
+        deadline = time.perf_counter() + self.window
+        while self.running and sum(s.pending is not None for s in self.sessions) < wanted:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            self.cond.wait(remaining)
+
+    def _run(self):
+        while self.running:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            start = time.perf_counter()
+            groups = {}
+            for session, request in batch:
+                groups.setdefault((request.op, id(request.adaptive)), []).append((session, request))
+            for (op, _), group in groups.items():
+                self._run_group(op, group)
+            finished = time.perf_counter()
+            self.batch_stats.record(finished - start)
+
+            for session, request in batch:
+                session.processed += 1
+                session.latency.record(finished - request.submitted)
+                request.done.set()
+
+    def _run_group(self, op, group):
+        requests = [request for _, request in group]
+        frames = [r.frame for r in requests]
+        streams = [session.id for session, _ in group]
+        adaptive = requests[0].adaptive
+        try:
+            if op == "detect":
+                results = self.run_detect(frames, [r.rois for r in requests], adaptive, streams)
+            elif op == "embed":
+                results = self.run_embed(frames, [r.boxes for r in requests], streams)
+            else:
+                results = self.run_batch(frames, [r.min_prob for r in requests], adaptive, streams)
+        except Exception as e:
+            print(f"Error during shared inference: {e}")
+            results = [_FAILED[op]] * len(requests)
+        for request, result in zip(requests, results):
+            request.result = result
+
+    def stats(self):
+        with self.cond:
+            sessions = list(self.sessions)
+            rejected = self.rejected
+        return {
+            "sessions": len(sessions),
+            "max_sessions": self.max_sessions,
+            "rejected": rejected,
+            "batch": self.batch_stats.snapshot(),
+            "per_session": [{
+                "id": s.id,
+                "submitted": s.submitted,
+                "processed": s.processed,
+                "dropped": s.dropped,
+                "p95_ms": s.latency.snapshot()["p95_ms"],
+            } for s in sessions],
+        }
+
+
+class SessionDetector:
+    """
+    FaceDetector stand-in for one session's FaceTracker: detect() and
+    get_embeddings() are queued on the session, so tracking sessions get the
+    same fair scheduling, shedding and admission as sessions submitting whole
+    frames, and share model calls with other sessions' requests. A shed
+    detect() returns None, which the tracker treats as "no detection this frame".
+    """
+
+    def __init__(self, session, detector, timeout=1.0):
+        self.session = session
+        self.detector = detector
+        self.timeout = timeout
+
+    def detect(self, frame, frame_rgb=None, rois=None, adaptive=None):
+        return self.session.detect(frame, rois=rois, adaptive=adaptive, timeout=self.timeout)
+
+    def get_embeddings(self, frame, boxes, frame_rgb=None):
+        if boxes is None or len(boxes) == 0:
+            return None
+        return self.session.get_embeddings(frame, boxes, timeout=self.timeout)
+
+    def __getattr__(self, name):
+        # Everything else (draw_boxes, label_renderer, ...) is the shared detector's
+        return getattr(self.detector, name)
@@ -1,3 +1,4 @@
+from model_loader import ModelLoader
 import streamlit as st
 from streamlit_webrtc import webrtc_streamer, VideoTransformerBase, RTCConfiguration, VideoProcessorBase, WebRtcMode
 import av
@@ -5,8 +6,15 @@ import cv2
 import threading
 import time
 import numpy as np
-from detector import FaceDetector
+import os
 from face_manager import FaceManager
+from inference_service import InferenceService, SessionDetector
+from process_pool import ProcessPoolDetector
+from tracker import FaceTracker
+from motion_gate import MotionGate
+from async_recognition import AsyncRecognizer
+from adaptive_detection import AdaptiveDetection
+import metrics
 
 # Define RTC Configuration (STUN server is needed for cloud deployment)
 RTC_CONFIGURATION = RTCConfiguration(
@@ -17,26 +25,79 @@ class VideoProcessor(VideoProcessorBase):
     def __init__(self):
         self.detector = None
         self.face_manager = None
+        self.service = None
+        self.session = None
+        self.last_result = (None, None, None, [])
+        self.tracker = None
+        self.loader = None
         
         # State for registration
         self.register_name = None
         self.should_register = False
         self.registration_result = None
         self.lock = threading.Lock()
+        # _infer touches the tracker, motion gate and last result; the async worker and recv must take turns
+        self.infer_lock = threading.Lock()
         
         # Settings
         self.confidence_threshold = 0.9
         self.recognition_threshold = 0.8
         self.run_detection = True
+        self.use_tracking = True
+        self.detect_every = 10
+        self.motion_gate = None
+        self.async_mode = False
+        self.extrapolate = True
+        self.recognizer = None
+        # This viewer's adaptive detection policy; the detector itself is shared by every session
+        self.adaptive = None
 
-    def initialize_resources(self, detector, face_manager):
+    def initialize_resources(self, detector, face_manager, service=None):
         self.detector = detector
         self.face_manager = face_manager
+        self.service = service
+        if service is not None and self.session is None:
+            # None while the service is full; retried on the next rerun
+            self.session = service.open_session()
 
-    def update_settings(self, run_detection, confidence, recognition):
+    def on_ended(self):
+        with self.lock:
+            recognizer, self.recognizer = self.recognizer, None
+        if recognizer is not None:
+            recognizer.stop()
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def update_settings(self, run_detection, confidence, recognition, use_tracking=True, detect_every=10,
+                        use_motion_gate=True, motion_sensitivity=0.5, async_mode=False, extrapolate=True,
+                        adaptive_detection=False, detect_target_ms=40):
         self.run_detection = run_detection
         self.confidence_threshold = confidence
         self.recognition_threshold = recognition
+        self.use_tracking = use_tracking
+        self.detect_every = detect_every
+        self.extrapolate = extrapolate
+        self.adaptive = configure_adaptive_detection(self.adaptive, adaptive_detection, detect_target_ms)
+        if not async_mode:
+            # Swapped out under the lock so recv never sees a half-torn-down recognizer;
+            # stopped (and joined) afterwards, since its worker may be waiting on the lock in _infer.
+            # Only then does recv start calling _infer itself.
+            with self.lock:
+                recognizer, self.recognizer = self.recognizer, None
+            if recognizer is not None:
+                recognizer.stop()
+        self.async_mode = async_mode
+        if self.tracker is not None:
+            self.tracker.min_prob = confidence
+            self.tracker.detect_every = detect_every
+            self.tracker.adaptive = self.adaptive
+        if not use_motion_gate:
+            self.motion_gate = None
+        elif self.motion_gate is None:
+            self.motion_gate = MotionGate(sensitivity=motion_sensitivity)
+        else:
+            self.motion_gate.set_sensitivity(motion_sensitivity)
 
     def trigger_registration(self, name):
         with self.lock:
@@ -53,6 +114,10 @@ class VideoProcessor(VideoProcessorBase):
             return None
 
     def recv(self, frame):
+        with metrics.timer("webrtc.recv"):
+            return self._process(frame)
+
+    def _process(self, frame):
         img = frame.to_ndarray(format="bgr24")
         
         # We need to initialize resources inside the process if not passed, 
@@ -62,54 +127,106 @@ class VideoProcessor(VideoProcessorBase):
         # if they are not thread-safe, but FaceDetector is mostly read-only after init.
         # Actually, creating detector inside __init__ of processor is safer for threading.
         
+        if self.loader is not None:
+            self.loader.mark_first_frame(with_detection=False)
         if self.detector is None or self.face_manager is None:
-            # If not initialized yet, skip processing to avoid race conditions or duplicate loads
+            # Models still loading (or not passed in yet): show the camera as is
             return av.VideoFrame.from_ndarray(img, format="bgr24")
-
-        # Detection Logic
-        face_count = 0
-        names = []
-        boxes = None
-        probs = None
+        if self.service is not None and self.session is None:
+            # Admission control: too many viewers, so this one gets the plain camera
+            self.detector.label_renderer.draw(img, "접속자가 많아 얼굴 인식이 일시 중지되었습니다", (10, 10))
+            return av.VideoFrame.from_ndarray(img, format="bgr24")
+        if self.session is not None:
+            # Still connected, even when the motion gate or a disabled toggle means nothing is submitted
+            self.session.heartbeat()
 
         if self.run_detection:
-            boxes, probs = self.detector.detect(img)
-            
-            if boxes is not None:
-                # Filter
-                valid_indices = [i for i, p in enumerate(probs) if p >= self.confidence_threshold]
-                if len(valid_indices) > 0:
-                    boxes = boxes[valid_indices]
-                    probs = probs[valid_indices]
-                    face_count = len(boxes)
-                    
-                    embeddings = self.detector.get_embeddings(img, boxes)
-                    
-                    if embeddings is not None:
-                        for i, emb in enumerate(embeddings):
-                            name, dist = self.face_manager.match_face(emb, threshold=self.recognition_threshold)
-                            names.append(f"{name} ({dist:.2f})")
-                        
-                        # Registration Logic
-                        with self.lock:
-                            if self.should_register and self.register_name:
-                                if len(embeddings) == 1:
-                                    self.face_manager.add_face(self.register_name, embeddings[0])
-                                    self.registration_result = f"SUCCESS:{self.register_name}"
-                                    self.should_register = False
-                                    self.register_name = None
-                                elif len(embeddings) > 1:
-                                    self.registration_result = "ERROR:Too many faces"
-                                    self.should_register = False # One try per click
-                                else:
-                                    # No face found (unexpected here)
-                                    pass
+            if self.async_mode:
+                # Hand the frame to the worker and draw whatever it finished last
+                with self.lock:
+                    recognizer = self.recognizer
+                    if recognizer is None:
+                        recognizer = self.recognizer = AsyncRecognizer(self._infer, extrapolate=self.extrapolate)
+                recognizer.extrapolate = self.extrapolate
+                recognizer.submit(img.copy())
+                boxes, probs, embeddings, matches = recognizer.latest()
+            else:
+                boxes, probs, embeddings, matches = self._infer(img)
+        else:
+            boxes, probs, embeddings, matches = None, None, None, []
+
+        names = []
+        if boxes is not None and embeddings is not None:
+            names = [f"{name} ({dist:.2f})" for name, dist in matches]
 
         # Draw
         img = self.detector.draw_boxes(img, boxes, probs, names)
+        if self.run_detection and self.loader is not None:
+            self.loader.mark_first_frame(with_detection=True)
         
         return av.VideoFrame.from_ndarray(img, format="bgr24")
 
+    def _infer(self, img):
+        """
+        Detection, embedding, matching and registration for one frame.
+        :return: (boxes, probs, embeddings, matches)
+        """
+        # A recognizer recv created just before async mode was switched off may still be
+        # running, so calls are serialized rather than relying on the switch-over order
+        with self.infer_lock:
+            return self._infer_frame(img)
+
+    def _infer_frame(self, img):
+        # Picks up identities bulk_enroll.py (or another process) added to the store
+        self.face_manager.refresh(min_interval=2.0)
+        if self.motion_gate is not None and not self.motion_gate.check(img):
+            # Nothing moved: reuse the last result instead of running the models
+            return self.last_result
+        if self.use_tracking:
+            # Per-session tracker: full detection every N frames, cached identities in between
+            if self.tracker is None:
+                # Through the shared service when there is one, so tracking sessions are scheduled fairly too
+                detector = self.detector if self.session is None else SessionDetector(self.session, self.detector)
+                self.tracker = FaceTracker(detector, self.face_manager,
+                                           detect_every=self.detect_every,
+                                           min_prob=self.confidence_threshold,
+                                           adaptive=self.adaptive)
+            boxes, probs, embeddings, matches = self.tracker.process(img, self.recognition_threshold)
+        else:
+            # Detection + confidence filter + embedding, scheduled fairly across sessions when shared
+            # (a session with its own adaptive policy only shares model calls with itself)
+            if self.session is not None:
+                result = self.session.submit(img, min_prob=self.confidence_threshold, timeout=1.0,
+                                             adaptive=self.adaptive)
+            else:
+                result = self.detector.detect_and_embed(img, min_prob=self.confidence_threshold,
+                                                        adaptive=self.adaptive)
+            if result is None:
+                # Shed under load: keep showing the faces from the last processed frame
+                return self.last_result
+            boxes, probs, embeddings = result
+            matches = []
+            if embeddings is not None:
+                matches = self.face_manager.match_faces(embeddings, threshold=self.recognition_threshold)
+        self.last_result = (boxes, probs, embeddings, matches)
+
+        # Registration Logic
+        if boxes is not None and embeddings is not None:
+            with self.lock:
+                if self.should_register and self.register_name:
+                    if len(embeddings) == 1:
+                        self.face_manager.add_face(self.register_name, embeddings[0])
+                        self.registration_result = f"SUCCESS:{self.register_name}"
+                        self.should_register = False
+                        self.register_name = None
+                    elif len(embeddings) > 1:
+                        self.registration_result = "ERROR:Too many faces"
+                        self.should_register = False # One try per click
+                    else:
+                        # No face found (unexpected here)
+                        pass
+        return self.last_result
+
 def main():
     st.set_page_config(page_title="얼굴 인식 대시보드 (WebRTC)", layout="wide")
     st.title("얼굴 인식 대시보드 (WebRTC)")
@@ -120,6 +237,20 @@ def main():
     run_detection = st.sidebar.checkbox("얼굴 인식 실행", value=True)
     confidence_threshold = st.sidebar.slider("탐지 정확도 임계값", 0.0, 1.0, 0.9)
     recognition_threshold = st.sidebar.slider("인식 거리 임계값", 0.0, 1.5, 0.8)
+    use_tracking = st.sidebar.checkbox("추적 모드 (N 프레임마다 탐지)", value=True)
+    detect_every = st.sidebar.slider("탐지 주기 (프레임)", 1, 30, 10, disabled=not use_tracking)
+    adaptive_detection = st.sidebar.checkbox("적응형 탐지 (축소 해상도/관심 영역)", value=False)
+    detect_target_ms = st.sidebar.slider("탐지 목표 지연 (ms)", 10, 200, 40, disabled=not adaptive_detection)
+    use_motion_gate = st.sidebar.checkbox("움직임이 있을 때만 탐지", value=True)
+    motion_sensitivity = st.sidebar.slider("움직임 민감도", 0.0, 1.0, 0.5, disabled=not use_motion_gate)
+    async_mode = st.sidebar.checkbox("비동기 인식 (영상은 카메라 속도로 표시)", value=False)
+    extrapolate = st.sidebar.checkbox("박스 위치 보정 (움직임 예측)", value=True, disabled=not async_mode)
+    # FACE_METRICS_PORT also exposes /metrics and /metrics.json on that port
+    metrics.serve_from_env()
+    if st.sidebar.checkbox("성능 계측 (단계별 지연)", value=metrics.is_enabled()):
+        metrics.enable()
+    else:
+        metrics.disable()
 
     st.sidebar.markdown("---")
     st.sidebar.subheader("새 얼굴 등록")
@@ -131,7 +262,9 @@ def main():
     st.sidebar.subheader("등록된 얼굴 관리")
     
     fm = load_face_manager()
-    registered_names = list(fm.faces.keys())
+    # Identities enrolled by other processes, e.g. bulk_enroll.py
+    fm.refresh()
+    registered_names = list(fm.identities())
     
     # ... Deletion Logic same as before ...
     if registered_names:
@@ -144,6 +277,9 @@ def main():
                      time.sleep(0.5)
                      st.rerun()
 
+    # Models load on a background thread so the page and the camera come up immediately
+    loader = load_models()
+
     col1, col2 = st.columns([2, 1])
     
     with col1:
@@ -162,10 +298,15 @@ def main():
         
         # Communicate with Processor
         if ctx.video_processor:
-            # Pass shared resources to processor
-            ctx.video_processor.initialize_resources(load_detector_v2(), load_face_manager())
+            # Pass shared resources to processor once the background model load has finished
+            ctx.video_processor.loader = loader
+            if loader.ready:
+                detector = loader.detector
+                ctx.video_processor.initialize_resources(detector, load_face_manager(), load_inference_service(detector))
             # Update settings
-            ctx.video_processor.update_settings(run_detection, confidence_threshold, recognition_threshold)
+            ctx.video_processor.update_settings(run_detection, confidence_threshold, recognition_threshold,
+                                                use_tracking, detect_every, use_motion_gate, motion_sensitivity,
+                                                async_mode, extrapolate, adaptive_detection, detect_target_ms)
             
             # Retrieve FaceManager/Detector if not initialized? 
             # Actually we can't easily pass local objects to the processor if it runs in a thread 
@@ -192,17 +333,82 @@ def main():
                         st.warning("등록 시간이 초과되었습니다. 다시 시도해 주세요.")
 
     with col2:
+        if loader.ready:
+            st.markdown(loader.status_text())
+        else:
+            model_status_panel(loader)
+        if ctx.video_processor and use_motion_gate:
+            motion_gate_panel(ctx.video_processor)
         st.subheader("안내")
         st.info("WebRTC 모드는 서버가 아닌 사용자의 브라우저를 통해 카메라를 연결합니다. 따라서 배포 환경에서도 작동합니다.")
         st.warning("⚠️ 주의: `localhost` 또는 `127.0.0.1`이 아닌 주소(예: 내부 IP)로 접속 시, HTTPS 보안 연결이 없으면 브라우저가 카메라 접근을 차단할 수 있습니다.")
+        if metrics.is_enabled():
+            latency_panel()
+
+@st.fragment(run_every=1.0)
+def model_status_panel(loader):
+    st.markdown(loader.status_text())
+    if loader.ready:
+        # Rerun the whole page so the processor receives the loaded models
+        st.rerun()
+
+@st.fragment(run_every=1.0)
+def motion_gate_panel(processor):
+    # This viewer's gate lives in the WebRTC worker; read its counters every second
+    gate = processor.motion_gate
+    if gate is not None:
+        st.markdown(f"**건너뛴 프레임 (움직임 없음):** {gate.skipped} / {gate.frames}")
+
+@st.fragment(run_every=1.0)
+def latency_panel():
+    # Reruns on its own every second; recv() keeps running in the WebRTC worker thread
+    st.subheader("단계별 지연 시간")
+    st.markdown(metrics.latency_table())
+    loader = load_models()
+    if loader.ready:
+        stats = load_inference_service(loader.detector).stats()
+        st.markdown(f"**접속 세션:** {stats['sessions']} / {stats['max_sessions']} (거절 {stats['rejected']})")
+        rows = ["| 세션 | 처리 | 버린 프레임 | p95 (ms) |", "|---|---|---|---|"]
+        for s in stats["per_session"]:
+            rows.append(f"| {s['id']} | {s['processed']} | {s['dropped']} | {s['p95_ms']:.0f} |")
+        st.markdown("\n".join(rows))
+
+def configure_adaptive_detection(adaptive, enabled, target_ms):
+    """
+    :return: the caller's AdaptiveDetection policy, or None when disabled.
+    """
+    # Keep the existing policy across reruns so its tuned settings survive
+    if not enabled:
+        return None
+    if adaptive is None:
+        return AdaptiveDetection(target_ms=target_ms)
+    adaptive.target_ms = target_ms
+    return adaptive
+
+@st.cache_resource
+def load_models():
+    # Started once per server process; FACE_WARMUP=0 skips the warmup inference
+    return ModelLoader().start()
 
 @st.cache_resource
-def load_detector_v2():
-    return FaceDetector()
+def load_inference_service(_detector):
+    # One service for every browser session: FACE_MAX_SESSIONS caps concurrent viewers.
+    # FACE_INFERENCE_WORKERS=N runs inference in N processes (one model copy each);
+    # otherwise requests from all sessions are batched through the shared detector
+    max_sessions = int(os.environ.get("FACE_MAX_SESSIONS", "8"))
+    workers = int(os.environ.get("FACE_INFERENCE_WORKERS", "0"))
+    if workers > 0:
+        threads = int(os.environ.get("FACE_TORCH_THREADS", "1"))
+        pool = ProcessPoolDetector(num_workers=workers, torch_threads=threads)
+        return InferenceService.from_process_pool(pool, max_sessions=max_sessions)
+    # FACE_BATCH_WINDOW_MS lets a worker wait briefly so more sessions share one model call
+    window_ms = float(os.environ.get("FACE_BATCH_WINDOW_MS", "10"))
+    return InferenceService.from_detector(_detector, max_sessions=max_sessions, max_batch=8, window_ms=window_ms)
 
 @st.cache_resource
 def load_face_manager():
-    return FaceManager()
+    # FACE_GALLERY_PRECISION=float16|int8 keeps a compact gallery with exact float32 re-ranking
+    return FaceManager(precision=os.environ.get("FACE_GALLERY_PRECISION", "float32"))
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,15 @@
 import streamlit as st
 import cv2
 import time
+from model_loader import ModelLoader
 from camera import Camera
-from detector import FaceDetector
 from face_manager import FaceManager
+from tracker import FaceTracker
+from adaptive_detection import AdaptiveDetection
+from pipeline import FacePipeline
+from motion_gate import MotionGate
+from mjpeg_stream import stream_configured, streamer_from_env
+import metrics
 import numpy as np
 import os
 
@@ -24,6 +30,23 @@ def main():
     run_detection = st.sidebar.checkbox("얼굴 인식 실행", value=True)
     confidence_threshold = st.sidebar.slider("탐지 정확도 임계값", 0.0, 1.0, 0.9)
     recognition_threshold = st.sidebar.slider("인식 거리 임계값", 0.0, 1.5, 0.8)
+    use_tracking = st.sidebar.checkbox("추적 모드 (N 프레임마다 탐지)", value=True)
+    detect_every = st.sidebar.slider("탐지 주기 (프레임)", 1, 30, 10, disabled=not use_tracking)
+    adaptive_detection = st.sidebar.checkbox("적응형 탐지 (축소 해상도/관심 영역)", value=False)
+    detect_target_ms = st.sidebar.slider("탐지 목표 지연 (ms)", 10, 200, 40, disabled=not adaptive_detection)
+    use_pipeline = st.sidebar.checkbox("파이프라인 모드 (단계별 스레드)", value=False)
+    use_motion_gate = st.sidebar.checkbox("움직임이 있을 때만 탐지", value=True)
+    motion_sensitivity = st.sidebar.slider("움직임 민감도", 0.0, 1.0, 0.5, disabled=not use_motion_gate)
+    # Opt-in unless the stream address is configured: the default localhost URL breaks remote viewers
+    use_stream = st.sidebar.checkbox("MJPEG 스트림으로 표시", value=stream_configured(),
+                                     help="브라우저가 이 컴퓨터가 아니면 FACE_STREAM_HOST/FACE_STREAM_URL을 설정하세요.")
+    jpeg_quality = st.sidebar.slider("JPEG 품질", 30, 95, 80, disabled=not use_stream)
+    # FACE_METRICS_PORT also exposes /metrics and /metrics.json on that port
+    metrics.serve_from_env()
+    if st.sidebar.checkbox("성능 계측 (단계별 지연)", value=metrics.is_enabled()):
+        metrics.enable()
+    else:
+        metrics.disable()
     
     st.sidebar.markdown("---")
     st.sidebar.subheader("새 얼굴 등록")
@@ -36,7 +59,9 @@ def main():
     st.sidebar.subheader("등록된 얼굴 관리")
     
     fm = load_face_manager()
-    registered_names = list(fm.faces.keys())
+    # Identities enrolled by other processes, e.g. bulk_enroll.py
+    fm.refresh()
+    registered_names = list(fm.identities())
     
     # Session state for delete selection to handle updates properly
     if "delete_selected" not in st.session_state:
@@ -92,10 +117,18 @@ def main():
 
     with col2:
         st.subheader("탐지 상태")
+        status_placeholder = st.empty()
         stats_placeholder = st.empty()
+        metrics_placeholder = st.empty()
         
     # Load resources
-    detector = load_detector_v2()
+    # Models load on a background thread; the camera view works before they are ready
+    loader = load_models()
+    status_placeholder.markdown(loader.status_text())
+    detector = loader.detector
+    # Per browser session: the cached detector is shared by every open tab
+    adaptive = configure_adaptive_detection(st.session_state.get("adaptive"), adaptive_detection, detect_target_ms)
+    st.session_state.adaptive = adaptive
     face_manager = load_face_manager() # This is cached, so it might return old object if we don't clear cache?
     # Actually, load_face_manager returns a new instance if not cached, but it is cached.
     # FaceManager handles file I/O on init. If we delete, we update the object status.
@@ -104,80 +137,264 @@ def main():
     
     camera = st.session_state.camera
 
-    if run_camera:
+    streamer = None
+    if run_camera and use_stream:
+        try:
+            streamer = load_streamer()
+        except OSError as e:
+            st.warning(f"MJPEG 스트림을 시작하지 못해 기본 표시 방식을 사용합니다: {e}")
+    if streamer is not None:
+        streamer.quality = jpeg_quality
+        # The browser pulls frames from the stream server directly; Streamlit only carries this tag
+        placeholder.markdown(f'<img src="{streamer.public_url}" style="width:100%">', unsafe_allow_html=True)
+
+    # Stop a pipeline left over from a previous run if it is no longer wanted
+    if (not run_camera or not use_pipeline) and st.session_state.get("pipeline") is not None:
+        st.session_state.pipeline.stop()
+        st.session_state.pipeline = None
+
+    if run_camera and use_pipeline:
+        if not camera.running:
+            camera.start()
+        if detector is None:
+            with st.spinner("모델을 준비하는 중입니다..."):
+                detector = loader.wait()
+            if detector is None:
+                st.error(loader.status_text())
+                return
+        motion_gate = MotionGate(sensitivity=motion_sensitivity) if use_motion_gate else None
+        run_pipeline(camera, detector, face_manager, placeholder, stats_placeholder, metrics_placeholder,
+                     run_detection, confidence_threshold, recognition_threshold,
+                     new_name if register_button else None, motion_gate, streamer, adaptive)
+    elif run_camera:
         if not camera.running:
             camera.start()
         
         registered_in_this_run = False
+        tracker = None
+        motion_gate = MotionGate(sensitivity=motion_sensitivity) if use_motion_gate else None
+        last_result = (None, None, None, [])
         
         # Main Loop
+        last_seq = 0
+        metrics_panel = MetricsPanel(metrics_placeholder)
+        stats_panel = ThrottledMarkdown(stats_placeholder)
+        status = loader.status_text()
         while run_camera:
-            frame = camera.get_frame()
-            if frame is None:
-                time.sleep(0.1)
+            # Sleeps until the camera publishes a frame we haven't processed yet
+            lease = camera.wait_for_frame(last_seq, timeout=1.0)
+            if lease is None:
                 continue
+            last_seq = lease.seq
+            frame_start = time.perf_counter()
+            # Picks up identities bulk_enroll.py (or another process) added to the store
+            face_manager.refresh(min_interval=2.0)
+
+            if detector is None and loader.ready:
+                # Models finished loading while frames were already being shown
+                detector = loader.detector
+            if tracker is None and use_tracking and detector is not None:
+                tracker = FaceTracker(detector, face_manager, detect_every=detect_every,
+                                      min_prob=confidence_threshold, adaptive=adaptive)
             
-            # Application Logic
-            face_count = 0
-            names = []
+            with lease:
+                # Read-only view into the camera ring buffer; no per-frame copy
+                frame = lease.image
+                
+                # Application Logic
+                face_count = 0
+                names = []
             
-            boxes = None
-            probs = None
+                boxes = None
+                probs = None
             
-            if run_detection:
-                boxes, probs = detector.detect(frame)
+                if run_detection and detector is not None:
+                    if motion_gate is not None and not motion_gate.check(frame):
+                        # Nothing moved: reuse the last result instead of running the models
+                        boxes, probs, embeddings, matches = last_result
+                    elif tracker is not None:
+                        # Tracks carry their cached embedding and identity between detections
+                        boxes, probs, embeddings, matches = tracker.process(frame, recognition_threshold)
+                    else:
+                        # Detection + confidence filter + embedding (the RGB frame is converted once)
+                        boxes, probs, embeddings = detector.detect_and_embed(frame, min_prob=confidence_threshold,
+                                                                             adaptive=adaptive)
+                        matches = []
+                        if embeddings is not None:
+                            matches = face_manager.match_faces(embeddings, threshold=recognition_threshold)
+                    last_result = (boxes, probs, embeddings, matches)
                 
-                if boxes is not None:
-                    valid_indices = [i for i, p in enumerate(probs) if p >= confidence_threshold]
-                    if len(valid_indices) > 0:
-                        boxes = boxes[valid_indices]
-                        probs = probs[valid_indices]
-                        
+                    if boxes is not None:
                         face_count = len(boxes)
-                        
-                        embeddings = detector.get_embeddings(frame, boxes)
-                        
+                    
                         if embeddings is not None:
-                            for i, emb in enumerate(embeddings):
-                                name, dist = face_manager.match_face(emb, threshold=recognition_threshold)
+                            for name, dist in matches:
                                 names.append(f"{name} ({dist:.2f})")
-                            
+                        
                             if register_button and new_name and not registered_in_this_run:
-                                if len(embeddings) == 1:
-                                    face_manager.add_face(new_name, embeddings[0])
-                                    st.toast(f"{new_name} 등록 완료!", icon="✅")
-                                    registered_in_this_run = True
-                                    # Force UI update to show new name in list
-                                    time.sleep(1)
-                                    st.rerun()
-                                elif len(embeddings) > 1:
-                                    st.toast("얼굴이 너무 많습니다! 한 명만 나오게 해주세요.", icon="⚠️")
-                                    registered_in_this_run = True 
-                                else:
-                                    pass
-
-            # Draw
-            frame = detector.draw_boxes(frame, boxes, probs, names)
+                                registered_in_this_run = try_register(face_manager, new_name, embeddings)
+
+                # The output copy (RGB conversion, or a BGR copy for JPEG) is the only one; the slot is released after it
+                output = frame.copy() if streamer is not None else cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+            # Draw (boxes and labels are pure green, so drawing on RGB looks the same)
+            if detector is not None:
+                output = detector.draw_boxes(output, boxes, probs, names)
 
             # Display
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            placeholder.image(frame_rgb, channels="RGB", width="stretch")
-            
-            stats_placeholder.markdown(f"**탐지된 얼굴 수:** {face_count}\n\n**식별됨:** {', '.join(names)}")
+            with metrics.timer("ui.display"):
+                if streamer is not None:
+                    # Encoded and sent by the stream threads; never blocks this loop
+                    streamer.publish(output)
+                else:
+                    placeholder.image(output, channels="RGB", width="stretch")
+            loader.mark_first_frame(with_detection=False)
+            if run_detection and detector is not None:
+                loader.mark_first_frame(with_detection=True)
+            if loader.status_text() != status:
+                status = loader.status_text()
+                status_placeholder.markdown(status)
             
-            time.sleep(0.01) 
+            stats_text = f"**탐지된 얼굴 수:** {face_count}\n\n**식별됨:** {', '.join(names)}"
+            if motion_gate is not None:
+                stats_text += f"\n\n**건너뛴 프레임 (움직임 없음):** {motion_gate.skipped} / {motion_gate.frames}"
+            if streamer is not None:
+                stats_text += "\n\n" + streamer.stats_markdown()
+            stats_panel.update(stats_text)
+            metrics.observe("ui.frame", time.perf_counter() - frame_start)
+            metrics_panel.update()
     else:
         if camera.running:
             camera.stop()
         placeholder.info("카메라가 꺼져 있습니다.")
 
+def configure_adaptive_detection(adaptive, enabled, target_ms):
+    """
+    :return: the caller's AdaptiveDetection policy, or None when disabled.
+    """
+    # Keep the existing policy across reruns so its tuned settings survive
+    if not enabled:
+        return None
+    if adaptive is None:
+        return AdaptiveDetection(target_ms=target_ms)
+    adaptive.target_ms = target_ms
+    return adaptive
+
+def try_register(face_manager, name, embeddings):
+    """
+    Registers `name` if exactly one face is visible.
+    :return: True once this registration attempt is finished.
+    """
+    if len(embeddings) == 1:
+        face_manager.add_face(name, embeddings[0])
+        st.toast(f"{name} 등록 완료!", icon="✅")
+        # Force UI update to show new name in list
+        time.sleep(1)
+        st.rerun()
+    elif len(embeddings) > 1:
+        st.toast("얼굴이 너무 많습니다! 한 명만 나오게 해주세요.", icon="⚠️")
+        return True
+    return False
+
+def format_stage_stats(stats):
+    lines = ["| 단계 | 평균 (ms) | p95 (ms) | 버린 프레임 |", "|---|---|---|---|"]
+    for stage, s in stats.items():
+        lines.append(f"| {stage} | {s['mean_ms']:.1f} | {s['p95_ms']:.1f} | {s['dropped']} |")
+    return "\n".join(lines)
+
+class ThrottledMarkdown:
+    """
+    Rewrites a placeholder at most once per `interval` seconds, and only when the text changed.
+    """
+    def __init__(self, placeholder, interval=0.5):
+        self.placeholder = placeholder
+        self.interval = interval
+        self.last_update = 0.0
+        self.text = None
+
+    def update(self, text):
+        now = time.time()
+        if text == self.text or now - self.last_update < self.interval:
+            return
+        self.last_update = now
+        self.text = text
+        self.placeholder.markdown(text)
+
+class MetricsPanel:
+    """
+    Per-stage latency table in the right column, redrawn at most once per `interval` seconds.
+    """
+    def __init__(self, placeholder, interval=1.0):
+        self.placeholder = placeholder
+        self.interval = interval
+        self.last_update = 0.0
+
+    def update(self):
+        now = time.time()
+        if not metrics.is_enabled() or now - self.last_update < self.interval:
+            return
+        self.last_update = now
+        self.placeholder.markdown("**단계별 지연 시간**\n\n" + metrics.latency_table())
+
+def run_pipeline(camera, detector, face_manager, placeholder, stats_placeholder, metrics_placeholder,
+                 run_detection, confidence_threshold, recognition_threshold, register_name, motion_gate=None,
+                 streamer=None, adaptive=None):
+    # One pipeline per camera, kept across reruns; settings are updated in place
+    pipeline = st.session_state.get("pipeline")
+    if pipeline is None:
+        pipeline = FacePipeline(camera, detector, face_manager)
+        st.session_state.pipeline = pipeline
+    pipeline.run_detection = run_detection
+    pipeline.motion_gate = motion_gate
+    pipeline.adaptive = adaptive
+    pipeline.confidence_threshold = confidence_threshold
+    pipeline.recognition_threshold = recognition_threshold
+    pipeline.start()
+
+    registered_in_this_run = register_name is None
+    last_seq = 0
+    metrics_panel = MetricsPanel(metrics_placeholder)
+    stats_panel = ThrottledMarkdown(stats_placeholder)
+    while True:
+        packet = pipeline.wait_for_result(last_seq, timeout=1.0)
+        if packet is None:
+            continue
+        last_seq = packet.seq
+        face_manager.refresh(min_interval=2.0)
+
+        names = [f"{name} ({dist:.2f})" for name, dist in packet.matches]
+        if packet.embeddings is not None and not registered_in_this_run:
+            registered_in_this_run = try_register(face_manager, register_name, packet.embeddings)
+
+        if streamer is not None:
+            streamer.publish(packet.output)
+        else:
+            placeholder.image(cv2.cvtColor(packet.output, cv2.COLOR_BGR2RGB), channels="RGB", width="stretch")
+
+        face_count = 0 if packet.boxes is None else len(packet.boxes)
+        skipped = ""
+        if motion_gate is not None:
+            skipped = f"**건너뛴 프레임 (움직임 없음):** {motion_gate.skipped} / {motion_gate.frames}\n\n"
+        stream = "" if streamer is None else streamer.stats_markdown() + "\n\n"
+        stats_panel.update(
+            f"**탐지된 얼굴 수:** {face_count}\n\n**식별됨:** {', '.join(names)}\n\n" + skipped + stream
+            + format_stage_stats(pipeline.stats()))
+        metrics_panel.update()
+
+@st.cache_resource
+def load_models():
+    # Started once per server process; FACE_WARMUP=0 skips the warmup inference
+    return ModelLoader().start()
+
 @st.cache_resource
-def load_detector_v2():
-    return FaceDetector()
+def load_streamer():
+    # One stream server per process; FACE_STREAM_PORT/FACE_STREAM_HOST/FACE_STREAM_URL configure it
+    return streamer_from_env().start()
 
 @st.cache_resource
 def load_face_manager():
-    return FaceManager()
+    # FACE_GALLERY_PRECISION=float16|int8 keeps a compact gallery with exact float32 re-ranking
+    return FaceManager(precision=os.environ.get("FACE_GALLERY_PRECISION", "float32"))
 
 if __name__ == "__main__":
     main()
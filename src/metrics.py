@@ -0,0 +1,250 @@
+"""
+Process-wide timers, counters, gauges and latency histograms.
+
+Disabled by default. While disabled, `timer()` hands back a shared no-op
+context manager and `inc()`/`set_gauge()` return after one flag check, so
+instrumented code pays almost nothing.
+
+    import metrics
+    metrics.enable()                      # or FACE_METRICS=1
+    with metrics.timer("detector.mtcnn"):
+        ...
+    metrics.inc("camera.frames")
+    metrics.serve(port=9109)              # /metrics (Prometheus text), /metrics.json
+"""
+import bisect
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PREFIX = "face_"
+
+_enabled = os.environ.get("FACE_METRICS", "0") not in ("", "0")
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_gauges = {}
+_server = None
+
+
+class Histogram:
+    """
+    Cumulative bucket counts for Prometheus, plus a window of recent samples for percentiles.
+    """
+    def __init__(self, name, window=512):
+        self.name = name
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self.lock:
+            self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+            self.sum += seconds
+            self.count += 1
+            self.recent.append(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            recent = np.array(self.recent) * 1000 if self.recent else np.zeros(1)
+            return {
+                "count": self.count,
+                "sum_s": self.sum,
+                "buckets": list(self.counts),
+                "mean_ms": float(recent.mean()),
+                "p50_ms": float(np.percentile(recent, 50)),
+                "p95_ms": float(np.percentile(recent, 95)),
+                "p99_ms": float(np.percentile(recent, 99)),
+            }
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def histogram(name):
+    h = _histograms.get(name)
+    if h is None:
+        with _lock:
+            h = _histograms.setdefault(name, Histogram(name))
+    return h
+
+
+def timer(name):
+    """
+    `with timer("stage"):` records the block's wall time into histogram `name`.
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(histogram(name))
+
+
+def observe(name, seconds):
+    if _enabled:
+        histogram(name).observe(seconds)
+
+
+def inc(name, amount=1):
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + amount
+
+
+def set_gauge(name, value):
+    if _enabled:
+        _gauges[name] = value
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
+
+
+# ---------- exporters ----------
+
+def snapshot():
+    with _lock:
+        histograms = dict(_histograms)
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+    return {
+        "enabled": _enabled,
+        "timers": {name: h.snapshot() for name, h in sorted(histograms.items())},
+        "counters": dict(sorted(counters.items())),
+        "gauges": dict(sorted(gauges.items())),
+    }
+
+
+def _metric_name(name):
+    return PREFIX + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def prometheus_text():
+    data = snapshot()
+    lines = []
+    for name, value in data["counters"].items():
+        metric = _metric_name(name) + "_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    for name, value in data["gauges"].items():
+        metric = _metric_name(name)
+        lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+    for name, h in data["timers"].items():
+        metric = _metric_name(name) + "_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, count in zip(BUCKETS, h["buckets"]):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{le="+Inf"}} {h["count"]}')
+        lines.append(f"{metric}_sum {h['sum_s']}")
+        lines.append(f"{metric}_count {h['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def latency_table():
+    """
+    Markdown table of per-stage latency for the dashboards.
+    """
+    timers = snapshot()["timers"]
+    if not timers:
+        return "_계측 데이터 없음_"
+    lines = ["| 단계 | 호출 수 | 평균 (ms) | p50 (ms) | p95 (ms) |", "|---|---|---|---|---|"]
+    for name, h in timers.items():
+        lines.append(f"| {name} | {h['count']} | {h['mean_ms']:.1f} | {h['p50_ms']:.1f} | {h['p95_ms']:.1f} |")
+    return "\n".join(lines)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = prometheus_text().encode()
+            content_type = "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body = json.dumps(snapshot(), ensure_ascii=False).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=9109, host="127.0.0.1"):
+    """
+    Starts the exporter on a daemon thread (once per process).
+    :return: the HTTPServer.
+    """
+    global _server
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+            print(f"Metrics exporter listening on http://{host}:{port}/metrics")
+    return _server
+
+
+def serve_from_env():
+    """
+    Starts the exporter if FACE_METRICS_PORT is set (which also enables collection).
+    """
+    port = os.environ.get("FACE_METRICS_PORT")
+    if port:
+        enable()
+        return serve(int(port), os.environ.get("FACE_METRICS_HOST", "127.0.0.1"))
+    return None
@@ -0,0 +1,248 @@
+"""
+MJPEG (multipart/x-mixed-replace) output for the local dashboard.
+
+The dashboard embeds the stream with a plain <img> tag, so frames go
+straight from this server to the browser as JPEG instead of being pushed
+uncompressed through the Streamlit websocket on every tick.
+
+    FACE_STREAM_URL=http://<server>:8765/stream.mjpg FACE_STREAM_HOST=0.0.0.0 streamlit run src/main_local.py
+    curl -s http://127.0.0.1:8765/stream.mjpg --output - | head -c 1000
+"""
+import itertools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+from pipeline import StageStats
+
+BOUNDARY = "frame"
+
+
+class _Viewer:
+    def __init__(self, viewer_id, address):
+        self.id = viewer_id
+        self.address = address
+        self.connected = time.perf_counter()
+        self.frames = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.cpu = 0.0          # seconds of CPU spent in this viewer's send thread
+
+
+class MjpegStreamer:
+    """
+    One encoder thread, any number of viewers.
+
+    publish() only swaps in a reference to the newest frame, so the caller's
+    loop never waits for JPEG encoding. The encoder compresses the newest frame
+    once for all viewers; each viewer thread sends the latest JPEG whenever it
+    is ready for the next one, so frames are dropped for slow clients instead
+    of queueing up.
+    """
+
+    def __init__(self, port=8765, host="127.0.0.1", quality=80, max_fps=30, public_url=None):
+        """
+        :param public_url: stream address as seen by the browser (default: http://localhost:<port>/stream.mjpg).
+        """
+        self.host = host
+        self.port = port
+        self.quality = quality
+        self.max_fps = max_fps
+        self.public_url = public_url or f"http://localhost:{port}/stream.mjpg"
+
+        self.cond = threading.Condition()
+        self._frame = None
+        self._jpeg = None
+        self._seq = 0
+        self.encode_stats = StageStats()
+        self.encode_cpu = 0.0
+        self.encoded = 0
+        self.viewers = {}
+        self._ids = itertools.count(1)
+        self.started = time.perf_counter()
+        self.running = False
+        self.server = None
+
+    def start(self):
+        with self.cond:
+            if self.running:
+                return self
+            self.running = True
+        streamer = self
+
+        class Handler(_StreamHandler):
+            pass
+        Handler.streamer = streamer
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._encode_loop, daemon=True).start()
+        print(f"MJPEG stream on http://{self.host}:{self.port}/stream.mjpg")
+        return self
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def publish(self, frame):
+        """
+        :param frame: BGR image; it must not be modified afterwards.
+        """
+        with self.cond:
+            self._frame = frame
+            self.cond.notify_all()
+
+    def _encode_loop(self):
+        min_interval = 1.0 / self.max_fps if self.max_fps else 0.0
+        last = 0.0
+        while True:
+            # Cap the encode rate first, so the frame taken below is the newest one
+            wait = last + min_interval - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            with self.cond:
+                while self.running and self._frame is None:
+                    self.cond.wait(0.5)
+                if not self.running:
+                    return
+                frame, self._frame = self._frame, None
+                has_viewers = bool(self.viewers)
+            if not has_viewers:
+                # Nobody is watching: skip the encode entirely
+                continue
+            last = time.perf_counter()
+
+            cpu_start = time.thread_time()
+            ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)])
+            self.encode_cpu += time.thread_time() - cpu_start
+            self.encode_stats.record(time.perf_counter() - last)
+            if not ok:
+                continue
+            with self.cond:
+                self._jpeg = jpeg.tobytes()
+                self._seq += 1
+                self.encoded += 1
+                self.cond.notify_all()
+
+    def next_jpeg(self, last_seq, timeout=1.0):
+        """
+        :return: (seq, jpeg bytes) newer than last_seq, or (last_seq, None) on timeout.
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: not self.running or self._seq > last_seq, timeout)
+            if not self.running or self._seq <= last_seq:
+                return last_seq, None
+            return self._seq, self._jpeg
+
+    def _add_viewer(self, address):
+        viewer = _Viewer(next(self._ids), address)
+        with self.cond:
+            self.viewers[viewer.id] = viewer
+        return viewer
+
+    def _remove_viewer(self, viewer):
+        with self.cond:
+            self.viewers.pop(viewer.id, None)
+
+    def stats(self):
+        now = time.perf_counter()
+        with self.cond:
+            viewers = list(self.viewers.values())
+            encoded = self.encoded
+        uptime = max(now - self.started, 1e-6)
+        # Encoding is shared, so each viewer is charged an equal part of it
+        encode_share = self.encode_cpu / max(len(viewers), 1)
+        per_viewer = []
+        for v in viewers:
+            elapsed = max(now - v.connected, 1e-6)
+            per_viewer.append({
+                "id": v.id,
+                "address": v.address,
+                "fps": v.frames / elapsed,
+                "kbps": v.bytes * 8 / 1000 / elapsed,
+                "skipped": v.skipped,
+                "cpu_percent": 100 * (v.cpu + encode_share * min(elapsed / uptime, 1.0)) / elapsed,
+            })
+        return {
+            "encoded": encoded,
+            "encode": self.encode_stats.snapshot(),
+            "encode_cpu_percent": 100 * self.encode_cpu / uptime,
+            "quality": self.quality,
+            "viewers": per_viewer,
+        }
+
+    def stats_markdown(self):
+        stats = self.stats()
+        lines = [f"**스트림:** JPEG 품질 {stats['quality']}, 인코딩 p95 {stats['encode']['p95_ms']:.1f} ms, "
+                 f"CPU {stats['encode_cpu_percent']:.0f}%"]
+        if stats["viewers"]:
+            lines.append("| 시청자 | fps | kbps | 건너뜀 | CPU % |\n|---|---|---|---|---|")
+            lines[-1] += "".join(f"\n| {v['address']} | {v['fps']:.1f} | {v['kbps']:.0f} | {v['skipped']} "
+                                 f"| {v['cpu_percent']:.1f} |" for v in stats["viewers"])
+        return "\n\n".join(lines)
+
+
+class _StreamHandler(BaseHTTPRequestHandler):
+    streamer = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/stream.mjpg":
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+        self.send_header("Cache-Control", "no-cache, private")
+        self.send_header("Pragma", "no-cache")
+        self.end_headers()
+
+        streamer = self.streamer
+        viewer = streamer._add_viewer(self.client_address[0])
+        seq = 0
+        try:
+            while streamer.running:
+                new_seq, jpeg = streamer.next_jpeg(seq)
+                if jpeg is None:
+                    continue
+                if seq:
+                    viewer.skipped += new_seq - seq - 1
+                seq = new_seq
+                cpu_start = time.thread_time()
+                header = (f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                          f"Content-Length: {len(jpeg)}\r\n\r\n").encode()
+                self.wfile.write(header + jpeg + b"\r\n")
+                viewer.cpu += time.thread_time() - cpu_start
+                viewer.frames += 1
+                viewer.bytes += len(header) + len(jpeg) + 2
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            streamer._remove_viewer(viewer)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def stream_configured():
+    """
+    True when FACE_STREAM_HOST or FACE_STREAM_URL says where browsers can reach the
+    stream. Without either, the default URL only works for a browser on this machine.
+    """
+    return bool(os.environ.get("FACE_STREAM_HOST") or os.environ.get("FACE_STREAM_URL"))
+
+
+def streamer_from_env(quality=80):
+    """
+    MjpegStreamer configured from FACE_STREAM_PORT / FACE_STREAM_HOST / FACE_STREAM_URL.
+    """
+    port = int(os.environ.get("FACE_STREAM_PORT", "8765"))
+    return MjpegStreamer(port=port, host=os.environ.get("FACE_STREAM_HOST", "127.0.0.1"),
+                         quality=quality, public_url=os.environ.get("FACE_STREAM_URL"))
@@ -0,0 +1,128 @@
+"""
+Background model loading for a responsive start-up.
+
+torch and facenet_pytorch are imported, the FaceDetector is built (weights
+come from the local model cache) and optionally warmed up on a worker
+thread, so the dashboards can draw and show camera frames right away.
+
+    python src/model_loader.py            # cold-start timings for this machine
+    FACE_WARMUP=0 streamlit run src/main_local.py
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+import metrics
+
+# Close enough to process start: the apps import this module before anything heavy
+PROCESS_START = time.perf_counter()
+
+
+def default_detector_factory():
+    from detector import FaceDetector
+    # FACE_EMBED_BACKEND=torchscript|int8|onnx swaps the embedding runtime (default: eager PyTorch)
+    return FaceDetector(backend=os.environ.get("FACE_EMBED_BACKEND", "eager"))
+
+
+class ModelLoader:
+    """
+    state: "idle" -> "loading" -> "warming" -> "ready", or "failed" with `error` set.
+    """
+
+    def __init__(self, factory=None, warmup=None, warmup_shape=(480, 640, 3)):
+        """
+        :param factory: callable building the detector (default: FaceDetector from the environment).
+        :param warmup: run one dummy detection + embedding before reporting ready
+                       (default: on unless FACE_WARMUP=0).
+        """
+        self.factory = factory or default_detector_factory
+        if warmup is None:
+            warmup = os.environ.get("FACE_WARMUP", "1") != "0"
+        self.warmup = warmup
+        self.warmup_shape = warmup_shape
+
+        self.state = "idle"
+        self.error = None
+        self.detector = None
+        self.timings = {}
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        with self._lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        return self
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            self.state = "loading"
+            detector = self.factory()
+            self.timings["load_s"] = time.perf_counter() - start
+
+            if self.warmup:
+                self.state = "warming"
+                warm_start = time.perf_counter()
+                frame = np.zeros(self.warmup_shape, dtype=np.uint8)
+                detector.detect(frame)
+                # A fixed box exercises cropping and the embedding model, which a blank frame would not
+                detector.get_embeddings(frame, np.array([[0, 0, 160, 160]], dtype=np.float32))
+                self.timings["warmup_s"] = time.perf_counter() - warm_start
+
+            self.detector = detector
+            self.timings["ready_since_start_s"] = time.perf_counter() - PROCESS_START
+            metrics.set_gauge("startup.models_ready_seconds", self.timings["ready_since_start_s"])
+            self.state = "ready"
+        except Exception as e:
+            print(f"Error loading models: {e}")
+            self.error = str(e)
+            self.state = "failed"
+        finally:
+            self._ready.set()
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def wait(self, timeout=None):
+        """
+        :return: the detector, or None if loading failed or timed out.
+        """
+        self.start()
+        self._ready.wait(timeout)
+        return self.detector
+
+    def mark_first_frame(self, with_detection):
+        """
+        Records time-to-first-frame once for plain frames and once for frames with detection.
+        """
+        key = "first_detected_frame_s" if with_detection else "first_frame_s"
+        if key in self.timings:
+            return
+        with self._lock:
+            if key not in self.timings:
+                self.timings[key] = time.perf_counter() - PROCESS_START
+                metrics.set_gauge(f"startup.{key.replace('_s', '')}_seconds", self.timings[key])
+
+    def status_text(self):
+        labels = {"idle": "대기 중", "loading": "모델 불러오는 중…", "warming": "모델 예열 중…",
+                  "ready": "준비 완료", "failed": f"모델 로드 실패: {self.error}"}
+        lines = [f"**모델 상태:** {labels[self.state]}"]
+        for key, label in (("load_s", "모델 로드"), ("warmup_s", "예열"),
+                           ("first_frame_s", "첫 프레임"), ("first_detected_frame_s", "첫 인식 프레임")):
+            if key in self.timings:
+                lines.append(f"{label}: {self.timings[key]:.2f}s")
+        return "\n\n".join(lines)
+
+
+if __name__ == "__main__":
+    import json
+
+    loader = ModelLoader().start()
+    loader.wait()
+    print(json.dumps({"state": loader.state, "error": loader.error, **loader.timings}, indent=2))
@@ -0,0 +1,104 @@
+import cv2
+import numpy as np
+
+import metrics
+
+
+class MotionGate:
+    """
+    Cheap "did anything change?" check in front of face detection.
+
+    Each frame is shrunk to `width` pixels wide, converted to grayscale,
+    blurred, and compared with a running-average background. Detection
+    opens when enough pixels differ, and stays open until the changed area
+    falls below half the opening level for `hold_frames` frames (hysteresis).
+    While closed, callers reuse their previous result. A detection is still
+    forced every `refresh_every` frames.
+    """
+
+    def __init__(self, sensitivity=0.5, width=160, learning_rate=0.05, hold_frames=15, refresh_every=90):
+        """
+        :param sensitivity: 0 (only large changes) .. 1 (tiny changes open the gate).
+        :param learning_rate: how fast the background absorbs a still scene.
+        """
+        self.width = width
+        self.learning_rate = learning_rate
+        self.hold_frames = hold_frames
+        self.refresh_every = refresh_every
+        self.set_sensitivity(sensitivity)
+
+        self.background = None
+        self.active = True
+        self._quiet = 0
+        self._since_refresh = 0
+        self.motion = 0.0          # fraction of changed pixels in the last frame
+
+        self.frames = 0
+        self.skipped = 0
+
+    def set_sensitivity(self, sensitivity):
+        sensitivity = float(np.clip(sensitivity, 0.0, 1.0))
+        self.sensitivity = sensitivity
+        self.pixel_threshold = 10 + (1 - sensitivity) * 40
+        self.open_ratio = 0.002 + (1 - sensitivity) * 0.02
+        self.close_ratio = self.open_ratio / 2
+
+    def reset(self):
+        self.background = None
+        self.active = True
+        self._quiet = 0
+        self._since_refresh = 0
+
+    def _small_gray(self, frame):
+        h, w = frame.shape[:2]
+        height = max(1, int(h * self.width / w))
+        # Linear subsampling is ~20x cheaper than INTER_AREA; the blur below absorbs its extra noise
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_LINEAR)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def check(self, frame):
+        """
+        :return: True if detection should run on this frame.
+        """
+        self.frames += 1
+        gray = self._small_gray(frame)
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype(np.float32)
+            self.active = True
+            self._since_refresh = 0
+            return True
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        self.motion = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+
+        if self.motion >= self.open_ratio:
+            self.active = True
+            self._quiet = 0
+        elif self.active:
+            if self.motion < self.close_ratio:
+                self._quiet += 1
+            if self._quiet >= self.hold_frames:
+                self.active = False
+
+        # Learn slowly while something is moving so a person standing still is not absorbed at once
+        rate = self.learning_rate * (0.1 if self.active else 1.0)
+        cv2.accumulateWeighted(gray, self.background, rate)
+
+        self._since_refresh += 1
+        if self.active or self._since_refresh >= self.refresh_every:
+            self._since_refresh = 0
+            return True
+        self.skipped += 1
+        metrics.inc("motion_gate.skipped")
+        return False
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "skip_ratio": self.skipped / self.frames if self.frames else 0.0,
+            "active": self.active,
+            "motion": self.motion,
+        }
@@ -0,0 +1,175 @@
+import threading
+import time
+
+from camera import Camera
+
+
+class SourceState:
+    def __init__(self, source_id, source, target_fps, priority):
+        self.id = source_id
+        self.camera = Camera(source=source)
+        self.target_fps = target_fps
+        self.priority = priority
+        self.allocated_fps = target_fps
+        self.next_due = 0.0
+        self.last_seq = 0
+        self.sampled = 0
+
+
+class MultiCameraManager:
+    """
+    Ingests many sources (device index, file path or RTSP URL), each through its
+    own Camera, and hands out frames one at a time under a global inference budget.
+    File paths play back at their own FPS and loop, like a live camera.
+
+    The budget is split across sources in proportion to priority, capped by
+    each source's target FPS, with leftover rate redistributed to the others
+    (water-filling). The scheduler always serves the most overdue source that
+    has a new frame. Callers report how long each frame took, and the budget
+    shrinks to what the consumers can actually sustain.
+    """
+
+    def __init__(self, sources, budget_fps=30.0, workers=1, headroom=0.9):
+        """
+        :param sources: list of dicts {"source": ..., "fps": target, "priority": weight}
+                        (or bare sources, meaning fps=budget_fps, priority=1).
+        :param budget_fps: upper bound on frames handed out per second, all sources together.
+        :param workers: number of consumers processing frames in parallel.
+        """
+        self.sources = []
+        for i, spec in enumerate(sources):
+            if not isinstance(spec, dict):
+                spec = {"source": spec}
+            self.sources.append(SourceState(i, spec["source"], spec.get("fps", budget_fps),
+                                            spec.get("priority", 1.0)))
+        self.budget_fps = budget_fps
+        self.workers = workers
+        self.headroom = headroom
+        self.lock = threading.Lock()
+
+        self.avg_process_time = None   # EWMA of reported processing time (seconds)
+        self.effective_budget = budget_fps
+        self._allocate()
+
+    def start(self):
+        for state in self.sources:
+            state.camera.start()
+
+    def stop(self):
+        for state in self.sources:
+            state.camera.stop()
+
+    def _allocate(self):
+        """
+        Splits the effective budget by priority, capped at each source's target FPS.
+        """
+        remaining = self.effective_budget
+        pending = list(self.sources)
+        for state in pending:
+            state.allocated_fps = 0.0
+        while pending and remaining > 1e-6:
+            weight = sum(s.priority for s in pending)
+            capped = [s for s in pending if s.target_fps - s.allocated_fps <= remaining * s.priority / weight]
+            if not capped:
+                for s in pending:
+                    s.allocated_fps += remaining * s.priority / weight
+                break
+            for s in capped:
+                remaining -= s.target_fps - s.allocated_fps
+                s.allocated_fps = s.target_fps
+                pending.remove(s)
+
+    def report(self, source_id, seconds):
+        """
+        Feeds back how long a frame took so the budget tracks real capacity.
+        """
+        with self.lock:
+            if self.avg_process_time is None:
+                self.avg_process_time = seconds
+            else:
+                self.avg_process_time = 0.9 * self.avg_process_time + 0.1 * seconds
+            sustainable = self.headroom * self.workers / max(self.avg_process_time, 1e-6)
+            budget = min(self.budget_fps, sustainable)
+            if abs(budget - self.effective_budget) > 0.05 * self.effective_budget:
+                self.effective_budget = budget
+                self._allocate()
+
+    def next_frame(self, timeout=None):
+        """
+        Blocks until some source is due and has a frame it hasn't handed out yet.
+        :return: (source_id, FrameLease), or None on timeout.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            now = time.time()
+            with self.lock:
+                ready = [s for s in self.sources
+                         if s.allocated_fps > 0 and s.next_due <= now and s.camera.seq > s.last_seq]
+                if ready:
+                    state = min(ready, key=lambda s: s.next_due)
+                    lease = state.camera.get_latest()
+                    if lease is not None:
+                        state.last_seq = lease.seq
+                        state.sampled += 1
+                        # Schedule from the due time, not from now, so a late source catches up fairly
+                        state.next_due = max(state.next_due, now - 1.0 / state.allocated_fps) + 1.0 / state.allocated_fps
+                        return state.id, lease
+                due = [s.next_due for s in self.sources if s.allocated_fps > 0]
+
+            if deadline is not None and now >= deadline:
+                return None
+            wait = max(0.002, min(due) - now) if due else 0.01
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            time.sleep(min(wait, 0.01))
+
+    def stats(self):
+        with self.lock:
+            return {
+                "effective_budget_fps": self.effective_budget,
+                "avg_process_ms": None if self.avg_process_time is None else self.avg_process_time * 1000,
+                "sources": [{
+                    "source": s.camera.source,
+                    "priority": s.priority,
+                    "target_fps": s.target_fps,
+                    "allocated_fps": s.allocated_fps,
+                    "sampled": s.sampled,
+                    "captured": s.camera.seq,
+                    "dropped": s.camera.dropped,
+                } for s in self.sources],
+            }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Fair multi-source sampling (file paths stand in for cameras)")
+    parser.add_argument("sources", nargs="+")
+    parser.add_argument("--budget", type=float, default=30.0, help="global inference budget (frames/sec)")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--no-inference", action="store_true", help="only exercise the scheduler")
+    args = parser.parse_args()
+
+    detector = None
+    if not args.no_inference:
+        from detector import FaceDetector
+        detector = FaceDetector()
+
+    manager = MultiCameraManager(args.sources, budget_fps=args.budget)
+    manager.start()
+    end = time.time() + args.seconds
+    try:
+        while time.time() < end:
+            item = manager.next_frame(timeout=1.0)
+            if item is None:
+                continue
+            source_id, lease = item
+            start = time.perf_counter()
+            with lease:
+                if detector is not None:
+                    detector.detect(lease.image)
+            manager.report(source_id, time.perf_counter() - start)
+    finally:
+        manager.stop()
+    print(json.dumps(manager.stats(), indent=2, ensure_ascii=False))
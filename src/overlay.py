@@ -0,0 +1,155 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Fonts with Hangul glyphs, tried in order
+FONT_CANDIDATES = [
+    "malgun.ttf",
+    "C:/Windows/Fonts/malgun.ttf",
+    "/usr/share/fonts/truetype/nanum/NanumGothic.ttf",
+    "/usr/share/fonts/nanum/NanumGothic.ttf",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/System/Library/Fonts/AppleSDGothicNeo.ttc",
+]
+
+_fonts = {}
+_fonts_lock = threading.Lock()
+
+
+def load_font(size=20):
+    """
+    Loads (once per size) the first available Korean-capable TrueType font.
+    """
+    with _fonts_lock:
+        if size in _fonts:
+            return _fonts[size]
+
+        from PIL import ImageFont
+        font = None
+        for path in FONT_CANDIDATES:
+            try:
+                font = ImageFont.truetype(path, size)
+                break
+            except IOError:
+                continue
+        if font is None:
+            # Fallback to default if font not found
+            print("Warning: No Korean font found. Falling back to default.")
+            font = ImageFont.load_default()
+        _fonts[size] = font
+        return font
+
+
+class LabelRenderer:
+    """
+    Draws text labels straight into a BGR ndarray.
+
+    Each distinct character is rasterized once with PIL into a small alpha
+    mask (kept in an LRU cache), and a label is assembled from its glyph masks,
+    so labels whose probabilities change every frame still never touch PIL.
+    Drawing is then an alpha blend over just the label's rectangle, with no
+    full-frame color conversion or PIL round-trip. Kerning between glyphs is
+    not applied.
+    """
+
+    def __init__(self, font_size=20, color=(0, 255, 0), max_cached=512):
+        self.font_size = font_size
+        self.color = np.array(color, dtype=np.float32)
+        self.max_cached = max_cached
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _glyph(self, char):
+        """
+        :return: (alpha, left, top, advance) with left/top relative to the pen position.
+        """
+        with self._lock:
+            cached = self._cache.get(char)
+            if cached is not None:
+                self._cache.move_to_end(char)
+                return cached
+
+        from PIL import Image, ImageDraw
+        font = load_font(self.font_size)
+        left, top, right, bottom = font.getbbox(char)
+        img = Image.new("L", (max(1, right - left), max(1, bottom - top)), 0)
+        ImageDraw.Draw(img).text((-left, -top), char, font=font, fill=255)
+        # Alpha as float32 in [0, 1]
+        alpha = np.asarray(img, dtype=np.float32) / 255.0
+        entry = (alpha, left, top, font.getlength(char))
+
+        with self._lock:
+            self._cache[char] = entry
+            if len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return entry
+
+    def _mask(self, text):
+        """
+        :return: (alpha, left, top) of the whole label, shaped for broadcasting over BGR.
+        """
+        glyphs = []
+        pen = 0.0
+        for char in text:
+            alpha, left, top, advance = self._glyph(char)
+            glyphs.append((alpha, int(round(pen)) + left, top))
+            pen += advance
+        if not glyphs:
+            return np.zeros((1, 1, 1), dtype=np.float32), 0, 0
+
+        x1 = min(x for _, x, _ in glyphs)
+        y1 = min(y for _, _, y in glyphs)
+        x2 = max(x + a.shape[1] for a, x, _ in glyphs)
+        y2 = max(y + a.shape[0] for a, _, y in glyphs)
+        mask = np.zeros((y2 - y1, x2 - x1), dtype=np.float32)
+        for alpha, x, y in glyphs:
+            region = mask[y - y1:y - y1 + alpha.shape[0], x - x1:x - x1 + alpha.shape[1]]
+            np.maximum(region, alpha, out=region)
+        return mask[:, :, None], x1, y1
+
+    def draw(self, frame, text, origin):
+        """
+        Blends `text` into frame (in place) with its PIL text origin at `origin`.
+        """
+        alpha, left, top = self._mask(text)
+        h, w = alpha.shape[:2]
+        x, y = int(origin[0]) + left, int(origin[1]) + top
+
+        # Clip the label rectangle to the frame
+        fx1, fy1 = max(0, x), max(0, y)
+        fx2, fy2 = min(frame.shape[1], x + w), min(frame.shape[0], y + h)
+        if fx2 <= fx1 or fy2 <= fy1:
+            return frame
+
+        a = alpha[fy1 - y:fy2 - y, fx1 - x:fx2 - x]
+        roi = frame[fy1:fy2, fx1:fx2]
+        roi[:] = (roi + (self.color - roi) * a).astype(np.uint8)
+        return frame
+
+
+def draw_boxes(frame, boxes, probs=None, names=None, renderer=None):
+    """
+    Draws boxes and "<name> (<prob>)" labels in place on a BGR frame.
+    """
+    if boxes is None:
+        return frame
+    if renderer is None:
+        renderer = LabelRenderer()
+
+    for i, box in enumerate(boxes):
+        x1, y1, x2, y2 = [int(b) for b in box]
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+
+        label = ""
+        if names is not None and i < len(names):
+            label += f"{names[i]} "
+        if probs is not None:
+            label += f"({probs[i]:.2f})"
+
+        if label:
+            renderer.draw(frame, label, (x1, y1 - 25))
+
+    return frame
@@ -0,0 +1,261 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+import metrics
+
+
+class StageStats:
+    def __init__(self, window=200):
+        self.durations = deque(maxlen=window)
+        self.count = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.durations.append(seconds)
+            self.count += 1
+
+    def snapshot(self):
+        with self.lock:
+            durations = np.array(self.durations) * 1000 if self.durations else np.zeros(1)
+            return {
+                "count": self.count,
+                "dropped": self.dropped,
+                "mean_ms": float(durations.mean()),
+                "p50_ms": float(np.percentile(durations, 50)),
+                "p95_ms": float(np.percentile(durations, 95)),
+            }
+
+
+class FramePacket:
+    """
+    Everything known about one frame as it moves down the pipeline.
+    """
+    def __init__(self, seq, timestamp, frame):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.frame = frame
+        self.frame_rgb = None
+        self.boxes = None
+        self.probs = None
+        self.embeddings = None
+        self.matches = []
+        self.output = None
+        self.reused = False     # results copied from an earlier frame (motion gate closed)
+
+
+class Stage:
+    """
+    A pipeline step: `fn(packet)` mutates the packet, or returns False to drop it.
+    """
+    def __init__(self, name, fn):
+        self.name = name
+        self.fn = fn
+        self.stats = StageStats()
+
+
+class _LatestQueue:
+    """
+    Bounded queue whose put evicts the oldest item instead of blocking,
+    so a slow downstream stage always receives the freshest frame.
+    """
+    def __init__(self, maxsize, stats):
+        self.items = deque()
+        self.maxsize = maxsize
+        self.stats = stats
+        self.cond = threading.Condition()
+
+    def put_latest(self, item):
+        with self.cond:
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.stats.dropped += 1
+            self.items.append(item)
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.items, timeout):
+                return None
+            return self.items.popleft()
+
+
+class Pipeline:
+    """
+    Runs a source and a chain of stages on their own threads, connected by
+    bounded queues. End-to-end latency becomes the slowest stage rather than
+    the sum of all stages, and stale frames are dropped under back-pressure.
+    """
+
+    def __init__(self, source, stages, queue_size=1):
+        """
+        :param source: callable(timeout) -> FramePacket or None.
+        :param stages: list of Stage, run in order.
+        """
+        self.source = source
+        self.stages = stages
+        self.source_stats = StageStats()
+        self.queues = [_LatestQueue(queue_size, stage.stats) for stage in stages]
+        self.running = False
+        self.threads = []
+
+        self.cond = threading.Condition()
+        self.result = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.threads = [threading.Thread(target=self._run_source, daemon=True)]
+        for i in range(len(self.stages)):
+            self.threads.append(threading.Thread(target=self._run_stage, args=(i,), daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def _run_source(self):
+        while self.running:
+            start = time.perf_counter()
+            packet = self.source(0.2)
+            if packet is None:
+                continue
+            self.source_stats.record(time.perf_counter() - start)
+            self.queues[0].put_latest(packet)
+
+    def _run_stage(self, index):
+        stage = self.stages[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.queues) else None
+        while self.running:
+            packet = inbox.get(timeout=0.2)
+            if packet is None:
+                continue
+
+            start = time.perf_counter()
+            try:
+                keep = stage.fn(packet)
+            except Exception as e:
+                print(f"Error in pipeline stage {stage.name}: {e}")
+                keep = False
+            elapsed = time.perf_counter() - start
+            stage.stats.record(elapsed)
+            metrics.observe(f"pipeline.{stage.name}", elapsed)
+            if keep is False:
+                continue
+
+            if outbox is not None:
+                outbox.put_latest(packet)
+            else:
+                with self.cond:
+                    self.result = packet
+                    self.cond.notify_all()
+
+    def wait_for_result(self, after_seq=0, timeout=None):
+        """
+        :return: the newest finished FramePacket with seq > after_seq, or None on timeout.
+        """
+        with self.cond:
+            self.cond.wait_for(
+                lambda: not self.running or (self.result is not None and self.result.seq > after_seq),
+                timeout)
+            if self.result is not None and self.result.seq > after_seq:
+                return self.result
+            return None
+
+    def stats(self):
+        """
+        :return: {stage name: {count, dropped, mean_ms, p50_ms, p95_ms}}
+        """
+        stats = {"capture": self.source_stats.snapshot()}
+        for stage in self.stages:
+            stats[stage.name] = stage.stats.snapshot()
+        return stats
+
+
+def camera_source(camera):
+    """
+    Pipeline source that takes each new camera frame once.
+    The frame is copied out of the ring buffer so the lease is held only briefly.
+    """
+    state = {"seq": 0}
+
+    def read(timeout):
+        lease = camera.wait_for_frame(state["seq"], timeout=timeout)
+        if lease is None:
+            return None
+        with lease:
+            state["seq"] = lease.seq
+            return FramePacket(lease.seq, lease.timestamp, lease.image.copy())
+    return read
+
+
+class FacePipeline(Pipeline):
+    """
+    capture -> detect -> embed -> match -> render, built from Camera,
+    FaceDetector and FaceManager. Thresholds can be changed while running.
+    """
+
+    def __init__(self, camera, detector, face_manager, confidence_threshold=0.9,
+                 recognition_threshold=0.8, run_detection=True, motion_gate=None, adaptive=None):
+        """
+        :param motion_gate: optional MotionGate; frames it rejects reuse the last detection results.
+        :param adaptive: optional AdaptiveDetection policy for this pipeline's detect() calls.
+        """
+        self.detector = detector
+        self.motion_gate = motion_gate
+        self.adaptive = adaptive
+        self._last = (None, None, None, [])
+        self.face_manager = face_manager
+        self.confidence_threshold = confidence_threshold
+        self.recognition_threshold = recognition_threshold
+        self.run_detection = run_detection
+        super().__init__(camera_source(camera), [
+            Stage("detect", self._detect),
+            Stage("embed", self._embed),
+            Stage("match", self._match),
+            Stage("render", self._render),
+        ])
+
+    def _detect(self, packet):
+        if not self.run_detection:
+            return
+        gate = self.motion_gate
+        if gate is not None and not gate.check(packet.frame):
+            packet.boxes, packet.probs, packet.embeddings, packet.matches = self._last
+            packet.reused = True
+            return
+        packet.frame_rgb = cv2.cvtColor(packet.frame, cv2.COLOR_BGR2RGB)
+        boxes, probs = self.detector.detect(packet.frame, frame_rgb=packet.frame_rgb, adaptive=self.adaptive)
+        if boxes is not None:
+            keep = probs >= self.confidence_threshold
+            if keep.any():
+                packet.boxes, packet.probs = boxes[keep], probs[keep]
+
+    def _embed(self, packet):
+        if packet.boxes is not None and not packet.reused:
+            packet.embeddings = self.detector.get_embeddings(
+                packet.frame, packet.boxes, frame_rgb=packet.frame_rgb)
+
+    def _match(self, packet):
+        if packet.reused:
+            return
+        if packet.embeddings is not None:
+            packet.matches = self.face_manager.match_faces(
+                packet.embeddings, threshold=self.recognition_threshold)
+        self._last = (packet.boxes, packet.probs, packet.embeddings, packet.matches)
+
+    def _render(self, packet):
+        names = [f"{name} ({dist:.2f})" for name, dist in packet.matches]
+        packet.output = self.detector.draw_boxes(packet.frame, packet.boxes, packet.probs, names)
@@ -0,0 +1,215 @@
+import itertools
+import multiprocessing as mp
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def _worker_main(worker_id, slot_names, torch_threads, requests, results):
+    """
+    Worker process: owns one FaceDetector with a pinned torch thread count and
+    reads frames straight out of shared memory.
+    """
+    import torch
+    torch.set_num_threads(torch_threads)
+    torch.set_num_interop_threads(1)
+
+    import os
+    from detector import FaceDetector
+    detector = FaceDetector(device=torch.device('cpu'), backend=os.environ.get("FACE_EMBED_BACKEND", "eager"))
+
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    results.put(("ready", worker_id, None))
+    try:
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            request_id, slot, shape, op, args, adaptive = request
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=slots[slot].buf)
+            try:
+                result = _OPS[op](detector, frame, *args, adaptive=adaptive)
+            except Exception as e:
+                print(f"Worker {worker_id} inference error: {e}")
+                result = _FAILED[op]
+            # The caller's adaptive policy was pickled; send its updated tuning back
+            state = adaptive.state() if adaptive is not None else None
+            results.put(("done", request_id, (result, state)))
+    finally:
+        for shm in slots:
+            shm.close()
+
+
+_OPS = {
+    "detect_and_embed": lambda detector, frame, min_prob, adaptive: detector.detect_and_embed(
+        frame, min_prob=min_prob, adaptive=adaptive),
+    "detect": lambda detector, frame, rois, adaptive: detector.detect(frame, rois=rois, adaptive=adaptive),
+    "embed": lambda detector, frame, boxes, adaptive: detector.get_embeddings(frame, boxes),
+}
+_FAILED = {"detect_and_embed": (None, None, None), "detect": (None, None), "embed": None}
+
+
+class _Pending:
+    def __init__(self, worker, slot, op):
+        self.worker = worker
+        self.slot = slot
+        self.result = (_FAILED[op], None)
+        self.done = threading.Event()
+
+
+class ProcessPoolDetector:
+    """
+    N worker processes, each with its own MTCNN/InceptionResnetV1 and
+    `torch_threads` intra-op threads, so inference is not serialized by the GIL.
+
+    Frames are copied once into a per-worker shared-memory slot instead of
+    being pickled; only the small (boxes, probs, embeddings) result travels
+    back through a queue. Streams are pinned to the least-loaded worker the
+    first time they submit, which keeps each camera on one process, until
+    release_stream(). Besides whole frames (submit), workers run tracker
+    detections (detect) and embeddings (get_embeddings), with the caller's
+    AdaptiveDetection policy when given.
+
+    InferenceService.from_process_pool() puts it behind the shared WebRTC service.
+    """
+
+    def __init__(self, num_workers=None, torch_threads=1, max_frame_shape=(1080, 1920, 3), slots_per_worker=2):
+        self.num_workers = num_workers or max(1, mp.cpu_count() // max(1, torch_threads))
+        self.slot_bytes = int(np.prod(max_frame_shape))
+        self.slots_per_worker = slots_per_worker
+
+        ctx = mp.get_context("spawn")
+        self.results = ctx.Queue()
+        self.requests = []
+        self.processes = []
+        self.shm = []
+        self.free_slots = []
+        for worker_id in range(self.num_workers):
+            blocks = [shared_memory.SharedMemory(create=True, size=self.slot_bytes)
+                      for _ in range(slots_per_worker)]
+            self.shm.append(blocks)
+            self.free_slots.append(list(range(slots_per_worker)))
+            requests = ctx.Queue()
+            self.requests.append(requests)
+            process = ctx.Process(
+                target=_worker_main,
+                args=(worker_id, [b.name for b in blocks], torch_threads,
+                      requests, self.results),
+                daemon=True)
+            process.start()
+            self.processes.append(process)
+
+        self.lock = threading.Condition()
+        self.pending = {}
+        self.ids = itertools.count()
+        self.assignments = {}             # stream id -> worker
+        self.load = [0] * self.num_workers
+        self.ready = 0
+        self.running = True
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def _dispatch(self):
+        while self.running:
+            message = self.results.get()
+            if message is None:
+                break
+            kind, key, result = message
+            with self.lock:
+                if kind == "ready":
+                    self.ready += 1
+                    continue
+                pending = self.pending.pop(key, None)
+                if pending is None:
+                    continue
+                self.free_slots[pending.worker].append(pending.slot)
+                self.load[pending.worker] -= 1
+                self.lock.notify_all()
+            pending.result = result
+            pending.done.set()
+
+    def worker_for(self, stream_id):
+        """
+        Sticky stream -> worker assignment, least-loaded first.
+        """
+        with self.lock:
+            worker = self.assignments.get(stream_id)
+            if worker is None:
+                counts = [0] * self.num_workers
+                for w in self.assignments.values():
+                    counts[w] += 1
+                worker = int(np.argmin(counts))
+                self.assignments[stream_id] = worker
+            return worker
+
+    def release_stream(self, stream_id):
+        with self.lock:
+            self.assignments.pop(stream_id, None)
+
+    def submit(self, frame, min_prob=0.0, stream_id=None, timeout=None, adaptive=None):
+        """
+        Blocks until the assigned worker has processed the frame.
+        :return: (boxes, probs, embeddings); all None on timeout.
+        """
+        return self._run("detect_and_embed", frame, (min_prob,), adaptive, stream_id, timeout)
+
+    def detect(self, frame, frame_rgb=None, rois=None, adaptive=None, stream_id=None, timeout=None):
+        """
+        :return: (boxes, probs); both None on timeout.
+        """
+        return self._run("detect", frame, (rois,), adaptive, stream_id, timeout)
+
+    def get_embeddings(self, frame, boxes, frame_rgb=None, stream_id=None, timeout=None):
+        """
+        :return: embeddings of `boxes`; None on timeout.
+        """
+        if boxes is None or len(boxes) == 0:
+            return None
+        return self._run("embed", frame, (boxes,), None, stream_id, timeout)
+
+    def _run(self, op, frame, args, adaptive, stream_id, timeout):
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame of shape {frame.shape} exceeds the shared-memory slot size")
+
+        if stream_id is None:
+            # Unassigned callers go to whichever worker has the fewest requests in flight
+            with self.lock:
+                worker = int(np.argmin(self.load))
+        else:
+            worker = self.worker_for(stream_id)
+
+        with self.lock:
+            if not self.lock.wait_for(lambda: self.free_slots[worker], timeout):
+                return _FAILED[op]
+            slot = self.free_slots[worker].pop()
+            self.load[worker] += 1
+            request_id = next(self.ids)
+            pending = _Pending(worker, slot, op)
+            self.pending[request_id] = pending
+
+        target = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm[worker][slot].buf)
+        np.copyto(target, frame)
+        self.requests[worker].put((request_id, slot, frame.shape, op, args, adaptive))
+
+        pending.done.wait(timeout)
+        result, state = pending.result
+        if adaptive is not None and state is not None:
+            adaptive.load_state(state)
+        return result
+
+    def detect_and_embed(self, frame, min_prob=0.0, adaptive=None):
+        return self.submit(frame, min_prob=min_prob, adaptive=adaptive)
+
+    def stop(self):
+        self.running = False
+        for requests in self.requests:
+            requests.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+        self.results.put(None)
+        self.dispatcher.join(timeout=1)
+        for blocks in self.shm:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
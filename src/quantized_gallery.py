@@ -0,0 +1,228 @@
+"""
+Compact in-memory gallery: L2-normalized embeddings stored as float16, or
+as int8 with one float32 scale per vector, plus int32 identity labels.
+
+A match first scores every gallery vector against the query with the
+compact codes (coarse pass), then re-ranks the `rerank` best candidates
+with exact float32 distances read from the embedding store, so reported
+distances and thresholds are unchanged.
+
+    python src/quantized_gallery.py --gallery 100000   # memory per million embeddings and accuracy loss
+"""
+import time
+
+import numpy as np
+
+PRECISIONS = ("float32", "float16", "int8")
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def quantize(vectors, precision):
+    """
+    :return: (codes, scales) for L2-normalized vectors; scales is None for float16.
+    """
+    if precision == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class QuantizedGallery:
+    """
+    Rows are appended into preallocated arrays that grow by doubling, and
+    removal builds new arrays, so a snapshot() stays valid while the gallery
+    changes (the same scheme FaceManager uses for its float32 gallery).
+    """
+
+    def __init__(self, dim=512, precision="int8", rerank=16, chunk=65536):
+        """
+        :param rerank: candidates per query re-ranked with exact float32 distances.
+        :param chunk: rows decoded to float32 at a time during the coarse pass.
+        """
+        if precision not in ("float16", "int8"):
+            raise ValueError(f"Unknown gallery precision: {precision} (expected float16 or int8)")
+        self.dim = dim
+        self.precision = precision
+        self.rerank = rerank
+        self.chunk = chunk
+        self._allocate(0)
+
+    def _allocate(self, capacity):
+        self._codes = np.empty((capacity, self.dim), dtype=np.float16 if self.precision == "float16" else np.int8)
+        self._scales = np.empty(capacity, dtype=np.float32)
+        self._labels = np.empty(capacity, dtype=np.int32)
+        self._rows = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def build(self, source, rows, labels):
+        """
+        :param source: float32 (N, dim) array or memmap holding the original embeddings;
+                       also the exact source passed to search() for re-ranking.
+        :param rows: rows of `source` in the gallery, labelled by `labels`.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        self._allocate(len(rows))
+        # Chunked, so a memory-mapped source is never fully copied into float32 RAM
+        for start in range(0, len(rows), self.chunk):
+            chunk_rows = rows[start:start + self.chunk]
+            codes, scales = quantize(normalize(source[chunk_rows]), self.precision)
+            self._codes[start:start + len(chunk_rows)] = codes
+            self._scales[start:start + len(chunk_rows)] = 1.0 if scales is None else scales
+        self._labels[:] = labels
+        self._rows[:] = rows
+        self.size = len(rows)
+
+    def add_many(self, vectors, labels, rows):
+        vectors = normalize(vectors).reshape(-1, self.dim)
+        n = len(vectors)
+        if self.size + n > len(self._labels):
+            # Grow into fresh arrays so existing snapshots stay untouched
+            capacity = max(16, len(self._labels) * 2, self.size + n)
+            codes, scales, labels_, rows_ = self._codes, self._scales, self._labels, self._rows
+            size = self.size
+            self._allocate(capacity)
+            self._codes[:size] = codes[:size]
+            self._scales[:size] = scales[:size]
+            self._labels[:size] = labels_[:size]
+            self._rows[:size] = rows_[:size]
+            self.size = size
+
+        codes, scales = quantize(vectors, self.precision)
+        end = self.size + n
+        self._codes[self.size:end] = codes
+        self._scales[self.size:end] = 1.0 if scales is None else scales
+        self._labels[self.size:end] = labels
+        self._rows[self.size:end] = rows
+        self.size = end
+
+    def remove(self, label):
+        keep = self._labels[:self.size] != label
+        self._codes = self._codes[:self.size][keep]
+        self._scales = self._scales[:self.size][keep]
+        self._labels = self._labels[:self.size][keep]
+        self._rows = self._rows[:self.size][keep]
+        self.size = len(self._labels)
+
+    def snapshot(self):
+        n = self.size
+        return self._codes[:n], self._scales[:n], self._labels[:n], self._rows[:n]
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held per live embedding (codes + scale + label), excluding spare capacity.
+        """
+        per_row = self._codes.itemsize * self.dim + self._labels.itemsize
+        if self.precision == "int8":
+            per_row += self._scales.itemsize
+        return per_row * self.size
+
+    def coarse_scores(self, queries, snapshot=None):
+        """
+        Approximate cosine similarity between normalized queries and every gallery vector.
+        """
+        codes, scales, _, _ = snapshot or self.snapshot()
+        queries = normalize(queries)
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), self.chunk):
+            block = codes[start:start + self.chunk].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        if self.precision == "int8":
+            scores *= scales[None, :]
+        return scores
+
+    def search(self, queries, exact, snapshot=None):
+        """
+        :param exact: float32 (rows, dim) array or memmap holding the original embeddings.
+        :return: (labels, distances) of the nearest re-ranked candidate; label -1 when empty.
+        """
+        snapshot = snapshot or self.snapshot()
+        _, _, labels, rows = snapshot
+        queries = np.asarray(queries, dtype=np.float32)
+        n = len(queries)
+        if len(labels) == 0:
+            return np.full(n, -1, dtype=np.int32), np.full(n, np.inf, dtype=np.float32)
+
+        scores = self.coarse_scores(queries, snapshot)
+        k = min(self.rerank, len(labels))
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        # Exact float32 distances for the k candidates of each query, read from the store
+        cand_rows = rows[candidates]
+        unique_rows, inverse = np.unique(cand_rows, return_inverse=True)
+        vectors = np.asarray(exact[unique_rows], dtype=np.float32)[inverse.reshape(cand_rows.shape)]
+        d2 = np.sum((vectors - queries[:, None, :]) ** 2, axis=2)
+        best = np.argmin(d2, axis=1)
+        picked = candidates[np.arange(n), best]
+        return labels[picked], np.sqrt(d2[np.arange(n), best])
+
+
+def accuracy_report(vectors, labels, queries, precisions=("float16", "int8"), rerank=16):
+    """
+    Compares each compact precision against the exact float32 scan.
+    :return: list of dicts with bytes/MiB per million embeddings, recall@1 of
+             the coarse pass alone and after re-ranking, the largest distance
+             error and the time per query.
+    """
+    from ann_index import exact_search
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    labels = np.asarray(labels, dtype=np.int32)
+    rows = np.arange(len(vectors))
+
+    start = time.perf_counter()
+    truth, truth_dists = exact_search(queries, vectors, labels)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    float32_bytes = vectors.shape[1] * 4 + 4
+    report = [{"precision": "float32", "bytes_per_embedding": float32_bytes,
+               "mib_per_million": float32_bytes * 1e6 / 2 ** 20, "coarse_recall": 1.0,
+               "recall": 1.0, "max_dist_error": 0.0, "ms_per_query": exact_ms}]
+
+    for precision in precisions:
+        gallery = QuantizedGallery(vectors.shape[1], precision=precision, rerank=rerank)
+        gallery.build(vectors, rows, labels)
+        coarse = labels[np.argmax(gallery.coarse_scores(queries), axis=1)]
+        start = time.perf_counter()
+        found, dists = gallery.search(queries, vectors)
+        ms = (time.perf_counter() - start) * 1000 / len(queries)
+        per_row = gallery.nbytes / len(vectors)
+        report.append({"precision": precision, "bytes_per_embedding": per_row,
+                       "mib_per_million": per_row * 1e6 / 2 ** 20,
+                       "coarse_recall": float(np.mean(coarse == truth)),
+                       "recall": float(np.mean(found == truth)),
+                       "max_dist_error": float(np.max(np.abs(dists - truth_dists))),
+                       "ms_per_query": ms})
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from ann_index import synthetic_gallery
+
+    parser = argparse.ArgumentParser(description="Memory and accuracy of float16/int8 galleries vs float32")
+    parser.add_argument("--gallery", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--rerank", type=int, default=16)
+    parser.add_argument("--noise", type=float, default=0.03, help="query noise around gallery samples")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    vectors, labels = synthetic_gallery(args.gallery)
+    vectors = normalize(vectors)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = normalize(queries + args.noise * rng.standard_normal(queries.shape).astype(np.float32))
+
+    for row in accuracy_report(vectors, labels, queries, rerank=args.rerank):
+        print(f"{row['precision']:>7}  {row['bytes_per_embedding']:6.0f} B/emb  "
+              f"{row['mib_per_million']:7.0f} MiB per 1M  coarse recall@1={row['coarse_recall']:.4f}  "
+              f"recall@1={row['recall']:.4f}  max dist err={row['max_dist_error']:.2e}  "
+              f"{row['ms_per_query']:.3f} ms/query")
@@ -0,0 +1,198 @@
+import itertools
+
+import cv2
+import numpy as np
+
+from embedding_cache import TrackEmbeddingCache
+
+
+def iou(box, boxes):
+    """
+    IoU between one box and an (N, 4) array of boxes.
+    """
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-6)
+
+
+class Track:
+    def __init__(self, track_id, box, prob):
+        self.id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.prob = float(prob)
+        self.misses = 0
+        self.confidence = 1.0
+
+
+class FaceTracker:
+    """
+    Runs full MTCNN detection only every `detect_every` frames (or when optical
+    flow loses a face) and propagates boxes with pyramidal Lucas-Kanade in between.
+
+    Embeddings and identities are kept per track in a TrackEmbeddingCache, so
+    ResNet only runs for new tracks, on the cache's refresh schedule, or when
+    a face's appearance changes.
+    """
+
+    def __init__(self, detector, face_manager, detect_every=10, min_prob=0.9,
+                 iou_threshold=0.3, max_misses=2, min_flow_confidence=0.5, cache=None, adaptive=None):
+        """
+        :param adaptive: this stream's AdaptiveDetection policy, passed to every detect() call.
+        """
+        self.detector = detector
+        self.face_manager = face_manager
+        self.detect_every = detect_every
+        self.min_prob = min_prob
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.min_flow_confidence = min_flow_confidence
+        self.adaptive = adaptive
+
+        self.tracks = []
+        self._ids = itertools.count()
+        self._prev_gray = None
+        self._since_detection = 0
+        self.cache = cache or TrackEmbeddingCache(detector, face_manager)
+
+        # Counters for reporting how much work tracking saves
+        self.frames = 0
+        self.detections = 0
+
+    def reset(self):
+        self.tracks = []
+        self._prev_gray = None
+        self._since_detection = 0
+
+    # ---------- detection ----------
+
+    def _detect(self, frame, frame_rgb):
+        # With adaptive detection this scans only around current tracks, plus periodic full scans
+        rois = np.stack([t.box for t in self.tracks]) if self.tracks else None
+        result = self.detector.detect(frame, frame_rgb=frame_rgb, rois=rois, adaptive=self.adaptive)
+        if result is None:
+            # Shed by a shared inference service: keep the propagated tracks and retry next frame
+            return
+        self.detections += 1
+        self._since_detection = 0
+        boxes, probs = result
+        if boxes is None:
+            boxes, probs = np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32)
+        keep = np.asarray(probs, dtype=np.float32) >= self.min_prob
+        boxes, probs = np.asarray(boxes)[keep], np.asarray(probs)[keep]
+
+        # Greedy IoU association, best-overlapping pairs first
+        unmatched = set(range(len(boxes)))
+        matched_tracks = set()
+        if len(boxes) and self.tracks:
+            overlaps = np.stack([iou(t.box, boxes) for t in self.tracks])
+            for flat in np.argsort(-overlaps, axis=None):
+                ti, di = np.unravel_index(flat, overlaps.shape)
+                if overlaps[ti, di] < self.iou_threshold:
+                    break
+                if ti in matched_tracks or di not in unmatched:
+                    continue
+                track = self.tracks[ti]
+                track.box = boxes[di].astype(np.float32)
+                track.prob = float(probs[di])
+                track.misses = 0
+                track.confidence = 1.0
+                matched_tracks.add(ti)
+                unmatched.discard(di)
+
+        survivors = []
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    continue
+            survivors.append(track)
+        self.tracks = survivors
+
+        for i in sorted(unmatched):
+            self.tracks.append(Track(next(self._ids), boxes[i], probs[i]))
+
+    # ---------- propagation ----------
+
+    def _propagate(self, gray):
+        """
+        Moves every track by the median optical-flow displacement of corners inside it.
+        :return: False if any track lost too many points and detection should run.
+        """
+        h, w = gray.shape
+        points, owners = [], []
+        for i, track in enumerate(self.tracks):
+            x1, y1, x2, y2 = [int(v) for v in track.box]
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(w, x2), min(h, y2)
+            if x2 - x1 < 8 or y2 - y1 < 8:
+                return False
+            corners = cv2.goodFeaturesToTrack(self._prev_gray[y1:y2, x1:x2], 20, 0.01, 5)
+            if corners is None or len(corners) < 3:
+                return False
+            corners = corners.reshape(-1, 2) + (x1, y1)
+            points.append(corners)
+            owners.extend([i] * len(corners))
+
+        if not points:
+            return True
+
+        prev_pts = np.concatenate(points).astype(np.float32).reshape(-1, 1, 2)
+        next_pts, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, prev_pts, None,
+                                                       winSize=(15, 15), maxLevel=2)
+        status = status.ravel().astype(bool)
+        owners = np.asarray(owners)
+        moves = (next_pts - prev_pts).reshape(-1, 2)
+
+        ok = True
+        for i, track in enumerate(self.tracks):
+            mine = owners == i
+            good = mine & status
+            track.confidence = good.sum() / max(1, mine.sum())
+            if track.confidence < self.min_flow_confidence:
+                ok = False
+                continue
+            dx, dy = np.median(moves[good], axis=0)
+            track.box = track.box + np.array([dx, dy, dx, dy], dtype=np.float32)
+        return ok
+
+    # ---------- public API ----------
+
+    def update(self, frame):
+        """
+        :param frame: numpy array (B, G, R)
+        :return: list of live Track objects
+        """
+        self.frames += 1
+        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        self._since_detection += 1
+        need_detection = (self._prev_gray is None or not self.tracks
+                          or self._since_detection >= self.detect_every)
+        if not need_detection:
+            need_detection = not self._propagate(gray)
+        if need_detection:
+            self._detect(frame, frame_rgb)
+
+        self._prev_gray = gray
+        self.cache.refresh(frame, frame_rgb, self.tracks)
+        return self.tracks
+
+    def process(self, frame, threshold):
+        """
+        Same outputs as detect_and_embed + match_faces, served from tracks.
+        :return: boxes, probs, embeddings, [(name, dist), ...]
+        """
+        # Tracks whose crop could not be embedded yet are left out
+        tracks = [t for t in self.update(frame) if self.cache.embedding(t.id) is not None]
+        if not tracks:
+            return None, None, None, []
+        boxes = np.stack([t.box for t in tracks])
+        probs = np.array([t.prob for t in tracks], dtype=np.float32)
+        embeddings = np.stack([self.cache.embedding(t.id) for t in tracks])
+        return boxes, probs, embeddings, [self.cache.label(t.id, threshold) for t in tracks]
@@ -1,8 +1,14 @@
 import cv2
-from src.camera import Camera
-from src.detector import FaceDetector
+import os
+import sys
 import time
 
+# src modules import each other by bare name (as under `streamlit run src/main.py`)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+from camera import Camera
+from detector import FaceDetector
+
 def main():
     print("Initializing Camera...")
     cam = Camera(source=0)
@@ -13,10 +19,16 @@ def main():
 
     print("Starting Main Loop. Press 'q' to quit.")
     start_time = time.time()
+    last_seq = 0
     try:
         while True:
-            frame = cam.get_frame()
-            if frame is not None:
+            # Wait for a frame newer than the last one instead of polling
+            lease = cam.wait_for_frame(last_seq, timeout=0.1)
+            if lease is not None:
+                last_seq = lease.seq
+                with lease:
+                    frame = lease.image.copy()
+
                 # Detect faces
                 boxes, probs = detector.detect(frame)
                 
@@ -32,8 +44,6 @@ def main():
             if time.time() - start_time > 5:
                 print("Test completed successfully (ran for 5 seconds).")
                 break
-            
-            time.sleep(0.01)
 
     except KeyboardInterrupt:
         print("Interrupted by user.")
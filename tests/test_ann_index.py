@@ -0,0 +1,60 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from ann_index import IVFIndex, exact_search, synthetic_gallery
+
+
+def grown_index(n, **kwargs):
+    rng = np.random.default_rng(1)
+    vectors, labels = synthetic_gallery(n, dim=64, seed=3)
+    order = rng.permutation(len(vectors))
+    vectors, labels = vectors[order], labels[order]
+
+    index = IVFIndex(min_train_size=256, nprobe=4, **kwargs)
+    for vector, label in zip(vectors, labels):
+        index.add(vector, label)
+
+    queries = vectors[rng.choice(len(vectors), 200, replace=False)]
+    queries = queries + 0.03 * rng.standard_normal(queries.shape).astype(np.float32)
+    truth, _ = exact_search(queries, vectors, labels)
+    return index, queries, truth
+
+
+def test_index_retrains_as_gallery_grows():
+    index, queries, truth = grown_index(8000)
+
+    # Trained at 256, then retrained at every doubling up to 4096
+    assert index.retrains == 4
+    assert index.trained_size == 4096
+    assert len(index._state[0]) == int(np.sqrt(4096))
+    assert index.size == 8000
+
+    found, _ = index.search(queries)
+    assert np.mean(found == truth) >= 0.95
+
+
+def test_retrain_can_be_disabled():
+    index, _, _ = grown_index(2000, retrain_growth=None)
+
+    assert index.retrains == 0
+    assert index.trained_size == 256
+    assert len(index._state[0]) == int(np.sqrt(256))
+
+
+def test_snapshot_is_unaffected_by_later_retrains():
+    index, queries, _ = grown_index(600)
+    snapshot = index.snapshot()
+    before = index.search(queries, snapshot=snapshot)
+
+    vectors, labels = synthetic_gallery(2000, dim=64, seed=4)
+    for vector, label in zip(vectors, labels + 10000):
+        index.add(vector, label)
+    assert index.retrains >= 1
+
+    after = index.search(queries, snapshot=snapshot)
+    assert np.array_equal(before[0], after[0])
+    assert np.allclose(before[1], after[1])
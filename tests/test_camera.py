@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from camera import Camera
+
+FRAMES = 30
+
+
+def frame_index(image):
+    # Each frame of the clip is one flat grey level that encodes its position
+    return int(round(float(image.mean()) / 8))
+
+
+def write_clip(path, fps=30):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), fps, (64, 48))
+    for i in range(FRAMES):
+        writer.write(np.full((48, 64, 3), i * 8, dtype=np.uint8))
+    writer.release()
+    return str(path)
+
+
+@pytest.fixture
+def clip(tmp_path):
+    return write_clip(tmp_path / "clip.avi")
+
+
+def started(camera):
+    camera.start()
+    return camera
+
+
+def test_no_drop_read_returns_every_frame_in_order(clip):
+    camera = started(Camera(clip, buffer_size=3, mode="no-drop", realtime=False))
+    try:
+        # Slower than the decoder, which has to wait for free slots instead of dropping
+        for expected in range(1, 2 * FRAMES + 1):
+            with camera.read(timeout=5.0) as lease:
+                assert lease.seq == expected
+                assert frame_index(lease.image) == (expected - 1) % FRAMES
+            if expected % 10 == 0:
+                time.sleep(0.05)
+        assert camera.dropped == 0
+    finally:
+        camera.stop()
+
+
+def test_lease_is_read_only_and_pins_its_slot(clip):
+    camera = started(Camera(clip, buffer_size=4, realtime=False))
+    try:
+        lease = camera.wait_for_frame(0, timeout=5.0)
+        assert not lease.image.flags.writeable
+        with pytest.raises(ValueError):
+            lease.image[0, 0] = 0
+        before = lease.image.copy()
+
+        # The decoder cycles through the other slots many times over
+        newer = camera.wait_for_frame(lease.seq + 3 * camera.buffer_size, timeout=5.0)
+        newer.release()
+        assert np.array_equal(lease.image, before)
+        assert camera._leases[lease.slot] == 1
+
+        lease.release()
+        lease.release()
+        assert camera._leases[lease.slot] == 0
+    finally:
+        camera.stop()
+
+
+def test_wait_for_frame_blocks_until_a_newer_frame(tmp_path):
+    # Two frames per second, paced like a live camera
+    camera = started(Camera(write_clip(tmp_path / "slow.avi", fps=2)))
+    try:
+        first = camera.wait_for_frame(0, timeout=5.0)
+        first.release()
+        assert first.seq == 1
+        assert camera.wait_for_frame(first.seq, timeout=0.05) is None
+
+        with camera.wait_for_frame(first.seq, timeout=5.0) as second:
+            assert second.seq == first.seq + 1
+            assert frame_index(second.image) == 1
+    finally:
+        camera.stop()
+    assert camera.wait_for_frame(second.seq, timeout=5.0) is None
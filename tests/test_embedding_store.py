@@ -0,0 +1,120 @@
+import multiprocessing as mp
+import os
+import pickle
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from embedding_store import EmbeddingStore
+
+DIM = 8
+
+
+def vector(value):
+    return np.full(DIM, value, dtype=np.float32)
+
+
+def _write_rows(directory, writer, count):
+    # Runs in a separate process; each embedding encodes who wrote it
+    store = EmbeddingStore(directory, dim=DIM)
+    for i in range(count):
+        store.append(f"w{writer}", vector(writer * 1000 + i))
+
+
+def test_migrates_legacy_pickle_once(tmp_path):
+    pickle_path = tmp_path / "faces.pkl"
+    with open(pickle_path, 'wb') as f:
+        pickle.dump({"alice": [vector(1), vector(2)], "bob": [vector(3)]}, f)
+
+    store = EmbeddingStore(str(tmp_path / "store"), dim=DIM)
+    assert store.migrate_from_pickle(str(pickle_path)) == 3
+    assert store.migrate_from_pickle(str(pickle_path)) == 0
+
+    reopened = EmbeddingStore(str(tmp_path / "store"), dim=DIM)
+    assert reopened.migrate_from_pickle(str(pickle_path)) == 0
+    vectors, names = reopened.load()
+    assert names == ["alice", "alice", "bob"]
+    assert np.array_equal(vectors[:, 0], [1, 2, 3])
+
+
+def test_delete_tombstones_until_compaction_renumbers(tmp_path):
+    directory = str(tmp_path / "store")
+    store = EmbeddingStore(directory, dim=DIM)
+    store.append_many([("a", vector(0)), ("b", vector(1)), ("a", vector(2)), ("c", vector(3))])
+
+    assert store.delete("a")
+    assert not store.delete("a")
+    # The rows stay in the file, masked by a tombstone
+    assert store.rows == 4 and store.dead_rows == 2
+    vectors, names = store.load()
+    assert names == ["b", "c"]
+    assert np.array_equal(vectors[:, 0], [1, 3])
+
+    reopened = EmbeddingStore(directory, dim=DIM)
+    assert reopened.live == {"b": [1], "c": [3]}
+    assert reopened.dead_rows == 2
+
+    store.compact()
+    assert store.meta["generation"] == 1
+    assert store.rows == 2 and store.dead_rows == 0
+    assert store.live == {"b": [0], "c": [1]}
+    assert np.array_equal(np.asarray(store.matrix())[:, 0], [1, 3])
+    assert not os.path.exists(os.path.join(directory, "embeddings.0.f32"))
+    assert not os.path.exists(os.path.join(directory, "log.0.jsonl"))
+
+
+def test_reload_round_trip(tmp_path):
+    directory = str(tmp_path / "store")
+    store = EmbeddingStore(directory, dim=DIM)
+    items = [(name, np.random.default_rng(i).standard_normal(DIM).astype(np.float32))
+             for i, name in enumerate(["a", "b", "a", "민수"])]
+    assert store.append_many(items) == 0
+    assert store.append_many([("c", vector(9))]) == 4
+
+    reopened = EmbeddingStore(directory, dim=DIM)
+    vectors, names = reopened.load()
+    assert names == ["a", "b", "a", "민수", "c"]
+    assert np.array_equal(vectors, np.stack([e for _, e in items] + [vector(9)]))
+
+
+def test_refresh_picks_up_another_writer(tmp_path):
+    directory = str(tmp_path / "store")
+    first = EmbeddingStore(directory, dim=DIM)
+    second = EmbeddingStore(directory, dim=DIM)
+
+    first.append_many([("a", vector(1)), ("b", vector(2))])
+    assert second.refresh()
+    assert not second.refresh()
+    assert second.live == {"a": [0], "b": [1]}
+
+    # Rows continue after the other writer's instead of overwriting them
+    assert second.append_many([("c", vector(3))]) == 2
+    first.delete("a")
+    first.compact()
+    assert second.refresh()
+    assert second.live == {"b": [0], "c": [1]}
+
+
+def test_two_processes_append_concurrently(tmp_path):
+    directory = str(tmp_path / "store")
+    EmbeddingStore(directory, dim=DIM)
+    ctx = mp.get_context("spawn")
+    processes = [ctx.Process(target=_write_rows, args=(directory, writer, 50)) for writer in (1, 2)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    store = EmbeddingStore(directory, dim=DIM)
+    vectors, names = store.load()
+    assert store.rows == 100
+    assert sorted(len(rows) for rows in store.live.values()) == [50, 50]
+    # Every row still holds the embedding its log line names
+    for vec, name in zip(vectors, names):
+        assert int(vec[0]) // 1000 == int(name[1:])
+    for writer in (1, 2):
+        written = sorted(int(vec[0]) % 1000 for vec, name in zip(vectors, names) if name == f"w{writer}")
+        assert written == list(range(50))
@@ -0,0 +1,204 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from inference_service import InferenceService
+
+
+def run_batch(frames, min_probs, adaptive=None, streams=None):
+    return [(np.zeros((1, 4)), np.ones(1), np.zeros((1, 512))) for _ in frames]
+
+
+def make_service(**kwargs):
+    service = InferenceService(run_batch, **kwargs)
+    service.start()
+    return service
+
+
+def test_idle_session_resumes_on_submit():
+    service = make_service(idle_timeout=0.05)
+    try:
+        session = service.open_session()
+        assert session.submit(np.zeros((4, 4, 3), np.uint8), timeout=1.0) is not None
+
+        time.sleep(0.1)
+        with service.cond:
+            service._expire_idle()
+        assert service.stats()["sessions"] == 0
+
+        # The next frame re-admits the session instead of failing forever
+        assert session.submit(np.zeros((4, 4, 3), np.uint8), timeout=1.0) is not None
+        assert service.stats()["sessions"] == 1
+    finally:
+        service.stop()
+
+
+def test_heartbeat_keeps_session_alive():
+    service = make_service(idle_timeout=0.2)
+    try:
+        session = service.open_session()
+        for _ in range(5):
+            time.sleep(0.06)
+            session.heartbeat()
+            with service.cond:
+                service._expire_idle()
+        assert service.stats()["sessions"] == 1
+    finally:
+        service.stop()
+
+
+def test_resume_respects_capacity_and_close():
+    service = make_service(max_sessions=1, idle_timeout=0.05)
+    try:
+        first = service.open_session()
+        time.sleep(0.1)
+        second = service.open_session()       # expires `first` and takes its place
+        assert second is not None
+        assert first.submit(np.zeros((4, 4, 3), np.uint8), timeout=0.5) is None
+
+        second.close()
+        assert second.submit(np.zeros((4, 4, 3), np.uint8), timeout=0.5) is None
+        assert first.submit(np.zeros((4, 4, 3), np.uint8), timeout=1.0) is not None
+    finally:
+        service.stop()
+
+
+def test_session_detector_runs_through_the_service():
+    from inference_service import SessionDetector
+
+    threads = []
+
+    def run_detect(frames, rois, adaptive, streams):
+        import threading
+        threads.append(threading.current_thread().name)
+        return [(np.zeros((1, 4)), np.ones(1)) for _ in frames]
+
+    service = make_service(run_detect=run_detect)
+    try:
+        session = service.open_session()
+        detector = SessionDetector(session, object())
+        boxes, probs = detector.detect(np.zeros((4, 4, 3), np.uint8))
+        assert len(boxes) == 1
+        assert threads and threads[0] != "MainThread"
+        assert service.stats()["per_session"][0]["processed"] == 1
+
+        session.close()
+        assert detector.detect(np.zeros((4, 4, 3), np.uint8)) is None
+    finally:
+        service.stop()
+
+
+def test_window_batches_tracker_requests_by_policy():
+    import threading
+    from inference_service import SessionDetector
+
+    calls = []
+
+    def run_detect(frames, rois, adaptive, streams):
+        calls.append((len(frames), adaptive, sorted(streams)))
+        return [(np.zeros((1, 4)), np.ones(1)) for _ in frames]
+
+    service = make_service(run_detect=run_detect, window_ms=300)
+    try:
+        sessions = [service.open_session() for _ in range(3)]
+        policy = object()
+        detectors = [SessionDetector(s, object()) for s in sessions]
+        threads = [threading.Thread(target=d.detect, args=(np.zeros((4, 4, 3), np.uint8),),
+                                    kwargs={"adaptive": policy if i == 2 else None})
+                   for i, d in enumerate(detectors)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Sessions without a policy share one call; the one with its own policy runs apart
+        assert (2, None, [sessions[0].id, sessions[1].id]) in calls
+        assert (1, policy, [sessions[2].id]) in calls
+    finally:
+        service.stop()
+
+
+def test_close_and_expiry_notify_on_close():
+    closed = []
+    service = make_service(idle_timeout=0.05, on_close=closed.append)
+    try:
+        first = service.open_session()
+        second = service.open_session()
+        first.close()
+        time.sleep(0.1)
+        with service.cond:
+            service._expire_idle()
+        assert closed == [first.id, second.id]
+    finally:
+        service.stop()
+
+
+def test_window_batches_frames_from_several_sessions():
+    import threading
+
+    sizes = []
+
+    def record(frames, min_probs, adaptive, streams):
+        sizes.append(len(frames))
+        return run_batch(frames, min_probs)
+
+    service = InferenceService(record, window_ms=200)
+    service.start()
+    try:
+        sessions = [service.open_session() for _ in range(3)]
+        threads = [threading.Thread(target=s.submit, args=(np.zeros((4, 4, 3), np.uint8),),
+                                    kwargs={"timeout": 2.0}) for s in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert max(sizes) > 1
+    finally:
+        service.stop()
+
+
+def test_process_pool_sessions_keep_their_stream():
+    from inference_service import SessionDetector
+
+    class Pool:
+        num_workers = 2
+
+        def __init__(self):
+            self.calls = []
+            self.released = []
+
+        def submit(self, frame, min_prob=0.0, adaptive=None, stream_id=None):
+            self.calls.append(("submit", stream_id))
+            return None, None, None
+
+        def detect(self, frame, rois=None, adaptive=None, stream_id=None):
+            self.calls.append(("detect", stream_id))
+            return np.zeros((1, 4)), np.ones(1)
+
+        def get_embeddings(self, frame, boxes, stream_id=None):
+            self.calls.append(("embed", stream_id))
+            return np.zeros((len(boxes), 512))
+
+        def release_stream(self, stream_id):
+            self.released.append(stream_id)
+
+    pool = Pool()
+    service = InferenceService.from_process_pool(pool)
+    service.start()
+    try:
+        session = service.open_session()
+        frame = np.zeros((4, 4, 3), np.uint8)
+        session.submit(frame, timeout=1.0)
+        detector = SessionDetector(session, object())
+        boxes, _ = detector.detect(frame)
+        assert detector.get_embeddings(frame, boxes).shape == (1, 512)
+        assert pool.calls == [("submit", session.id), ("detect", session.id), ("embed", session.id)]
+
+        session.close()
+        assert pool.released == [session.id]
+    finally:
+        service.stop()
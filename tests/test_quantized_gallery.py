@@ -0,0 +1,115 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from ann_index import exact_search, synthetic_gallery
+from face_manager import FaceManager
+from quantized_gallery import QuantizedGallery
+
+
+def noisy_queries(vectors, n=100, seed=5):
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), n, replace=False)]
+    return queries + 0.02 * rng.standard_normal(queries.shape).astype(np.float32)
+
+
+def make_manager(tmp_path, precision, **kwargs):
+    return FaceManager(storage_file=str(tmp_path / "faces.pkl"), precision=precision, **kwargs)
+
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_rerank_reports_exact_distances(precision):
+    vectors, labels = synthetic_gallery(500, dim=64, seed=2)
+    gallery = QuantizedGallery(dim=64, precision=precision)
+    gallery.build(vectors, np.arange(len(vectors)), labels)
+
+    queries = noisy_queries(vectors)
+    found, dists = gallery.search(queries, vectors)
+    truth, truth_dists = exact_search(queries, vectors, labels)
+
+    assert np.array_equal(found, truth)
+    # Distances come from the float32 source, not the compact codes
+    assert np.allclose(dists, truth_dists, atol=1e-5)
+
+
+def test_add_and_remove_leave_snapshots_valid():
+    vectors, labels = synthetic_gallery(100, dim=64, seed=3)
+    gallery = QuantizedGallery(dim=64, precision="int8")
+    gallery.add_many(vectors[:10], labels[:10], np.arange(10))
+    before = gallery.snapshot()
+
+    # Growing past the initial capacity and removing a label both build new arrays
+    gallery.add_many(vectors[10:], labels[10:], np.arange(10, 100))
+    gallery.remove(labels[0])
+    assert len(before[2]) == 10 and np.array_equal(before[2], labels[:10])
+    assert len(gallery) == 100 - int((labels == labels[0]).sum())
+
+    found, _ = gallery.search(vectors, vectors)
+    assert labels[0] not in found
+    found, _ = gallery.search(vectors[:10], vectors, snapshot=before)
+    assert np.array_equal(found, labels[:10])
+
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_compact_manager_matches_float32(tmp_path, precision):
+    vectors, labels = synthetic_gallery(200, seed=4)
+    items = [(f"p{label}", vector) for vector, label in zip(vectors, labels)]
+    exact = make_manager(tmp_path / "exact", "float32")
+    compact = make_manager(tmp_path / "compact", precision)
+    exact.add_faces(items)
+    compact.add_faces(items[:150])
+    for item in items[150:]:
+        compact.add_face(*item)
+
+    queries = noisy_queries(vectors)
+    expected = exact.match_faces(queries)
+    matched = compact.match_faces(queries)
+    assert [name for name, _ in matched] == [name for name, _ in expected]
+    assert np.allclose([d for _, d in matched], [d for _, d in expected], atol=1e-5)
+
+    assert compact.delete_face("p0")
+    assert all(name != "p0" for name, _ in compact.match_faces(vectors))
+    assert compact.identities() == {name: n for name, n in exact.identities().items() if name != "p0"}
+
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_store_faces_view_reads_exact_embeddings(tmp_path, precision):
+    vectors, labels = synthetic_gallery(20, seed=6)
+    manager = make_manager(tmp_path, precision)
+    manager.add_faces([(f"p{label}", vector) for vector, label in zip(vectors, labels)])
+
+    faces = manager.faces
+    assert len(faces) == 4 and "p1" in faces and "p9" not in faces
+    assert sorted(faces) == ["p0", "p1", "p2", "p3"]
+    assert faces["p1"][0].dtype == np.float32
+    assert np.array_equal(np.stack(faces["p1"]), vectors[labels == 1])
+
+    manager.delete_face("p1")
+    assert "p1" not in manager.faces and len(manager.faces) == 3
+
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_compaction_rebuilds_row_numbers(tmp_path, precision):
+    vectors, labels = synthetic_gallery(100, seed=7)
+    manager = make_manager(tmp_path, precision)
+    manager.add_faces([(f"p{label}", vector) for vector, label in zip(vectors, labels)])
+    # Compact on the first delete, so every later row moves
+    manager.store.compact_min_dead = 1
+    manager.store.compact_ratio = 0.0
+
+    assert manager.delete_face("p0")
+    assert manager.store.meta["generation"] == 1
+    assert np.array_equal(np.stack(manager.faces["p5"]), vectors[labels == 5])
+    matched = manager.match_faces(vectors[5:])
+    assert [name for name, _ in matched] == [f"p{label}" for label in labels[5:]]
+    assert np.allclose([d for _, d in matched], 0.0, atol=1e-3)
+
+    manager.delete_face("p1")
+    manager.save_faces()
+    assert manager.store.dead_rows == 0
+    assert np.array_equal(np.stack(manager.faces["p19"]), vectors[labels == 19])
+    assert manager.match_face(vectors[-1])[0] == f"p{labels[-1]}"